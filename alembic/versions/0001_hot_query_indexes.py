@@ -0,0 +1,69 @@
+"""secondary indexes for the hot loan, schedule and payment queries
+
+Revision ID: 0001_hot_query_indexes
+Revises:
+Create Date: 2026-10-18 09:00:00
+
+Tables themselves are still created by Base.metadata.create_all on startup,
+which also creates these indexes on a fresh database; this revision adds them
+to databases created before the indexes existed.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0001_hot_query_indexes"
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+UNPAID = sa.text("status <> 'PAID'")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index("ix_users_created_at_id", "users", ["created_at", "id"], if_not_exists=True)
+    
+    op.create_index("ix_loan_applications_created_at_id", "loan_applications", ["created_at", "id"], if_not_exists=True)
+    op.create_index(
+        "ix_loan_applications_applicant_id_created_at_id", "loan_applications",
+        ["applicant_id", "created_at", "id"], if_not_exists=True
+    )
+    op.create_index("ix_loan_applications_status", "loan_applications", ["status"], if_not_exists=True)
+    
+    op.create_index("ix_loans_borrower_id", "loans", ["borrower_id"], if_not_exists=True)
+    op.create_index("ix_loans_status", "loans", ["status"], if_not_exists=True)
+    
+    # fails if a loan already has duplicate installment numbers; fix those rows first
+    op.create_index(
+        "ix_repayment_schedules_loan_id_installment_number", "repayment_schedules",
+        ["loan_id", "installment_number"], unique=True, if_not_exists=True
+    )
+    op.create_index(
+        "ix_repayment_schedules_status_due_date", "repayment_schedules",
+        ["status", "due_date"], if_not_exists=True
+    )
+    op.create_index(
+        "ix_repayment_schedules_unpaid_due_date", "repayment_schedules", ["due_date"],
+        postgresql_where=UNPAID, sqlite_where=UNPAID, if_not_exists=True
+    )
+    
+    op.create_index("ix_payments_loan_id", "payments", ["loan_id"], if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_payments_loan_id", table_name="payments", if_exists=True)
+    op.drop_index("ix_repayment_schedules_unpaid_due_date", table_name="repayment_schedules", if_exists=True)
+    op.drop_index("ix_repayment_schedules_status_due_date", table_name="repayment_schedules", if_exists=True)
+    op.drop_index("ix_repayment_schedules_loan_id_installment_number", table_name="repayment_schedules", if_exists=True)
+    op.drop_index("ix_loans_status", table_name="loans", if_exists=True)
+    op.drop_index("ix_loans_borrower_id", table_name="loans", if_exists=True)
+    op.drop_index("ix_loan_applications_status", table_name="loan_applications", if_exists=True)
+    op.drop_index("ix_loan_applications_applicant_id_created_at_id", table_name="loan_applications", if_exists=True)
+    op.drop_index("ix_loan_applications_created_at_id", table_name="loan_applications", if_exists=True)
+    op.drop_index("ix_users_created_at_id", table_name="users", if_exists=True)
@@ -0,0 +1,115 @@
+"""running loan totals and installment link on the payments ledger
+
+Applications approved before this revision have no loans row, and their schedules
+and payments carry the application id as loan_id. A loan is created for each of
+them and their rows are re-keyed to it; downgrade leaves those loans in place.
+
+Revision ID: 0002_loan_payment_ledger
+Revises: 0001_hot_query_indexes
+Create Date: 2026-10-18 10:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002_loan_payment_ledger"
+down_revision: Union[str, Sequence[str], None] = "0001_hot_query_indexes"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# application statuses that never had a schedule
+UNAPPROVED_STATUSES = ("PENDING", "UNDER_REVIEW", "REJECTED")
+
+
+def _create_missing_loans(connection) -> None:
+    """Create the loans of applications approved before loans rows existed and re-key their rows"""
+    application_ids = connection.execute(sa.text(
+        "SELECT id FROM loan_applications WHERE status NOT IN :unapproved "
+        "AND id NOT IN (SELECT application_id FROM loans)"
+    ).bindparams(sa.bindparam("unapproved", UNAPPROVED_STATUSES, expanding=True))).scalars().all()
+    if not application_ids:
+        return
+    ids = sa.bindparam("ids", application_ids, expanding=True)
+    
+    # a schedule keyed by an id that is both an existing loan and a loan-less application
+    # could belong to either one, so stop rather than guess
+    ambiguous = connection.execute(sa.text(
+        "SELECT DISTINCT loan_id FROM repayment_schedules "
+        "WHERE loan_id IN :ids AND loan_id IN (SELECT id FROM loans)"
+    ).bindparams(ids)).scalars().all()
+    if ambiguous:
+        raise RuntimeError(
+            "repayment_schedules.loan_id values %s match both a loan and an approved application without "
+            "a loan; re-key these schedules by hand before upgrading" % sorted(ambiguous)
+        )
+    
+    # rows to re-key, captured by primary key before new loan ids can collide with application ids
+    rows = {
+        table: connection.execute(
+            sa.text(f"SELECT id, loan_id FROM {table} WHERE loan_id IN :ids").bindparams(ids)
+        ).all()
+        for table in ("repayment_schedules", "payments")
+    }
+    # approval time as start date; payment, totals and end date from the existing schedule
+    # (outstanding_balance is recomputed by the backfill in upgrade)
+    connection.execute(sa.text(
+        "INSERT INTO loans (application_id, borrower_id, loan_type, principal_amount, interest_rate, "
+        "loan_term_months, monthly_payment, status, outstanding_balance, disbursement_date, start_date, end_date) "
+        "SELECT a.id, a.applicant_id, a.loan_type, a.loan_amount, a.interest_rate, a.loan_term_months, "
+        "COALESCE(s.monthly_payment, 0), 'DISBURSED', COALESCE(s.total_due, a.loan_amount), "
+        "COALESCE(a.updated_at, a.created_at), COALESCE(a.updated_at, a.created_at), s.end_date "
+        "FROM loan_applications a LEFT JOIN ("
+        "SELECT loan_id, MIN(amount_due) AS monthly_payment, SUM(amount_due) AS total_due, MAX(due_date) AS end_date "
+        "FROM repayment_schedules WHERE loan_id IN :ids GROUP BY loan_id"
+        ") s ON s.loan_id = a.id WHERE a.id IN :ids ORDER BY a.id"
+    ).bindparams(ids))
+    new_ids = dict(connection.execute(
+        sa.text("SELECT application_id, id FROM loans WHERE application_id IN :ids").bindparams(ids)
+    ).all())
+    for name, table_rows in rows.items():
+        if table_rows:
+            table = sa.table(name, sa.column("id", sa.Integer), sa.column("loan_id", sa.Integer))
+            connection.execute(
+                table.update().where(table.c.id == sa.bindparam("b_id")).values(loan_id=sa.bindparam("b_loan_id")),
+                [{"b_id": row.id, "b_loan_id": new_ids[row.loan_id]} for row in table_rows]
+            )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table("loans") as batch_op:
+        batch_op.add_column(sa.Column("total_paid", sa.Float(), nullable=False, server_default="0"))
+    
+    with op.batch_alter_table("payments") as batch_op:
+        batch_op.add_column(sa.Column("schedule_id", sa.Integer(), nullable=True))
+        batch_op.create_foreign_key(
+            "fk_payments_schedule_id_repayment_schedules", "repayment_schedules", ["schedule_id"], ["id"]
+        )
+    
+    _create_missing_loans(op.get_bind())
+    
+    # bring existing loans in line with their schedules (python -m app.jobs.reconcile_balances --fix does the same)
+    op.execute(
+        """
+        UPDATE loans SET
+            total_paid = COALESCE((SELECT SUM(amount_paid) FROM repayment_schedules WHERE loan_id = loans.id), 0),
+            outstanding_balance = COALESCE(
+                (SELECT SUM(amount_due) - SUM(amount_paid) FROM repayment_schedules WHERE loan_id = loans.id),
+                outstanding_balance
+            )
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table("payments") as batch_op:
+        batch_op.drop_constraint("fk_payments_schedule_id_repayment_schedules", type_="foreignkey")
+        batch_op.drop_column("schedule_id")
+    
+    with op.batch_alter_table("loans") as batch_op:
+        batch_op.drop_column("total_paid")
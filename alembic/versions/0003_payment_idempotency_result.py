@@ -0,0 +1,31 @@
+"""stored result of each payment for idempotent replays
+
+Revision ID: 0003_payment_idempotency_result
+Revises: 0002_loan_payment_ledger
+Create Date: 2026-10-18 12:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003_payment_idempotency_result"
+down_revision: Union[str, Sequence[str], None] = "0002_loan_payment_ledger"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # lookups by transaction_reference use the index behind its unique constraint
+    with op.batch_alter_table("payments") as batch_op:
+        batch_op.add_column(sa.Column("idempotency_result", sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table("payments") as batch_op:
+        batch_op.drop_column("idempotency_result")
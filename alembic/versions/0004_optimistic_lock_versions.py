@@ -0,0 +1,32 @@
+"""version columns for optimistic locking of installments and applications
+
+Revision ID: 0004_optimistic_lock_versions
+Revises: 0003_payment_idempotency_result
+Create Date: 2026-10-18 14:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004_optimistic_lock_versions"
+down_revision: Union[str, Sequence[str], None] = "0003_payment_idempotency_result"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table in ("repayment_schedules", "loan_applications"):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column("version", sa.Integer(), nullable=False, server_default="1"))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in ("loan_applications", "repayment_schedules"):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column("version")
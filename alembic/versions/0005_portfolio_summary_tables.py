@@ -0,0 +1,57 @@
+"""portfolio analytics summary tables
+
+Revision ID: 0005_portfolio_summary_tables
+Revises: 0004_optimistic_lock_versions
+Create Date: 2026-10-18 16:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0005_portfolio_summary_tables"
+down_revision: Union[str, Sequence[str], None] = "0004_optimistic_lock_versions"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# same names as the enums on loans / loan_applications
+LOAN_TYPES = ("PERSONAL", "MORTGAGE", "AUTO", "STUDENT", "BUSINESS", "EDUCATION")
+LOAN_STATUSES = ("PENDING", "APPROVED", "REJECTED", "DISBURSED", "CLOSED", "UNDER_REVIEW", "DEFAULTED", "PAID_OFF", "ACTIVE")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "portfolio_loan_type_totals",
+        sa.Column("loan_type", sa.Enum(*LOAN_TYPES, name="loantype", create_type=False), primary_key=True),
+        sa.Column("loan_count", sa.Integer(), nullable=False),
+        sa.Column("principal_amount", sa.Float(), nullable=False),
+        sa.Column("outstanding_balance", sa.Float(), nullable=False),
+        sa.Column("overdue_amount", sa.Float(), nullable=False),
+        if_not_exists=True,
+    )
+    op.create_table(
+        "portfolio_status_counts",
+        sa.Column("status", sa.Enum(*LOAN_STATUSES, name="loanstatus", create_type=False), primary_key=True),
+        sa.Column("application_count", sa.Integer(), nullable=False),
+        sa.Column("loan_count", sa.Integer(), nullable=False),
+        if_not_exists=True,
+    )
+    op.create_table(
+        "portfolio_cash_flow",
+        sa.Column("month", sa.String(length=7), primary_key=True),
+        sa.Column("amount_due", sa.Float(), nullable=False),
+        sa.Column("amount_paid", sa.Float(), nullable=False),
+        if_not_exists=True,
+    )
+    # existing data is summarised by: python -m app.jobs.rebuild_analytics
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("portfolio_cash_flow")
+    op.drop_table("portfolio_status_counts")
+    op.drop_table("portfolio_loan_type_totals")
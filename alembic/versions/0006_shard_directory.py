@@ -0,0 +1,42 @@
+"""shard directory tables
+
+Revision ID: 0006_shard_directory
+Revises: 0005_portfolio_summary_tables
+Create Date: 2026-10-18 20:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0006_shard_directory"
+down_revision: Union[str, Sequence[str], None] = "0005_portfolio_summary_tables"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "shard_buckets",
+        sa.Column("bucket", sa.Integer(), primary_key=True, autoincrement=False),
+        sa.Column("shard_id", sa.String(length=64), nullable=False),
+        sa.Column("moving", sa.Boolean(), nullable=False, server_default=sa.false()),
+        if_not_exists=True,
+    )
+    op.create_table(
+        "shard_id_blocks",
+        sa.Column("table_name", sa.String(length=64), primary_key=True),
+        sa.Column("next_id", sa.Integer(), nullable=False),
+        if_not_exists=True,
+    )
+    # both stay empty until SHARD_URLS is set; the shard map is written on first use
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("shard_id_blocks")
+    op.drop_table("shard_buckets")
@@ -0,0 +1,28 @@
+# analytics API endpoints - portfolio figures read from the summary tables
+from typing import Optional
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_read_db, get_async_shard_dbs
+from app.schemas.analytics import PortfolioSummary
+from app.services.analytics_service import AnalyticsService
+from app.utils.query_counter import query_budget
+
+router = APIRouter(prefix="/analytics", tags=["analytics"])
+
+
+@router.get("/portfolio", response_model=PortfolioSummary, dependencies=[query_budget(3)])
+async def get_portfolio_summary(
+    from_month: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}$"),
+    to_month: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}$"),
+    db: AsyncSession = Depends(get_async_read_db),
+    shard_dbs: list[AsyncSession] = Depends(get_async_shard_dbs)
+):
+    """Get outstanding totals by loan type, counts by status, monthly cash flow and delinquency rate
+    
+    ``from_month`` / ``to_month`` (YYYY-MM, inclusive) limit the cash flow months returned.
+    """
+    if shard_dbs:
+        return await AnalyticsService.get_portfolio_summary_across_shards_async(
+            shard_dbs, from_month=from_month, to_month=to_month
+        )
+    return await AnalyticsService.get_portfolio_summary_async(db=db, from_month=from_month, to_month=to_month)
@@ -1,15 +1,14 @@
 # authentication API endpoints
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from app.database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db
 from app.schemas.user import UserCreate, UserResponse
 from app.services.user_service import UserService
 from app.utils.auth import (
-    verify_password, 
+    verify_password_async, 
     create_access_token, 
-    get_current_user,
-    get_password_hash
+    get_current_user
 )
 from datetime import timedelta
 
@@ -17,18 +16,21 @@ router = APIRouter(prefix="/auth", tags=["auth"])
 
 
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-def register(user: UserCreate, db: Session = Depends(get_db)):
+async def register(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
     """Register a new user"""
-    return UserService.create_user(db=db, user=user)
+    return await UserService.create_user_async(db=db, user=user)
 
 
 @router.post("/login")
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
     """Login user and get access token"""
     # Get user by username
-    user = UserService.get_user_by_username(db=db, username=form_data.username)
+    user = await UserService.get_user_by_username_async(db=db, username=form_data.username)
+    # give the connection back to the pool before the slow hash check
+    await db.close()
     
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    # argon2 runs on the password hashing pool, not on the request threadpool
+    if not user or not await verify_password_async(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -67,21 +69,16 @@ def get_current_user_info(current_user = Depends(get_current_user)):
 
 
 @router.post("/change-password")
-def change_password(
+async def change_password(
     old_password: str,
     new_password: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user)
 ):
     """Change user password"""
-    if not verify_password(old_password, current_user.hashed_password):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Incorrect old password"
-        )
-    
-    current_user.hashed_password = get_password_hash(new_password)
-    db.add(current_user)
-    db.commit()
-    
-    return {"message": "Password changed successfully"}
+    return await UserService.change_password_async(
+        db=db,
+        user_id=current_user.id,
+        old_password=old_password,
+        new_password=new_password
+    )
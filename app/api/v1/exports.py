@@ -0,0 +1,87 @@
+# export API endpoints - columnar table downloads for the data warehouse
+from contextlib import ExitStack
+from datetime import datetime
+from typing import Iterator, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Table
+from app.database import data_engines
+from app.models.user import UserRole
+from app.services.export_service import ExportService
+from app.utils.auth import get_current_user
+
+router = APIRouter(prefix="/exports", tags=["exports"])
+
+MEDIA_TYPES = {"parquet": "application/vnd.apache.parquet", "arrow": "application/vnd.apache.arrow.stream"}
+
+
+class _ResponseSink:
+    """Write-only file object the Arrow writers append to and the response drains"""
+    
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+    
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+    
+    def tell(self) -> int:
+        return self._position
+    
+    def flush(self):
+        pass
+    
+    def close(self):
+        self.closed = True
+    
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+@router.get("/{table_name}")
+def export_table(
+    table_name: str,
+    file_format: str = Query("parquet", alias="format", pattern="^(parquet|arrow)$"),
+    since: Optional[datetime] = Query(None, description="only rows changed after this UTC time"),
+    batch_size: int = Query(50000, ge=1000, le=500000),
+    current_user = Depends(get_current_user)
+):
+    """Download a whole table (or the rows changed since a watermark) as Parquet or an Arrow stream
+    
+    The ``X-Export-Watermark`` response header is the ``since`` to pass on the next
+    incremental export.
+    """
+    # Only loan officers and admins can export, exports cover every borrower
+    if current_user.role not in [UserRole.LOAN_OFFICER, UserRole.ADMIN]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to export tables"
+        )
+    table = ExportService.get_table(table_name)
+    until = datetime.utcnow()
+    return StreamingResponse(
+        _export_stream(table, file_format, since, until, batch_size),
+        media_type=MEDIA_TYPES[file_format],
+        headers={
+            "Content-Disposition": f'attachment; filename="{table_name}.{file_format}"',
+            "X-Export-Watermark": until.isoformat()
+        }
+    )
+
+
+def _export_stream(
+    table: Table, file_format: str, since: Optional[datetime], until: datetime, batch_size: int
+) -> Iterator[bytes]:
+    # runs in the threadpool while the response streams; one connection per database (every shard
+    # when sharded) for the whole export
+    sink = _ResponseSink()
+    with ExitStack() as stack:
+        connections = [stack.enter_context(data_engine.connect()) for data_engine in data_engines().values()]
+        for _ in ExportService.stream_export(connections, table, sink, file_format, since, until, batch_size):
+            yield sink.drain()
+    yield sink.drain()
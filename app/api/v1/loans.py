@@ -1,10 +1,32 @@
 # loans API endpoints
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Optional, Union
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.database import get_db
-from app.schemas.loan import LoanApplicationCreate, LoanApplicationResponse, LoanApplicationUpdate
+from app.config import settings
+from app.database import (
+    async_shard_db,
+    get_async_read_db,
+    get_async_shard_dbs,
+    get_borrower_shard_db,
+    get_db,
+    get_shard_dbs,
+    shard_db
+)
+from app.models.loan import Loan, LoanApplication
+from app.schemas.loan import (
+    LoanApplicationCreate,
+    LoanApplicationPage,
+    LoanApplicationResponse,
+    LoanApplicationUpdate,
+    LoanBatchApprovalRequest,
+    LoanBatchApprovalResponse,
+    LoanDetailResponse
+)
 from app.services.loan_service import LoanService
 from app.utils.auth import get_current_user
+from app.utils.query_counter import query_budget
+from app.utils.streaming import streaming_json_response
 from app.models.user import UserRole
 
 router = APIRouter(prefix="/loans", tags=["loans"])
@@ -23,32 +45,111 @@ def create_loan_application(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorized to create loan for this user"
         )
-    return LoanService.create_loan_application(db=db, loan=loan)
+    if not settings.SHARD_URLS:
+        return LoanService.create_loan_application(db=db, loan=loan)
+    # the application goes to the applicant's shard, known only once the body is parsed
+    shard_session = get_borrower_shard_db(loan.applicant_id)
+    try:
+        return LoanService.create_loan_application(db=shard_session, loan=loan)
+    finally:
+        shard_session.close()
 
 
-@router.get("/{loan_id}", response_model=LoanApplicationResponse)
-def get_loan_application(loan_id: int, db: Session = Depends(get_db)):
+@router.get("/disbursed/{loan_id}", response_model=LoanDetailResponse, dependencies=[query_budget(2)])
+async def get_loan_detail(
+    loan_id: int,
+    db: AsyncSession = Depends(async_shard_db("loan_id", Loan, read_only=True)),
+    directory_db: AsyncSession = Depends(get_async_read_db)
+):
+    """Get a disbursed loan with its borrower and full repayment schedule"""
+    # with sharding the borrower is on the directory, not next to the loan
+    return await LoanService.get_loan_detail_async(
+        db=db, loan_id=loan_id, directory_db=directory_db if settings.SHARD_URLS else None
+    )
+
+
+@router.get("/{loan_id}", response_model=LoanApplicationResponse, dependencies=[query_budget(1)])
+async def get_loan_application(
+    loan_id: int, db: AsyncSession = Depends(async_shard_db("loan_id", LoanApplication, read_only=True))
+):
     """Get loan application by ID"""
-    return LoanService.get_loan_application_by_id(db=db, loan_id=loan_id)
+    return await LoanService.get_loan_application_by_id_async(db=db, loan_id=loan_id)
 
 
-@router.get("/user/{user_id}", response_model=list[LoanApplicationResponse])
-def get_user_loans(user_id: int, skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
-    """Get all loans for a specific user"""
-    return LoanService.get_user_loans(db=db, user_id=user_id, skip=skip, limit=limit)
+@router.get(
+    "/user/{user_id}",
+    response_model=Union[list[LoanApplicationResponse], LoanApplicationPage],
+    dependencies=[query_budget(1)]
+)
+async def get_user_loans(
+    user_id: int,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(10, ge=1),
+    cursor: Optional[str] = None,
+    stream: Optional[str] = Query(None, pattern="^(ndjson|json)$"),
+    db: AsyncSession = Depends(async_shard_db("user_id", read_only=True))
+):
+    """Get all loans for a specific user
+    
+    Pass ``cursor`` (empty for the first page) to get keyset pages with a ``next_cursor``.
+    Pass ``stream=ndjson`` or ``stream=json`` to stream the rows from the database cursor.
+    """
+    if stream is not None:
+        return streaming_json_response(LoanService.stream_loans_async(db, stream, user_id, skip, limit), stream)
+    if settings.FAST_LIST_SERIALIZATION:
+        return Response(
+            await LoanService.get_loans_json_async(db=db, user_id=user_id, skip=skip, limit=limit, cursor=cursor),
+            media_type="application/json"
+        )
+    if cursor is not None:
+        items, next_cursor = await LoanService.get_user_loans_page_async(db=db, user_id=user_id, cursor=cursor, limit=limit)
+        return {"items": items, "next_cursor": next_cursor}
+    return await LoanService.get_user_loans_async(db=db, user_id=user_id, skip=skip, limit=limit)
 
 
-@router.get("", response_model=list[LoanApplicationResponse])
-def get_all_loans(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
-    """Get all loan applications"""
-    return LoanService.get_all_loans(db=db, skip=skip, limit=limit)
+@router.get("", response_model=Union[list[LoanApplicationResponse], LoanApplicationPage], dependencies=[query_budget(1)])
+async def get_all_loans(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(10, ge=1),
+    cursor: Optional[str] = None,
+    stream: Optional[str] = Query(None, pattern="^(ndjson|json)$"),
+    db: AsyncSession = Depends(get_async_read_db),
+    shard_dbs: list[AsyncSession] = Depends(get_async_shard_dbs)
+):
+    """Get all loan applications
+    
+    Pass ``cursor`` (empty for the first page) to get keyset pages with a ``next_cursor``.
+    Pass ``stream=ndjson`` or ``stream=json`` to stream ``skip`` / ``limit`` rows straight
+    from the database cursor, for large exports.
+    """
+    if shard_dbs:
+        if stream is not None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Streaming is not available across shards; page with cursor instead"
+            )
+        if cursor is not None:
+            items, next_cursor = await LoanService.get_all_loans_page_across_shards_async(shard_dbs, cursor, limit)
+            return {"items": items, "next_cursor": next_cursor}
+        return await LoanService.get_all_loans_across_shards_async(shard_dbs, skip=skip, limit=limit)
+    if stream is not None:
+        return streaming_json_response(LoanService.stream_loans_async(db, stream, skip=skip, limit=limit), stream)
+    if settings.FAST_LIST_SERIALIZATION:
+        return Response(
+            await LoanService.get_loans_json_async(db=db, skip=skip, limit=limit, cursor=cursor),
+            media_type="application/json"
+        )
+    if cursor is not None:
+        items, next_cursor = await LoanService.get_all_loans_page_async(db=db, cursor=cursor, limit=limit)
+        return {"items": items, "next_cursor": next_cursor}
+    return await LoanService.get_all_loans_async(db=db, skip=skip, limit=limit)
 
 
 @router.put("/{loan_id}", response_model=LoanApplicationResponse)
 def update_loan_application(
     loan_id: int, 
     loan_update: LoanApplicationUpdate, 
-    db: Session = Depends(get_db),
+    db: Session = Depends(shard_db("loan_id", LoanApplication)),
     current_user = Depends(get_current_user)
 ):
     """Update loan application status"""
@@ -61,10 +162,32 @@ def update_loan_application(
     return LoanService.update_loan_application(db=db, loan_id=loan_id, loan_update=loan_update)
 
 
+@router.post("/approve:batch", response_model=LoanBatchApprovalResponse)
+def approve_loans_batch(
+    batch: LoanBatchApprovalRequest,
+    db: Session = Depends(get_db),
+    shard_sessions: dict[str, Session] = Depends(get_shard_dbs),
+    current_user = Depends(get_current_user)
+):
+    """Approve many loan applications in one transaction"""
+    # Only loan officers and admins can approve loans
+    if current_user.role not in [UserRole.LOAN_OFFICER, UserRole.ADMIN]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to approve loans"
+        )
+    if shard_sessions:
+        results = LoanService.approve_loans_across_shards(shard_sessions, loan_ids=batch.loan_ids)
+    else:
+        results = LoanService.approve_loans(db=db, loan_ids=batch.loan_ids)
+    approved = sum(1 for r in results if r["approved"])
+    return {"approved": approved, "failed": len(results) - approved, "results": results}
+
+
 @router.post("/{loan_id}/approve", response_model=LoanApplicationResponse)
 def approve_loan(
     loan_id: int, 
-    db: Session = Depends(get_db),
+    db: Session = Depends(shard_db("loan_id", LoanApplication)),
     current_user = Depends(get_current_user)
 ):
     """Approve a loan application"""
@@ -81,7 +204,7 @@ def approve_loan(
 def reject_loan(
     loan_id: int,
     reason: str = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(shard_db("loan_id", LoanApplication)),
     current_user = Depends(get_current_user)
 ):
     """Reject a loan application"""
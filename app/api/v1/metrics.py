@@ -0,0 +1,43 @@
+# metrics API endpoints - operational counters for monitoring
+from fastapi import APIRouter, Depends, HTTPException, status
+from app.database import POOL_METRICS, recent_writers
+from app.services.payment_service import recent_references
+from app.services.quote_service import quote_cache, schedule_preview_cache
+from app.utils.auth import get_current_user, password_hasher_pool, user_cache
+
+
+def require_superuser(current_user = Depends(get_current_user)):
+    # Only admins can read metrics, they describe the deployment's internals
+    if not current_user.is_superuser:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to read metrics"
+        )
+    return current_user
+
+
+router = APIRouter(prefix="/metrics", tags=["metrics"], dependencies=[Depends(require_superuser)])
+
+
+@router.get("/pool")
+def get_pool_metrics():
+    """Get connection pool usage, overflow and checkout wait-time counters"""
+    return {name: metrics.snapshot() for name, metrics in POOL_METRICS.items()}
+
+
+@router.get("/cache")
+def get_cache_metrics():
+    """Get hit/miss counters of the in-process caches"""
+    return {
+        "current_user": user_cache.stats(),
+        "payment_references": recent_references.stats(),
+        "quotes": quote_cache.stats(),
+        "schedule_previews": schedule_preview_cache.stats(),
+        "replica_sticky_writers": recent_writers.stats()
+    }
+
+
+@router.get("/password-hashing")
+def get_password_hashing_metrics():
+    """Get load and rejection counters of the password hashing pool"""
+    return password_hasher_pool.stats()
@@ -1,29 +1,64 @@
 # payments API endpoints
-from fastapi import APIRouter, Depends, HTTPException, status
+import io
+import json
+import tempfile
+from typing import BinaryIO, Iterator, List, Optional, Union
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.database import get_db
-from app.schemas.payment import PaymentCreate, RepaymentScheduleResponse
+from app.config import settings
+from app.database import async_shard_db, data_sessionmakers, get_async_read_db, get_async_shard_dbs, shard_db
+from app.models.loan import Loan
+from app.models.payment import RepaymentSchedule
+from app.models.user import UserRole
+from app.schemas.payment import PaymentCreate, RepaymentSchedulePage, RepaymentScheduleResponse
 from app.services.payment_service import PaymentService
 from app.utils.auth import get_current_user
+from app.utils.query_counter import query_budget
+from app.utils.settlement import parse_settlement_lines
+from app.utils.streaming import streaming_json_response
 
 router = APIRouter(prefix="/payments", tags=["payments"])
 
 
-@router.get("/loan/{loan_id}/schedule", response_model=list[RepaymentScheduleResponse])
-def get_repayment_schedule(
+@router.get(
+    "/loan/{loan_id}/schedule",
+    response_model=Union[list[RepaymentScheduleResponse], RepaymentSchedulePage],
+    dependencies=[query_budget(1)]
+)
+async def get_repayment_schedule(
     loan_id: int, 
-    skip: int = 0, 
-    limit: int = 10,
-    db: Session = Depends(get_db)
+    skip: int = Query(0, ge=0),
+    limit: int = Query(10, ge=1),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(async_shard_db("loan_id", Loan, read_only=True))
 ):
-    """Get repayment schedule for a loan"""
-    return PaymentService.get_loan_repayment_schedule(db=db, loan_id=loan_id, skip=skip, limit=limit)
+    """Get repayment schedule for a loan
+    
+    Pass ``cursor`` (empty for the first page) to get keyset pages with a ``next_cursor``.
+    """
+    if settings.FAST_LIST_SERIALIZATION:
+        return Response(
+            await PaymentService.get_loan_repayment_schedule_json_async(
+                db=db, loan_id=loan_id, skip=skip, limit=limit, cursor=cursor
+            ),
+            media_type="application/json"
+        )
+    if cursor is not None:
+        items, next_cursor = await PaymentService.get_loan_repayment_schedule_page_async(
+            db=db, loan_id=loan_id, cursor=cursor, limit=limit
+        )
+        return {"items": items, "next_cursor": next_cursor}
+    return await PaymentService.get_loan_repayment_schedule_async(db=db, loan_id=loan_id, skip=skip, limit=limit)
 
 
-@router.get("/schedule/{schedule_id}", response_model=RepaymentScheduleResponse)
-def get_repayment_detail(schedule_id: int, db: Session = Depends(get_db)):
+@router.get("/schedule/{schedule_id}", response_model=RepaymentScheduleResponse, dependencies=[query_budget(1)])
+async def get_repayment_detail(
+    schedule_id: int, db: AsyncSession = Depends(async_shard_db("schedule_id", RepaymentSchedule, read_only=True))
+):
     """Get a specific repayment schedule detail"""
-    return PaymentService.get_repayment_schedule_by_id(db=db, schedule_id=schedule_id)
+    return await PaymentService.get_repayment_schedule_by_id_async(db=db, schedule_id=schedule_id)
 
 
 @router.post("/schedule/{schedule_id}/pay")
@@ -32,7 +67,7 @@ def make_payment(
     amount: float,
     payment_method: str,
     transaction_reference: str,
-    db: Session = Depends(get_db),
+    db: Session = Depends(shard_db("schedule_id", RepaymentSchedule)),
     current_user = Depends(get_current_user)
 ):
     """Record a payment for a repayment schedule"""
@@ -41,17 +76,85 @@ def make_payment(
         schedule_id=schedule_id,
         amount=amount,
         payment_method=payment_method,
-        transaction_reference=transaction_reference
+        transaction_reference=transaction_reference,
+        processed_by_id=current_user.id
     )
 
 
-@router.get("/loan/{loan_id}/history")
-def get_payment_history(loan_id: int, db: Session = Depends(get_db)):
-    """Get payment history for a loan"""
-    return PaymentService.get_payment_history(db=db, loan_id=loan_id)
+@router.post("/ingest")
+async def ingest_settlement_file(
+    request: Request,
+    file_format: str = Query("csv", alias="format", pattern="^(csv|jsonl)$"),
+    chunk_size: int = Query(settings.SETTLEMENT_CHUNK_SIZE, ge=1, le=10000),
+    current_user = Depends(get_current_user)
+):
+    """Apply a bank settlement file (CSV with a header row, or JSON lines)
+    
+    The request body is the raw file. The response is streamed as JSON lines, one
+    result per input line, while the file is being applied.
+    """
+    # Only loan officers and admins can ingest settlement files
+    if current_user.role not in [UserRole.LOAN_OFFICER, UserRole.ADMIN]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to ingest settlement files"
+        )
+    body = tempfile.SpooledTemporaryFile(max_size=settings.SETTLEMENT_SPOOL_MAX_BYTES)
+    async for block in request.stream():
+        body.write(block)
+    body.seek(0)
+    return StreamingResponse(
+        _settlement_report(body, file_format, chunk_size, current_user.id),
+        media_type="application/x-ndjson"
+    )
 
 
-@router.get("/loan/{loan_id}/balance")
-def get_loan_balance(loan_id: int, db: Session = Depends(get_db)):
+def _settlement_report(body: BinaryIO, file_format: str, chunk_size: int, processed_by_id: int) -> Iterator[str]:
+    # runs in the threadpool while the response streams, so it owns its sessions (one per shard when sharded)
+    sessions = {name: session_factory() for name, session_factory in data_sessionmakers().items()}
+    try:
+        lines = io.TextIOWrapper(body, encoding="utf-8-sig", newline="")
+        for result in PaymentService.ingest_payments_across_shards(
+            sessions, parse_settlement_lines(lines, file_format), processed_by_id, chunk_size
+        ):
+            yield json.dumps(result, default=str) + "\n"
+    finally:
+        for db in sessions.values():
+            db.close()
+        body.close()
+
+
+@router.get("/loan/{loan_id}/history", dependencies=[query_budget(1)])
+async def get_payment_history(
+    loan_id: int,
+    stream: Optional[str] = Query(None, pattern="^(ndjson|json)$"),
+    db: AsyncSession = Depends(async_shard_db("loan_id", Loan, read_only=True))
+):
+    """Get payment history for a loan
+    
+    Pass ``stream=ndjson`` (one object per line) or ``stream=json`` (an array) to have
+    the rows streamed from the database cursor instead of built up in memory.
+    """
+    if stream is not None:
+        return streaming_json_response(PaymentService.stream_payment_history_async(db, loan_id, stream), stream)
+    return await PaymentService.get_payment_history_async(db=db, loan_id=loan_id)
+
+
+@router.get("/loan/{loan_id}/balance", dependencies=[query_budget(1)])
+async def get_loan_balance(
+    loan_id: int, db: AsyncSession = Depends(async_shard_db("loan_id", Loan, read_only=True))
+):
     """Get outstanding balance for a loan"""
-    return PaymentService.get_loan_balance(db=db, loan_id=loan_id)
+    return await PaymentService.get_loan_balance_async(db=db, loan_id=loan_id)
+
+
+@router.get("/balances", dependencies=[query_budget(1)])
+async def get_portfolio_balances(
+    loan_ids: List[int] = Query(..., min_length=1, max_length=1000),
+    db: AsyncSession = Depends(get_async_read_db),
+    shard_dbs: list[AsyncSession] = Depends(get_async_shard_dbs)
+):
+    """Get outstanding balances for many loans in one call"""
+    if shard_dbs:
+        return await PaymentService.get_portfolio_balances_across_shards_async(shard_dbs, loan_ids=loan_ids)
+    return await PaymentService.get_portfolio_balances_async(db=db, loan_ids=loan_ids)
@@ -0,0 +1,57 @@
+# quotes API endpoints - public loan calculator, answered from memory without the database
+from datetime import date
+from typing import Optional
+from fastapi import APIRouter, Query, Response
+from app.schemas.quote import PrepaymentResponse, QuoteBatchRequest, QuoteBatchResponse, QuoteResponse, SchedulePreviewResponse
+from app.services.quote_service import QuoteService
+
+router = APIRouter(prefix="/quotes", tags=["quotes"])
+
+
+@router.get("", response_model=QuoteResponse)
+async def get_quote(
+    principal: float = Query(..., gt=0),
+    annual_interest_rate: float = Query(..., ge=0, le=100),
+    term_months: int = Query(..., gt=0, le=600)
+):
+    """Get the monthly payment (EMI), total interest and total payment for a loan"""
+    return QuoteService.get_quote(principal, annual_interest_rate, term_months)
+
+
+@router.post("/batch", response_model=QuoteBatchResponse)
+def get_quotes_batch(batch: QuoteBatchRequest):
+    """Quote many scenarios in one call, e.g. a whole amount x term grid
+    
+    Scenarios not in the cache are computed together in one vectorized pass.
+    """
+    return {"quotes": QuoteService.get_quotes(
+        [(s.principal, s.annual_interest_rate, s.term_months) for s in batch.scenarios]
+    )}
+
+
+@router.get("/schedule", response_model=SchedulePreviewResponse)
+async def get_schedule_preview(
+    principal: float = Query(..., gt=0),
+    annual_interest_rate: float = Query(..., ge=0, le=100),
+    term_months: int = Query(..., gt=0, le=600),
+    start_date: Optional[date] = Query(None, description="first installment is due a month after this (default today)")
+):
+    """Preview the full repayment schedule of a loan"""
+    return Response(
+        QuoteService.get_schedule_preview(principal, annual_interest_rate, term_months, start_date),
+        media_type="application/json"
+    )
+
+
+@router.get("/prepayment", response_model=PrepaymentResponse)
+async def get_prepayment_impact(
+    remaining_balance: float = Query(..., gt=0),
+    prepayment_amount: float = Query(..., gt=0),
+    monthly_emi: float = Query(..., gt=0),
+    remaining_months: int = Query(..., gt=0, le=600),
+    annual_interest_rate: float = Query(..., ge=0, le=100)
+):
+    """Get the months and interest an extra payment would save"""
+    return QuoteService.get_prepayment_impact(
+        remaining_balance, prepayment_amount, monthly_emi, remaining_months, annual_interest_rate
+    )
@@ -1,30 +1,56 @@
 # users API endpoints
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Optional, Union
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.database import get_db
-from app.schemas.user import UserCreate, UserResponse, UserUpdate
+from app.config import settings
+from app.database import get_async_db, get_async_read_db, get_db, shard_db
+from app.schemas.user import UserCreate, UserPage, UserResponse, UserUpdate
 from app.services.user_service import UserService
 from app.utils.auth import get_current_user
+from app.utils.query_counter import query_budget
+from app.utils.streaming import streaming_json_response
 
 router = APIRouter(prefix="/users", tags=["users"])
 
 
 @router.post("", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-def create_user(user: UserCreate, db: Session = Depends(get_db)):
+async def create_user(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
     """Create a new user"""
-    return UserService.create_user(db=db, user=user)
+    return await UserService.create_user_async(db=db, user=user)
 
 
-@router.get("/{user_id}", response_model=UserResponse)
-def get_user(user_id: int, db: Session = Depends(get_db)):
+@router.get("/{user_id}", response_model=UserResponse, dependencies=[query_budget(1)])
+async def get_user(user_id: int, db: AsyncSession = Depends(get_async_read_db)):
     """Get user by ID"""
-    return UserService.get_user_by_id(db=db, user_id=user_id)
+    return await UserService.get_user_by_id_async(db=db, user_id=user_id)
 
 
-@router.get("", response_model=list[UserResponse])
-def get_all_users(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
-    """Get all users with pagination"""
-    return UserService.get_all_users(db=db, skip=skip, limit=limit)
+@router.get("", response_model=Union[list[UserResponse], UserPage], dependencies=[query_budget(1)])
+async def get_all_users(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(10, ge=1),
+    cursor: Optional[str] = None,
+    stream: Optional[str] = Query(None, pattern="^(ndjson|json)$"),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """Get all users with pagination
+    
+    Pass ``cursor`` (empty for the first page) to get keyset pages with a ``next_cursor``.
+    Pass ``stream=ndjson`` or ``stream=json`` to stream ``skip`` / ``limit`` rows straight
+    from the database cursor, for large exports.
+    """
+    if stream is not None:
+        return streaming_json_response(UserService.stream_users_async(db, stream, skip, limit), stream)
+    if settings.FAST_LIST_SERIALIZATION:
+        return Response(
+            await UserService.get_all_users_json_async(db=db, skip=skip, limit=limit, cursor=cursor),
+            media_type="application/json"
+        )
+    if cursor is not None:
+        items, next_cursor = await UserService.get_all_users_page_async(db=db, cursor=cursor, limit=limit)
+        return {"items": items, "next_cursor": next_cursor}
+    return await UserService.get_all_users_async(db=db, skip=skip, limit=limit)
 
 
 @router.put("/{user_id}", response_model=UserResponse)
@@ -40,13 +66,18 @@ def update_user(user_id: int, user_update: UserUpdate, db: Session = Depends(get
 
 
 @router.delete("/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_user(user_id: int, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
-    """Delete user"""
+def delete_user(
+    user_id: int,
+    db: Session = Depends(get_db),
+    borrower_db: Session = Depends(shard_db("user_id")),
+    current_user = Depends(get_current_user)
+):
+    """Delete user, with their loans on their shard when sharded"""
     # Only admins can delete users
     if not current_user.is_superuser:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorized to delete users"
         )
-    UserService.delete_user(db=db, user_id=user_id)
+    UserService.delete_user(db=db, user_id=user_id, borrower_db=borrower_db)
     return None
@@ -3,12 +3,46 @@
 
 from pydantic_settings import BaseSettings
 
-from typing import List
+from typing import List, Optional
 
 class Settings(BaseSettings):
     # the control panel for the entire application configuration
     DATABASE_URL: str
     # database connection
+    # async driver URL, derived from DATABASE_URL (aiosqlite / asyncpg) when not set
+    ASYNC_DATABASE_URL: Optional[str] = None
+    
+    # connection pool tuning (ignored for in-memory SQLite)
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30  # seconds to wait for a free connection
+    DB_POOL_RECYCLE: int = 1800  # seconds, -1 disables recycling
+    # pre-ping strategy: "pessimistic" pings on every checkout, "optimistic" relies on
+    # DB_POOL_RECYCLE and SQLAlchemy invalidating the pool on disconnect errors
+    DB_POOL_PRE_PING: str = "pessimistic"
+    
+    # read replicas: GET endpoints read from one of these, everything else uses DATABASE_URL
+    # JSON list in the environment, e.g. DATABASE_REPLICA_URLS='["postgresql://replica1/loans"]'
+    DATABASE_REPLICA_URLS: List[str] = []
+    ASYNC_DATABASE_REPLICA_URLS: List[str] = []  # derived from DATABASE_REPLICA_URLS when empty
+    # read-your-writes: after a caller commits a write, their reads stay on the primary this long
+    REPLICA_STICKY_SECONDS: float = 5.0  # set above the replicas' usual replication lag
+    REPLICA_STICKY_MAX_SIZE: int = 100000  # recent writers remembered per process
+    
+    # horizontal sharding of the loan tables by borrower (off while SHARD_URLS is empty)
+    # DATABASE_URL stays the directory: users, the shard map and id allocation live there
+    SHARD_URLS: List[str] = []  # JSON list; the shards are named shard_0, shard_1, ... in this order
+    ASYNC_SHARD_URLS: List[str] = []  # derived from SHARD_URLS when empty
+    SHARD_BUCKETS: int = 1024  # borrowers hash into this many buckets; never change it once data is sharded
+    SHARD_MAP_REFRESH_SECONDS: float = 5.0  # how stale a process's copy of the shard map may get
+    SHARD_ID_BLOCK_SIZE: int = 1000  # ids reserved from the directory per round trip
+    SHARD_LOCATION_CACHE_MAX_SIZE: int = 100000  # loan / schedule id -> borrower lookups kept per process
+    
+    # SQLite pragmas applied to every new connection
+    SQLITE_JOURNAL_MODE: str = "WAL"
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_MMAP_SIZE: int = 268435456  # 256 MB
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
     
     # applicanion
     APP_NAME: str = "Loan Management System"
@@ -22,6 +56,56 @@ class Settings(BaseSettings):
     ALGORITHM: str = "HS256"    
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30  # in minutes
     
+    # argon2 password hashing cost (defaults match argon2-cffi's RFC 9106 low-memory profile)
+    ARGON2_TIME_COST: int = 3
+    ARGON2_MEMORY_COST: int = 65536  # KiB
+    ARGON2_PARALLELISM: int = 4
+    
+    # dedicated worker pool for password hashing so login bursts cannot starve other routes
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_QUEUE: int = 32  # jobs waiting for a worker before we answer 503
+    
+    # cache of authenticated users, so token checks skip the DB on a hit
+    USER_CACHE_MAX_SIZE: int = 10000
+    USER_CACHE_TTL_SECONDS: int = 60
+    
+    # memoized loan quotes (pure calculations, so entries only age out to bound memory)
+    QUOTE_CACHE_MAX_SIZE: int = 10000
+    QUOTE_SCHEDULE_CACHE_MAX_SIZE: int = 500  # full schedule previews are ~30 KB each
+    QUOTE_CACHE_TTL_SECONDS: int = 86400
+    
+    # retries when an optimistic (version column) update loses to a concurrent writer
+    CONCURRENCY_RETRY_ATTEMPTS: int = 5
+    CONCURRENCY_RETRY_BACKOFF_SECONDS: float = 0.01  # base of the jittered exponential backoff
+    
+    # recently used payment transaction references kept in a bloom filter, so new
+    # references skip the replay lookup (the unique constraint remains the backstop)
+    IDEMPOTENCY_BLOOM_CAPACITY: int = 100000
+    IDEMPOTENCY_BLOOM_ERROR_RATE: float = 0.01
+    
+    # lazy repayment schedules: approvals store no installments, reads compute them from the
+    # loan terms and only installments with a payment or a delinquency status get a row
+    LAZY_REPAYMENT_SCHEDULES: bool = False
+    
+    # delinquency sweep (python -m app.jobs.delinquency_sweep)
+    DELINQUENCY_DUE_WINDOW_DAYS: int = 7  # PENDING installments become DUE this close to their due date
+    DELINQUENCY_MISSED_AFTER_DAYS: int = 30  # LATE installments become MISSED this long past due
+    DELINQUENCY_DEFAULT_MISSED_INSTALLMENTS: int = 3  # MISSED installments that default a loan
+    DELINQUENCY_SWEEP_CHUNK_SIZE: int = 10000  # rows per id range, one short transaction each
+    
+    # settlement file ingestion
+    SETTLEMENT_CHUNK_SIZE: int = 1000  # lines applied per transaction
+    SETTLEMENT_SPOOL_MAX_BYTES: int = 8388608  # uploads larger than 8 MB are spooled to disk
+    
+    # list endpoints encode rows straight to JSON instead of validating a response model per row
+    FAST_LIST_SERIALIZATION: bool = False
+    
+    # streamed list responses (?stream=ndjson|json)
+    STREAM_BATCH_SIZE: int = 1000  # rows fetched from the cursor and sent per chunk
+    
+    # N+1 guard: fail requests that run more SQL statements than their route's query_budget
+    QUERY_BUDGET_CHECK: bool = False  # enable in development and CI, not in production
+    
     # CORS settings
     ALLOWED_ORIGINS: List[str] = ["http://localhost:3000"]  # allow all origins by default
     
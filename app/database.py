@@ -1,29 +1,594 @@
 # datbase connection and session management
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import asyncio
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import AsyncExitStack
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException, Request, status
+from sqlalchemy import create_engine, event, insert, select, update
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import IntegrityError, TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from app.config import settings
+from app.utils.cache import TTLCache
+from app.utils.query_counter import instrument_query_counting
+from app.utils.sharding import IdBlockAllocator, ShardMap
+
+
+class PoolMetrics:
+    """Counters for one connection pool, fed by pool events and the timed pool classes"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.wait_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.engine = None
+    
+    def record_wait(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            self.wait_count += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            if timed_out:
+                self.timeouts += 1
+    
+    def increment(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+    
+    def snapshot(self) -> dict:
+        pool = self.engine.pool if self.engine is not None else None
+        with self._lock:
+            data = {
+                "pool_class": type(pool).__name__ if pool is not None else None,
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "wait_count": self.wait_count,
+                "wait_total_ms": round(self.wait_total * 1000, 3),
+                "wait_avg_ms": round(self.wait_total / self.wait_count * 1000, 3) if self.wait_count else 0.0,
+                "wait_max_ms": round(self.wait_max * 1000, 3),
+            }
+        if isinstance(pool, QueuePool):
+            data.update({
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": max(pool.overflow(), 0),
+            })
+        return data
+
+
+# metrics for every engine, keyed by the pool logging name given in build_engine_options
+POOL_METRICS = {}
+
+
+class _TimedPoolMixin:
+    # measures how long each checkout waits for a connection
+    def connect(self):
+        metrics = POOL_METRICS.get(getattr(self, "logging_name", None))
+        if metrics is None:
+            return super().connect()
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except PoolTimeoutError:
+            metrics.record_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        metrics.record_wait(time.perf_counter() - start)
+        return connection
+
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def is_sqlite_memory(url) -> bool:
+    url = make_url(url)
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def build_engine_options(url, name: str, pool_class) -> dict:
+    # engine keyword arguments from the pool settings
+    # in-memory SQLite keeps SQLAlchemy's default single-connection pool
+    options = {"echo": settings.DEBUG, "pool_pre_ping": settings.DB_POOL_PRE_PING == "pessimistic"}
+    if is_sqlite_memory(url):
+        return options
+    options.update(
+        poolclass=pool_class,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_logging_name=name,
+    )
+    return options
+
+
+def instrument_engine(engine: Engine, name: str) -> PoolMetrics:
+    # hook pool events into a PoolMetrics and apply SQLite pragmas on connect
+    metrics = POOL_METRICS.setdefault(name, PoolMetrics())
+    metrics.engine = engine
+    
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        metrics.increment("connects")
+        if engine.dialect.name == "sqlite":
+            cursor = dbapi_connection.cursor()
+            if not is_sqlite_memory(engine.url):
+                cursor.execute(f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}")
+                cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+            cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+            cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+            cursor.close()
+    
+    @event.listens_for(engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        metrics.increment("checkouts")
+    
+    @event.listens_for(engine, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        metrics.increment("checkins")
+    
+    @event.listens_for(engine, "invalidate")
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        metrics.increment("invalidations")
+    
+    return metrics
+
+
+class RoutingSession(Session):
+    """Session that can send its reads to a read replica
+    
+    Only sessions opened with info["use_replica"] (the read dependencies) route
+    anywhere but the primary, and only statements that cannot write: flushes,
+    INSERT / UPDATE / DELETE and SELECT ... FOR UPDATE always go to the primary,
+    as does everything after the session itself has written. One replica is
+    picked per session so all of its reads see the same replica.
+    """
+    
+    def get_bind(self, mapper=None, clause=None, **kw):
+        replicas = self.info.get("replicas")
+        if (
+            replicas
+            and self.info.get("use_replica")
+            and not self.info.get("wrote")
+            and not self._flushing
+            and not getattr(clause, "is_dml", False)
+            and getattr(clause, "_for_update_arg", None) is None
+        ):
+            replica = self.info.get("replica")
+            if replica is None:
+                replica = self.info["replica"] = random.choice(replicas)
+            return replica
+        return super().get_bind(mapper, clause=clause, **kw)
+
+
+# callers (see requester_key) who committed a write in the last REPLICA_STICKY_SECONDS,
+# so their next reads see that write instead of a lagging replica
+recent_writers = TTLCache(max_size=settings.REPLICA_STICKY_MAX_SIZE, ttl_seconds=settings.REPLICA_STICKY_SECONDS)
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _mark_flush_written(session, flush_context):
+    session.info["wrote"] = True
+
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def _mark_statement_written(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["wrote"] = True
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _stick_writer_to_primary(session):
+    requester = session.info.get("requester")
+    if requester is not None and session.info.get("wrote") and session.info.get("replicas"):
+        recent_writers.set(requester, True)
 
 
 # create the database engine
-# verifys connection is alive with pool_pre_ping
-engine =create_engine (settings.DATABASE_URL, pool_pre_ping=True, echo=settings.DEBUG) 
+# pool sizing and the pre-ping strategy come from settings
+engine = create_engine(settings.DATABASE_URL, **build_engine_options(settings.DATABASE_URL, "primary", TimedQueuePool))
+instrument_engine(engine, "primary")
+instrument_query_counting(engine)
+
+# read replica engines, one pool each (named replica_0, replica_1, ... in the pool metrics)
+replica_engines = []
+for index, replica_url in enumerate(settings.DATABASE_REPLICA_URLS):
+    replica_engine = create_engine(replica_url, **build_engine_options(replica_url, f"replica_{index}", TimedQueuePool))
+    instrument_engine(replica_engine, f"replica_{index}")
+    instrument_query_counting(replica_engine)
+    replica_engines.append(replica_engine)
 
 # create database sessions
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = sessionmaker(
+    class_=RoutingSession, autocommit=False, autoflush=False, bind=engine, info={"replicas": replica_engines}
+)
+
+
+# async drivers used when ASYNC_DATABASE_URL is not given explicitly
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+
+def to_async_url(url) -> str:
+    # swap the sync driver of a database URL for its async counterpart
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername)).render_as_string(hide_password=False)
+
+
+def get_async_database_url() -> str:
+    # ASYNC_DATABASE_URL, or DATABASE_URL with its async driver
+    if settings.ASYNC_DATABASE_URL:
+        return settings.ASYNC_DATABASE_URL
+    return to_async_url(settings.DATABASE_URL)
+
+
+# async engine and sessions for routes that run on the event loop
+# expire_on_commit=False so loaded objects stay usable after commit without lazy IO
+ASYNC_DATABASE_URL = get_async_database_url()
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    **build_engine_options(ASYNC_DATABASE_URL, "primary_async", TimedAsyncAdaptedQueuePool)
+)
+instrument_engine(async_engine.sync_engine, "primary_async")
+instrument_query_counting(async_engine.sync_engine)
+
+async_replica_engines = []
+for index, replica_url in enumerate(
+    settings.ASYNC_DATABASE_REPLICA_URLS or [to_async_url(url) for url in settings.DATABASE_REPLICA_URLS]
+):
+    replica_engine = create_async_engine(
+        replica_url, **build_engine_options(replica_url, f"replica_{index}_async", TimedAsyncAdaptedQueuePool)
+    )
+    instrument_engine(replica_engine.sync_engine, f"replica_{index}_async")
+    instrument_query_counting(replica_engine.sync_engine)
+    async_replica_engines.append(replica_engine)
+
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, sync_session_class=RoutingSession, autoflush=False, expire_on_commit=False,
+    info={"replicas": [replica_engine.sync_engine for replica_engine in async_replica_engines]}
+)
+
+
+# horizontal sharding (SHARD_URLS): loan applications, loans, schedules and payments live on
+# the shard that owns their borrower (see ShardMap), together with that shard's analytics
+# summary tables; DATABASE_URL remains the directory holding users and the shard map
+SHARD_IDS = [f"shard_{index}" for index in range(len(settings.SHARD_URLS))]
+SHARDED_TABLES = ("loan_applications", "loans", "repayment_schedules", "payments")
+
+shard_engines: Dict[str, Engine] = {}
+ShardSessionLocal: Dict[str, sessionmaker] = {}
+for shard_id, shard_url in zip(SHARD_IDS, settings.SHARD_URLS):
+    shard_engine = create_engine(shard_url, **build_engine_options(shard_url, shard_id, TimedQueuePool))
+    instrument_engine(shard_engine, shard_id)
+    instrument_query_counting(shard_engine)
+    shard_engines[shard_id] = shard_engine
+    ShardSessionLocal[shard_id] = sessionmaker(
+        class_=RoutingSession, autocommit=False, autoflush=False, bind=shard_engine, info={"shard_id": shard_id}
+    )
+
+async_shard_engines = {}
+AsyncShardSessionLocal: Dict[str, async_sessionmaker] = {}
+for shard_id, shard_url in zip(
+    SHARD_IDS, settings.ASYNC_SHARD_URLS or [to_async_url(url) for url in settings.SHARD_URLS]
+):
+    shard_engine = create_async_engine(
+        shard_url, **build_engine_options(shard_url, f"{shard_id}_async", TimedAsyncAdaptedQueuePool)
+    )
+    instrument_engine(shard_engine.sync_engine, f"{shard_id}_async")
+    instrument_query_counting(shard_engine.sync_engine)
+    async_shard_engines[shard_id] = shard_engine
+    AsyncShardSessionLocal[shard_id] = async_sessionmaker(
+        shard_engine, class_=AsyncSession, sync_session_class=RoutingSession, autoflush=False,
+        expire_on_commit=False, info={"shard_id": shard_id}
+    )
+
+
+def data_sessionmakers() -> Dict[str, sessionmaker]:
+    # where the loan tables live: every shard, or just the primary when not sharded
+    return ShardSessionLocal or {"primary": SessionLocal}
+
+
+def data_engines() -> Dict[str, Engine]:
+    # engines of the databases holding the loan tables, as data_sessionmakers
+    return shard_engines or {"primary": engine}
+
+
+def _reserve_id_block(table_name: str, size: int) -> int:
+    # advance the table's counter in the directory by size ids, in its own short transaction
+    from app.models.shard import ShardIdBlock
+    
+    while True:
+        with engine.begin() as connection:
+            end = connection.execute(
+                update(ShardIdBlock)
+                .where(ShardIdBlock.table_name == table_name)
+                .values(next_id=ShardIdBlock.next_id + size)
+                .returning(ShardIdBlock.next_id)
+            ).scalar()
+        if end is not None:
+            return end - size
+        try:
+            with engine.begin() as connection:
+                connection.execute(insert(ShardIdBlock).values(table_name=table_name, next_id=1 + size))
+            return 1
+        except IntegrityError:
+            continue  # another process created the counter first
+
+
+# ids of sharded tables come from the directory, so a loan id means the same loan on every shard
+shard_id_allocator = IdBlockAllocator(_reserve_id_block, settings.SHARD_ID_BLOCK_SIZE)
+
+
+@event.listens_for(RoutingSession, "before_flush")
+def _assign_shard_ids(session, flush_context, instances):
+    if "shard_id" not in session.info:
+        return
+    pending = defaultdict(list)
+    for instance in session.new:
+        table_name = instance.__table__.name
+        if table_name in SHARDED_TABLES and instance.id is None:
+            pending[table_name].append(instance)
+    for table_name, new_instances in pending.items():
+        for instance, new_id in zip(new_instances, shard_id_allocator.next_ids(table_name, len(new_instances))):
+            instance.id = new_id
+
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def _assign_bulk_shard_ids(orm_execute_state):
+    # bulk INSERTs (schedules on approval, settlement ledger rows) skip the flush, so fill their ids here
+    if "shard_id" not in orm_execute_state.session.info or not orm_execute_state.is_insert:
+        return
+    table = getattr(orm_execute_state.statement, "table", None)
+    if table is None or table.name not in SHARDED_TABLES or not orm_execute_state.parameters:
+        return
+    rows = orm_execute_state.parameters
+    rows = rows if isinstance(rows, list) else [rows]
+    missing = [row for row in rows if "id" not in row]
+    for row, new_id in zip(missing, shard_id_allocator.next_ids(table.name, len(missing))):
+        row["id"] = new_id
+
+
+class _ShardMapHolder:
+    # the directory's shard map, re-read at most every SHARD_MAP_REFRESH_SECONDS
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._map: Optional[ShardMap] = None
+        self._loaded_at = 0.0
+    
+    def get(self) -> ShardMap:
+        with self._lock:
+            if self._map is None or time.monotonic() - self._loaded_at >= settings.SHARD_MAP_REFRESH_SECONDS:
+                self._map = load_shard_map()
+                self._loaded_at = time.monotonic()
+            return self._map
+    
+    def invalidate(self):
+        with self._lock:
+            self._map = None
+
+
+def load_shard_map() -> ShardMap:
+    """Read the shard map from the directory, writing the initial round-robin map on first use
+    
+    The map is materialized once so that adding a shard to SHARD_URLS later moves
+    nothing by itself; buckets only change shards through the rebalancer.
+    """
+    from app.models.shard import ShardBucket
+    
+    with engine.begin() as connection:
+        rows = connection.execute(select(ShardBucket.bucket, ShardBucket.shard_id, ShardBucket.moving)).all()
+    if not rows:
+        initial = ShardMap.initial(SHARD_IDS, settings.SHARD_BUCKETS)
+        try:
+            with engine.begin() as connection:
+                connection.execute(insert(ShardBucket), [
+                    {"bucket": bucket, "shard_id": shard_id, "moving": False}
+                    for bucket, shard_id in initial.assignments.items()
+                ])
+        except IntegrityError:
+            return load_shard_map()  # another process wrote it first
+        return initial
+    return ShardMap(
+        settings.SHARD_BUCKETS,
+        {bucket: shard_id for bucket, shard_id, _ in rows},
+        [bucket for bucket, _, moving in rows if moving]
+    )
+
+
+shard_map = _ShardMapHolder()
+
+# loan application / loan / schedule / payment id -> borrower id; ownership never changes
+borrower_locations = TTLCache(max_size=settings.SHARD_LOCATION_CACHE_MAX_SIZE, ttl_seconds=86400)
+
+
+def shard_for_borrower(borrower_id: int) -> str:
+    """Shard holding a borrower's loans; 503 while the borrower's bucket is being moved"""
+    current = shard_map.get()
+    if current.is_moving(borrower_id):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="This borrower's loans are being moved between shards, retry shortly",
+            headers={"Retry-After": str(max(1, round(settings.SHARD_MAP_REFRESH_SECONDS)))}
+        )
+    return current.assignments[current.bucket_for(borrower_id)]
+
+
+def _borrower_query(model, entity_id: int):
+    # borrower of one row of a sharded table; schedules and payments are found through their loan
+    from app.models.loan import Loan, LoanApplication
+    from app.models.payment import RepaymentSchedule
+    from app.utils.loan_calculator import split_virtual_schedule_id
+    
+    if model is LoanApplication:
+        return select(LoanApplication.applicant_id).where(LoanApplication.id == entity_id)
+    if model is Loan:
+        return select(Loan.borrower_id).where(Loan.id == entity_id)
+    if model is RepaymentSchedule and split_virtual_schedule_id(entity_id) is not None:
+        # an installment without a row names its loan in its id
+        return select(Loan.borrower_id).where(Loan.id == split_virtual_schedule_id(entity_id)[0])
+    return select(Loan.borrower_id).join(model, model.loan_id == Loan.id).where(model.id == entity_id)
+
+
+def locate_borrower(model, entity_id: int) -> Optional[int]:
+    """Borrower owning a row of a sharded table, found by asking every shard (then cached)"""
+    key = (model.__tablename__, entity_id)
+    borrower_id = borrower_locations.get(key)
+    if borrower_id is None:
+        stmt = _borrower_query(model, entity_id)
+        for shard_engine in shard_engines.values():
+            with shard_engine.connect() as connection:
+                borrower_id = connection.execute(stmt).scalar()
+            if borrower_id is not None:
+                borrower_locations.set(key, borrower_id)
+                break
+    return borrower_id
+
+
+async def locate_borrower_async(model, entity_id: int) -> Optional[int]:
+    """locate_borrower, asking all shards at once (async)"""
+    key = (model.__tablename__, entity_id)
+    borrower_id = borrower_locations.get(key)
+    if borrower_id is None:
+        stmt = _borrower_query(model, entity_id)
+        
+        async def ask(shard_engine) -> Optional[int]:
+            async with shard_engine.connect() as connection:
+                return (await connection.execute(stmt)).scalar()
+        
+        found = [b for b in await asyncio.gather(*(ask(e) for e in async_shard_engines.values())) if b is not None]
+        if found:
+            borrower_id = found[0]
+            borrower_locations.set(key, borrower_id)
+    return borrower_id
+
+
 Base = declarative_base()   
 
 # Base class for all models to inherit from
 Base = declarative_base()
 
-def get_db():
+def requester_key(request: Request) -> str:
+    # who is reading / writing, for read-your-writes: the bearer token, else the client address
+    return request.headers.get("authorization") or (request.client.host if request.client else "")
+
+
+def read_session_info(request: Request) -> dict:
+    # read-only sessions use a replica, unless the caller wrote within REPLICA_STICKY_SECONDS
+    requester = requester_key(request)
+    return {"requester": requester, "use_replica": recent_writers.get(requester) is None}
+
+
+def get_db(request: Request):
     # dependency to get DB session
     # this ensurres each requests has its own session and is closed after use
-    db = SessionLocal()
+    db = SessionLocal(info={"requester": requester_key(request)})
     try:
         yield db
     finally:
         db.close()
-        
\ No newline at end of file
+
+
+async def get_async_db(request: Request):
+    # async dependency to get DB session
+    # lets async routes query the database without blocking the event loop
+    async with AsyncSessionLocal(info={"requester": requester_key(request)}) as db:
+        yield db
+
+
+async def get_async_read_db(request: Request):
+    # async dependency for read-only routes - queries go to a replica when one is configured
+    async with AsyncSessionLocal(info=read_session_info(request)) as db:
+        yield db
+
+
+def _path_id(request: Request, param: str) -> int:
+    try:
+        return int(request.path_params[param])
+    except (KeyError, ValueError):
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=f"Invalid {param}")
+
+
+def shard_db(param: str, model=None):
+    """Dependency factory: a session on the shard owning the path parameter
+    
+    The parameter is a borrower id, or with model the id of a row of that sharded
+    table (whose borrower is looked up). A row found on no shard gets the first
+    shard's session, so the service answers its usual 404. Without SHARD_URLS the
+    dependency is get_db.
+    """
+    def get_shard_db(request: Request):
+        if not shard_engines:
+            yield from get_db(request)
+            return
+        entity_id = _path_id(request, param)
+        borrower_id = entity_id if model is None else locate_borrower(model, entity_id)
+        shard_id = SHARD_IDS[0] if borrower_id is None else shard_for_borrower(borrower_id)
+        db = ShardSessionLocal[shard_id](info={"requester": requester_key(request)})
+        try:
+            yield db
+        finally:
+            db.close()
+    return get_shard_db
+
+
+def async_shard_db(param: str, model=None, read_only: bool = False):
+    """Async version of shard_db; without SHARD_URLS it is get_async_db (get_async_read_db if read_only)"""
+    async def get_async_shard_db(request: Request):
+        if not async_shard_engines:
+            async for db in (get_async_read_db if read_only else get_async_db)(request):
+                yield db
+            return
+        entity_id = _path_id(request, param)
+        borrower_id = entity_id if model is None else await locate_borrower_async(model, entity_id)
+        shard_id = SHARD_IDS[0] if borrower_id is None else shard_for_borrower(borrower_id)
+        async with AsyncShardSessionLocal[shard_id](info={"requester": requester_key(request)}) as db:
+            yield db
+    return get_async_shard_db
+
+
+def get_borrower_shard_db(borrower_id: int) -> Session:
+    """Session on a borrower's shard (the primary when not sharded); the caller closes it"""
+    if not shard_engines:
+        return SessionLocal()
+    return ShardSessionLocal[shard_for_borrower(borrower_id)]()
+
+
+def get_shard_dbs():
+    # a session on every shard, for writes spread across borrowers (empty when not sharded)
+    sessions = {shard_id: maker() for shard_id, maker in ShardSessionLocal.items()}
+    try:
+        yield sessions
+    finally:
+        for db in sessions.values():
+            db.close()
+
+
+async def get_async_shard_dbs():
+    # a session on every shard, for queries that fan out across shards (empty when not sharded)
+    async with AsyncExitStack() as stack:
+        yield [await stack.enter_async_context(maker()) for maker in AsyncShardSessionLocal.values()]
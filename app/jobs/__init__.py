@@ -0,0 +1 @@
+# jobs package for command-line maintenance tasks (run with python -m app.jobs.<name>)
@@ -0,0 +1,85 @@
+# approval benchmark - loan approval latency with the schedule added row by row vs bulk inserted
+# run with: python -m app.jobs.benchmark_approvals [--terms 12 60 240 360] [--repeat 15]
+# uses its own scratch SQLite database, so it never touches the configured one
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Sequence
+
+_scratch_dir = tempfile.mkdtemp(prefix="benchmark_approvals_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_scratch_dir, 'benchmark.db')}"
+
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app.config import settings  # noqa: E402
+from app.database import Base, SessionLocal, engine  # noqa: E402
+from app.models.loan import LoanApplication, LoanStatus, LoanType  # noqa: E402
+from app.models.payment import RepaymentSchedule  # noqa: E402
+from app.schemas.user import UserCreate  # noqa: E402
+from app.services.loan_service import LoanService  # noqa: E402
+from app.services.user_service import UserService  # noqa: E402
+from app.utils.loan_calculator import AmortizationTable, schedule_to_rows  # noqa: E402
+
+
+def add_per_row(db: Session, schedule: AmortizationTable, loan_ids: Sequence[int]) -> list:
+    """The schedule write approve_loan used before the bulk insert: one db.add per installment"""
+    for row in schedule_to_rows(schedule, loan_ids):
+        db.add(RepaymentSchedule(**row))
+    db.flush()
+    return []
+
+
+def approval_ms(db: Session, borrower_id: int, term: int, repeat: int) -> float:
+    """Median milliseconds to approve one application with the given term"""
+    timings = []
+    for _ in range(repeat):
+        application = LoanApplication(
+            applicant_id=borrower_id, loan_type=LoanType.MORTGAGE, loan_amount=250000, interest_rate=4.5,
+            loan_term_months=term, status=LoanStatus.PENDING
+        )
+        db.add(application)
+        db.commit()
+        started = time.perf_counter()
+        LoanService.approve_loan(db, application.id)
+        timings.append((time.perf_counter() - started) * 1000)
+        # approved objects would otherwise pile up in the identity map
+        db.expunge_all()
+    return statistics.median(timings)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Approval latency with per-row vs bulk schedule inserts")
+    parser.add_argument("--terms", type=int, nargs="+", default=[12, 60, 240, 360], help="loan terms in months")
+    parser.add_argument("--repeat", type=int, default=15, help="approvals timed per term and path")
+    args = parser.parse_args(argv)
+    # every installment is written on approval, which is what is being measured
+    settings.LAZY_REPAYMENT_SCHEDULES = False
+    Base.metadata.create_all(bind=engine)
+    bulk_insert = LoanService.insert_repayment_schedules
+    
+    db = SessionLocal()
+    try:
+        borrower_id = UserService.create_user(db, UserCreate(
+            username="benchmark_borrower", email="benchmark_borrower@example.com",
+            full_name="Benchmark Borrower", password="benchmark-password"
+        )).id
+        print(f"median of {args.repeat} approvals, SQLite file database")
+        print(f"{'term (months)':>13} {'per-row ms':>11} {'bulk ms':>8} {'speedup':>8}")
+        for term in args.terms:
+            LoanService.insert_repayment_schedules = staticmethod(add_per_row)
+            try:
+                per_row = approval_ms(db, borrower_id, term, args.repeat)
+            finally:
+                LoanService.insert_repayment_schedules = staticmethod(bulk_insert)
+            bulk = approval_ms(db, borrower_id, term, args.repeat)
+            print(f"{term:13} {per_row:11.1f} {bulk:8.1f} {per_row / bulk:7.1f}x")
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+# login storm benchmark - GET /loans latency while a burst of logins runs argon2
+# run with: python -m app.jobs.benchmark_login_storm [--logins 100] [--readers 4]
+# serves the API with uvicorn on a local port against its own scratch SQLite database; the
+# "request threadpool" mode hashes on the threadpool the sync routes used before the hashing pool
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+_scratch_dir = tempfile.mkdtemp(prefix="login_storm_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_scratch_dir, 'benchmark.db')}"
+
+import httpx  # noqa: E402
+import uvicorn  # noqa: E402
+from starlette.concurrency import run_in_threadpool  # noqa: E402
+
+from app.config import settings  # noqa: E402
+from app.database import SessionLocal  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models.loan import LoanApplication, LoanStatus, LoanType  # noqa: E402
+from app.schemas.user import UserCreate  # noqa: E402
+from app.services.user_service import UserService  # noqa: E402
+from app.utils.auth import password_hasher_pool  # noqa: E402
+
+PASSWORD = "login-storm-password"
+
+
+def seed():
+    """One borrower with a page of loan applications to read"""
+    db = SessionLocal()
+    try:
+        user = UserService.create_user(db, UserCreate(
+            username="storm_user", email="storm_user@example.com", full_name="Storm User", password=PASSWORD
+        ))
+        db.add_all([
+            LoanApplication(
+                applicant_id=user.id, loan_type=LoanType.PERSONAL, loan_amount=5000 + i, interest_rate=12.5,
+                loan_term_months=12, status=LoanStatus.PENDING
+            )
+            for i in range(10)
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+
+def serve() -> str:
+    """Start uvicorn on a free local port in a background thread; its base URL"""
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}"
+
+
+async def storm(base_url: str, logins: int, readers: int) -> tuple:
+    """Fire logins all at once while readers poll GET /loans; (read latencies in ms, login status codes)"""
+    prefix = settings.API_V1_PREFIX
+    limits = httpx.Limits(max_connections=logins + readers)
+    async with httpx.AsyncClient(base_url=base_url, timeout=None, limits=limits) as client:
+        done = asyncio.Event()
+        latencies = []
+        
+        async def read():
+            while not done.is_set():
+                started = time.perf_counter()
+                response = await client.get(f"{prefix}/loans", params={"limit": 10})
+                latencies.append((time.perf_counter() - started) * 1000)
+                response.raise_for_status()
+        
+        async def login():
+            response = await client.post(f"{prefix}/auth/login", data={"username": "storm_user", "password": PASSWORD})
+            return response.status_code
+        
+        reader_tasks = [asyncio.create_task(read()) for _ in range(readers)]
+        # a quiet second first, so the baseline reads are in the sample too
+        await asyncio.sleep(1)
+        statuses = Counter(await asyncio.gather(*(login() for _ in range(logins))))
+        done.set()
+        await asyncio.gather(*reader_tasks)
+    return latencies, statuses
+
+
+def percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="GET /loans latency during a login storm")
+    parser.add_argument("--logins", type=int, default=100, help="logins fired at once")
+    parser.add_argument("--readers", type=int, default=4, help="clients polling GET /loans")
+    args = parser.parse_args(argv)
+    seed()
+    base_url = serve()
+    print(f"{args.logins} concurrent logins, {args.readers} readers, {os.cpu_count()} CPU(s)")
+    print(
+        f"hashing pool: {settings.PASSWORD_HASH_WORKERS} workers, queue {settings.PASSWORD_HASH_MAX_QUEUE}; "
+        f"argon2 t={settings.ARGON2_TIME_COST} m={settings.ARGON2_MEMORY_COST} KiB p={settings.ARGON2_PARALLELISM}"
+    )
+    print(f"{'mode':20} {'reads':>6} {'p50 ms':>8} {'p99 ms':>9} {'max ms':>9} {'storm s':>8}  logins")
+    for mode in ("request threadpool", "hashing pool"):
+        if mode == "request threadpool":
+            password_hasher_pool.run = lambda fn, *args: run_in_threadpool(fn, *args)
+        started = time.perf_counter()
+        try:
+            latencies, statuses = asyncio.run(storm(base_url, args.logins, args.readers))
+        finally:
+            # back to the class method
+            vars(password_hasher_pool).pop("run", None)
+        elapsed = time.perf_counter() - started
+        print(
+            f"{mode:20} {len(latencies):6} {statistics.median(latencies):8.1f} {percentile(latencies, 0.99):9.1f} "
+            f"{max(latencies):9.1f} {elapsed:8.1f}  {dict(statuses)}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+# schedule memory benchmark - bytes per installment for ORM objects, response dicts and CompactSchedule
+# run with: python -m app.jobs.benchmark_schedule_memory [--loans 100] [--term 360]
+# uses its own in-memory SQLite database, so it never touches application data
+import argparse
+import gc
+import sys
+import tracemalloc
+from datetime import datetime
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+
+from app.database import Base
+from app.models.payment import RepaymentSchedule
+from app.utils.loan_calculator import (
+    amortize_loans, generate_compact_schedule, generate_repayment_schedule, schedule_to_rows
+)
+
+
+def allocated(build) -> tuple:
+    """(result of build(), bytes it holds once built, garbage collected)"""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Memory held per installment by each schedule representation")
+    parser.add_argument("--loans", type=int, default=100, help="loans held at once")
+    parser.add_argument("--term", type=int, default=360, help="term of each loan in months")
+    args = parser.parse_args(argv)
+    start = datetime(2026, 1, 31)
+    installments = args.loans * args.term
+    
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    with Session(engine) as session:
+        table = amortize_loans([250000.0 + i for i in range(args.loans)], 4.5, args.term, start)
+        session.execute(insert(RepaymentSchedule), schedule_to_rows(table, list(range(1, args.loans + 1))))
+        session.commit()
+        
+        def loaded():
+            return session.scalars(select(RepaymentSchedule)).all()
+        
+        def transient():
+            return [
+                generate_repayment_schedule(250000.0 + i, 4.5, args.term, i + 1, start)
+                for i in range(args.loans)
+            ]
+        
+        def compact():
+            return [
+                generate_compact_schedule(250000.0 + i, 4.5, args.term, i + 1, start, start)
+                for i in range(args.loans)
+            ]
+        
+        def rows():
+            return [schedule.to_rows() for schedule in compact()]
+        
+        print(f"{args.loans} loans x {args.term} installments")
+        print(f"{'representation':34} {'bytes/installment':>18} {'total MB':>9}")
+        for name, build in (
+            ("RepaymentSchedule, loaded", loaded),
+            ("RepaymentSchedule, transient", transient),
+            ("response dicts", rows),
+            ("CompactSchedule", compact),
+        ):
+            _, size = allocated(build)
+            print(f"{name:34} {size / installments:18.0f} {size / 2 ** 20:9.1f}")
+            # loaded objects stay in the identity map until expunged
+            session.expunge_all()
+        arrays = sum(schedule.nbytes for schedule in compact())
+        print(f"{'CompactSchedule arrays only':34} {arrays / installments:18.0f} {arrays / 2 ** 20:9.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
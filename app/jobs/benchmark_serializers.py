@@ -0,0 +1,121 @@
+# serializer benchmark - response_model validation vs the row serializers on list pages
+# run with: python -m app.jobs.benchmark_serializers [--rows 10 100 1000] [--repeat 5]
+# uses its own in-memory SQLite database, so it never touches application data
+import argparse
+import json
+import sys
+import timeit
+from datetime import datetime, timedelta
+from typing import Union
+
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+
+from app.database import Base
+from app.models.loan import LoanApplication, LoanStatus, LoanType
+from app.models.payment import PaymentStatus, RepaymentSchedule
+from app.models.user import User, UserRole
+from app.schemas.loan import LoanApplicationPage, LoanApplicationResponse
+from app.schemas.payment import RepaymentSchedulePage, RepaymentScheduleResponse
+from app.schemas.user import UserPage, UserResponse
+from app.services.loan_service import LOAN_APPLICATION_SERIALIZER
+from app.services.payment_service import REPAYMENT_SCHEDULE_SERIALIZER
+from app.services.user_service import USER_SERIALIZER
+
+
+def seed(session: Session, count: int):
+    """Insert count users, loan applications and installments"""
+    now = datetime.utcnow()
+    session.execute(insert(User), [
+        {
+            "username": f"user{i}", "email": f"user{i}@example.com", "full_name": f"User {i}",
+            "phone_number": "+254700000000", "hashed_password": "x" * 60, "role": UserRole.CUSTOMER,
+            "is_active": True, "is_superuser": False, "created_at": now
+        }
+        for i in range(count)
+    ])
+    session.execute(insert(LoanApplication), [
+        {
+            "applicant_id": 1, "loan_type": LoanType.PERSONAL, "loan_amount": 5000.0 + i, "interest_rate": 12.5,
+            "loan_term_months": 12, "purpose": "School fees", "status": LoanStatus.PENDING, "created_at": now
+        }
+        for i in range(count)
+    ])
+    session.execute(insert(RepaymentSchedule), [
+        {
+            "loan_id": 1, "installment_number": i + 1, "due_date": now + timedelta(days=30 * (i + 1)),
+            "amount_due": 445.42, "principal_component": 393.33, "interest_component": 52.09,
+            "amount_paid": 0.0, "status": PaymentStatus.PENDING, "created_at": now
+        }
+        for i in range(count)
+    ])
+    session.commit()
+
+
+def cases() -> list:
+    """(name, model, response type the endpoint declares, row serializer)"""
+    return [
+        ("users", User, Union[list[UserResponse], UserPage], USER_SERIALIZER),
+        ("loan_applications", LoanApplication, Union[list[LoanApplicationResponse], LoanApplicationPage],
+         LOAN_APPLICATION_SERIALIZER),
+        ("repayment_schedules", RepaymentSchedule, Union[list[RepaymentScheduleResponse], RepaymentSchedulePage],
+         REPAYMENT_SCHEDULE_SERIALIZER),
+    ]
+
+
+def best_per_call(function, repeat: int) -> float:
+    # seconds per call, best of repeat timing runs
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compare list response serialization paths")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10, 100, 1000], help="page sizes to measure")
+    parser.add_argument("--repeat", type=int, default=5, help="timing runs per measurement (best is reported)")
+    args = parser.parse_args()
+    
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    session = Session(engine)
+    seed(session, max(args.rows))
+    
+    print(f"{'':26} {'query + encode':^32}  {'encode only':^32}")
+    print(f"{'table':20} {'rows':>5} {'pydantic':>10} {'serializer':>11} {'speedup':>9}  "
+          f"{'pydantic':>10} {'serializer':>11} {'speedup':>9}")
+    for name, model, response_type, serializer in cases():
+        adapter = TypeAdapter(response_type)
+        for count in args.rows:
+            orm_stmt = select(model).order_by(model.id).limit(count)
+            row_stmt = select(*serializer.columns).order_by(model.id).limit(count)
+            objects = session.execute(orm_stmt).scalars().all()
+            rows = session.execute(row_stmt).all()
+            if json.loads(adapter.dump_json(adapter.validate_python(objects))) != json.loads(serializer.dumps(rows)):
+                raise RuntimeError(f"{name}: row serializer output differs from {response_type}")
+            
+            # what FastAPI does for response_model: validate the ORM objects, then dump to JSON
+            def current():
+                session.expunge_all()
+                objects = session.execute(orm_stmt).scalars().all()
+                return adapter.dump_json(adapter.validate_python(objects))
+            
+            def fast():
+                return serializer.dumps(session.execute(row_stmt).all())
+            
+            current_total = best_per_call(current, args.repeat)
+            fast_total = best_per_call(fast, args.repeat)
+            current_encode = best_per_call(lambda: adapter.dump_json(adapter.validate_python(objects)), args.repeat)
+            fast_encode = best_per_call(lambda: serializer.dumps(rows), args.repeat)
+            print(
+                f"{name:20} {count:>5} {current_total * 1e3:>8.3f}ms {fast_total * 1e3:>9.3f}ms "
+                f"{current_total / fast_total:>8.1f}x  {current_encode * 1e3:>8.3f}ms {fast_encode * 1e3:>9.3f}ms "
+                f"{current_encode / fast_encode:>8.1f}x"
+            )
+    session.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+# concurrent payment check - many threads paying one installment must not lose an update
+# run with: python -m app.jobs.check_concurrent_payments [--threads N] [--payments N] (exit code 1 when a check fails)
+# uses its own scratch SQLite database, so it never touches the configured one; SQLite ignores
+# SELECT ... FOR UPDATE, so there the version column (optimistic locking) is what is being checked
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+_scratch_dir = tempfile.mkdtemp(prefix="concurrent_payments_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_scratch_dir, 'check.db')}"
+
+from fastapi import HTTPException  # noqa: E402
+from sqlalchemy import func, select  # noqa: E402
+
+from app.config import settings  # noqa: E402
+from app.database import Base, SessionLocal, engine  # noqa: E402
+from app.models.loan import Loan, LoanApplication, LoanStatus, LoanType  # noqa: E402
+from app.models.payment import Payment, RepaymentSchedule  # noqa: E402
+from app.schemas.user import UserCreate  # noqa: E402
+from app.services.loan_service import LoanService  # noqa: E402
+from app.services.payment_service import PaymentService  # noqa: E402
+from app.services.user_service import UserService  # noqa: E402
+
+
+def seed() -> tuple:
+    """One approved loan; (loan id, ids of its first two installments)"""
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        user = UserService.create_user(db, UserCreate(
+            username="concurrency_check", email="concurrency_check@example.com",
+            full_name="Concurrency Check", password="concurrency-check-password"
+        ))
+        application = LoanApplication(
+            applicant_id=user.id, loan_type=LoanType.PERSONAL, loan_amount=120000, interest_rate=10.0,
+            loan_term_months=12, status=LoanStatus.PENDING
+        )
+        db.add(application)
+        db.commit()
+        LoanService.approve_loan(db, application.id)
+        loan_id = db.scalar(select(Loan.id).where(Loan.application_id == application.id))
+        schedule_ids = db.scalars(
+            select(RepaymentSchedule.id).where(RepaymentSchedule.loan_id == loan_id)
+            .order_by(RepaymentSchedule.installment_number).limit(2)
+        ).all()
+        return loan_id, schedule_ids
+    finally:
+        db.close()
+
+
+def race(threads: int, pay) -> Counter:
+    """Start pay(thread_index) on every thread at once; outcomes counted by status code"""
+    outcomes = Counter()
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+    
+    def worker(index: int):
+        db = SessionLocal()
+        try:
+            barrier.wait()
+            for outcome in pay(db, index):
+                with lock:
+                    outcomes[outcome] += 1
+        finally:
+            db.close()
+    
+    workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return outcomes
+
+
+def attempt(db, schedule_id: int, amount: float, reference: str):
+    try:
+        PaymentService.make_payment(db, schedule_id, amount, "card", reference)
+        return 200
+    except HTTPException as exc:
+        db.rollback()
+        return exc.status_code
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Pay one installment from many threads at once")
+    parser.add_argument("--threads", type=int, default=8, help="concurrent payers")
+    parser.add_argument("--payments", type=int, default=5, help="payments per thread")
+    args = parser.parse_args(argv)
+    # enough retries that every payment gets through despite the contention (the backoff doubles per try)
+    settings.CONCURRENCY_RETRY_ATTEMPTS = max(settings.CONCURRENCY_RETRY_ATTEMPTS, 10)
+    loan_id, (first_id, second_id) = seed()
+    failures = 0
+    
+    def check(name: str, ok: bool, detail: str = ""):
+        nonlocal failures
+        print(f"{'ok' if ok else 'WRONG':5}  {name}{f'  ({detail})' if detail else ''}")
+        failures += not ok
+    
+    db = SessionLocal()
+    try:
+        first = db.get(RepaymentSchedule, first_id)
+        loan = db.get(Loan, loan_id)
+        outstanding_before, version_before = loan.outstanding_balance, first.version
+        # equal cent amounts that together stay below the installment
+        amount = int(first.amount_due * 100 / (args.threads * args.payments + 1)) / 100
+        db.rollback()
+        
+        # many small payments on one installment: every applied one must be counted once
+        started = time.perf_counter()
+        outcomes = race(args.threads, lambda session, index: [
+            attempt(session, first_id, amount, f"concurrent-{index}-{n}") for n in range(args.payments)
+        ])
+        elapsed = (time.perf_counter() - started) * 1000
+        applied = outcomes[200]
+        print(f"       {args.threads} threads x {args.payments} payments of {amount} in {elapsed:.0f} ms: {dict(outcomes)}")
+        db.expire_all()
+        first = db.get(RepaymentSchedule, first_id)
+        loan = db.get(Loan, loan_id)
+        ledger = db.execute(
+            select(func.count(), func.coalesce(func.sum(Payment.amount), 0.0)).where(Payment.schedule_id == first_id)
+        ).one()
+        expected = round(applied * amount, 2)
+        check("every payment applied", applied == args.threads * args.payments, f"{applied} applied")
+        check("installment amount_paid is exact", round(first.amount_paid, 2) == expected, f"{first.amount_paid} vs {expected}")
+        check("one ledger row per applied payment", ledger[0] == applied and round(ledger[1], 2) == expected)
+        check("loan total_paid is exact", round(loan.total_paid, 2) == expected, f"{loan.total_paid}")
+        check(
+            "loan outstanding_balance is exact", round(outstanding_before - loan.outstanding_balance, 2) == expected,
+            f"{loan.outstanding_balance}"
+        )
+        check("installment version bumped once per payment", first.version == version_before + applied, f"version {first.version}")
+        
+        # every thread pays the whole second installment: exactly one may succeed
+        second = db.get(RepaymentSchedule, second_id)
+        full_amount = round(second.amount_due, 2)
+        db.rollback()
+        outcomes = race(args.threads, lambda session, index: [
+            attempt(session, second_id, full_amount, f"settle-{index}")
+        ])
+        print(f"       {args.threads} threads settling one installment: {dict(outcomes)}")
+        db.expire_all()
+        second = db.get(RepaymentSchedule, second_id)
+        check("exactly one full payment applied", outcomes[200] == 1, f"{outcomes[200]} applied")
+        check("the rest rejected as exceeding the balance", outcomes[400] == args.threads - 1)
+        check("installment paid once", round(second.amount_paid, 2) == full_amount, f"{second.amount_paid}")
+        loan = db.get(Loan, loan_id)
+        check(
+            "loan totals include both races", round(loan.total_paid, 2) == round(expected + full_amount, 2),
+            f"{loan.total_paid}"
+        )
+    finally:
+        db.close()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
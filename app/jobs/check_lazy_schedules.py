@@ -0,0 +1,160 @@
+# lazy schedule check - compares computed installments with stored ones and measures what lazy approval saves
+# run with: python -m app.jobs.check_lazy_schedules [--loans N] [--term MONTHS] (exit code 1 when a check fails)
+# uses its own scratch SQLite database, so it never touches the configured one
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+_scratch_dir = tempfile.mkdtemp(prefix="lazy_schedules_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_scratch_dir, 'check.db')}"
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import delete, func, select  # noqa: E402
+
+from app.config import settings  # noqa: E402
+from app.database import SessionLocal  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models.loan import Loan, LoanApplication, LoanStatus, LoanType  # noqa: E402
+from app.models.payment import RepaymentSchedule  # noqa: E402
+from app.models.user import UserRole  # noqa: E402
+from app.schemas.user import UserCreate  # noqa: E402
+from app.services.analytics_service import AnalyticsService  # noqa: E402
+from app.services.loan_service import LoanService  # noqa: E402
+from app.services.payment_service import PaymentService  # noqa: E402
+from app.services.user_service import UserService  # noqa: E402
+from app.utils.loan_calculator import virtual_schedule_id  # noqa: E402
+
+PASSWORD = "lazy-check-password"
+# fields that must match between a stored installment and its computed twin
+COMPARED = ("installment_number", "due_date", "amount_due", "principal_component", "interest_component", "status", "amount_paid")
+
+
+def approve(db, borrower_id: int, count: int, term: int, lazy: bool) -> tuple:
+    """Approve count mortgages in one batch; (loan ids, seconds, installment rows written)"""
+    applications = [
+        LoanApplication(
+            applicant_id=borrower_id, loan_type=LoanType.MORTGAGE, loan_amount=250000 + i * 1000,
+            interest_rate=4.5, loan_term_months=term, status=LoanStatus.PENDING
+        )
+        for i in range(count)
+    ]
+    db.add_all(applications)
+    db.commit()
+    rows_before = db.scalar(select(func.count()).select_from(RepaymentSchedule))
+    settings.LAZY_REPAYMENT_SCHEDULES = lazy
+    started = time.perf_counter()
+    LoanService.approve_loans(db, [a.id for a in applications])
+    elapsed = time.perf_counter() - started
+    rows_written = db.scalar(select(func.count()).select_from(RepaymentSchedule)) - rows_before
+    loan_ids = db.scalars(
+        select(Loan.id).where(Loan.application_id.in_([a.id for a in applications])).order_by(Loan.id)
+    ).all()
+    return loan_ids, elapsed, rows_written
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Check and measure lazily stored repayment schedules")
+    parser.add_argument("--loans", type=int, default=200, help="mortgages approved per mode")
+    parser.add_argument("--term", type=int, default=360, help="term of each mortgage in months")
+    args = parser.parse_args(argv)
+    prefix = settings.API_V1_PREFIX
+    failures = 0
+    
+    def check(name: str, ok: bool, detail: str = ""):
+        nonlocal failures
+        print(f"{'ok' if ok else 'WRONG':5}  {name}{f'  ({detail})' if detail else ''}")
+        failures += not ok
+    
+    with TestClient(app, raise_server_exceptions=False) as client:
+        db = SessionLocal()
+        try:
+            admin = UserService.create_user(db, UserCreate(
+                username="lazy_admin", email="lazy_admin@example.com", full_name="Lazy Admin",
+                password=PASSWORD, role=UserRole.ADMIN
+            ))
+            eager_ids, eager_seconds, eager_rows = approve(db, admin.id, args.loans, args.term, lazy=False)
+            lazy_ids, lazy_seconds, lazy_rows = approve(db, admin.id, args.loans, args.term, lazy=True)
+            print(f"       eager approval: {eager_rows} installment rows, {eager_seconds * 1000:.0f} ms for {args.loans} loans")
+            print(f"       lazy approval:  {lazy_rows} installment rows, {lazy_seconds * 1000:.0f} ms for {args.loans} loans")
+            check("lazy approval stores no installments", lazy_rows == 0)
+            
+            # the stored schedule of an eager loan is the reference: drop it and read it back computed
+            reference_id = eager_ids[0]
+            stored = client.get(f"{prefix}/payments/loan/{reference_id}/schedule?limit={args.term}").json()
+            db.execute(delete(RepaymentSchedule).where(RepaymentSchedule.loan_id == reference_id))
+            db.commit()
+            started = time.perf_counter()
+            computed = client.get(f"{prefix}/payments/loan/{reference_id}/schedule?limit={args.term}").json()
+            elapsed = (time.perf_counter() - started) * 1000
+            mismatched = [
+                s["installment_number"] for s, c in zip(stored, computed)
+                if any(s[field] != c[field] for field in COMPARED)
+            ]
+            check(
+                "computed schedule equals the stored one", len(stored) == len(computed) == args.term and not mismatched,
+                f"{len(computed)} installments, {len(mismatched)} differ, read in {elapsed:.1f} ms"
+            )
+            check("computed installments carry virtual ids", computed[0]["id"] == virtual_schedule_id(reference_id, 1))
+            
+            loan_id = lazy_ids[0]
+            paged, cursor = [], ""
+            while cursor is not None:
+                page = client.get(f"{prefix}/payments/loan/{loan_id}/schedule", params={"cursor": cursor, "limit": 50}).json()
+                paged.extend(item["installment_number"] for item in page["items"])
+                cursor = page["next_cursor"]
+            check("cursor pages cover every installment once", paged == list(range(1, args.term + 1)), f"{len(paged)} installments")
+            window = client.get(f"{prefix}/payments/loan/{loan_id}/schedule?skip=10&limit=5").json()
+            check("skip / limit window", [s["installment_number"] for s in window] == [11, 12, 13, 14, 15])
+            settings.FAST_LIST_SERIALIZATION = True
+            fast = client.get(f"{prefix}/payments/loan/{loan_id}/schedule?skip=10&limit=5").json()
+            settings.FAST_LIST_SERIALIZATION = False
+            check("fast serialization returns the same installments", fast == window)
+            
+            # pay a computed installment: it gets a row, the virtual id keeps working
+            virtual_id = virtual_schedule_id(loan_id, 1)
+            payment = {"amount": 100.0, "payment_method": "card", "transaction_reference": "lazy-check-1"}
+            headers = {"Authorization": "Bearer " + client.post(
+                f"{prefix}/auth/login", data={"username": "lazy_admin", "password": PASSWORD}
+            ).json()["access_token"]}
+            paid = client.post(f"{prefix}/payments/schedule/{virtual_id}/pay", params=payment, headers=headers)
+            check("payment on a virtual id", paid.status_code == 200 and paid.json()["schedule_id"] > 0, paid.text[:120])
+            replay = client.post(f"{prefix}/payments/schedule/{virtual_id}/pay", params=payment, headers=headers)
+            check("retry with the same reference replays", replay.status_code == 200 and replay.json() == paid.json(), replay.text[:120])
+            detail = client.get(f"{prefix}/payments/schedule/{virtual_id}").json()
+            check("virtual id reads the stored row", detail.get("amount_paid") == 100.0 and detail.get("id") == paid.json()["schedule_id"])
+            rows = db.scalar(select(func.count()).where(RepaymentSchedule.loan_id == loan_id))
+            check("only the paid installment is stored", rows == 1, f"{rows} rows")
+            loan_detail = client.get(f"{prefix}/loans/disbursed/{loan_id}").json()
+            check("loan detail lists the whole schedule", len(loan_detail.get("repayments", [])) == args.term)
+            history = client.get(f"{prefix}/payments/loan/{loan_id}/history").json()
+            check("history lists the whole schedule", len(history) == args.term and history[0]["amount_paid"] == 100.0)
+            
+            # a sweep 100 days on stores what can turn overdue, then reconcile and rebuild must agree
+            start = db.scalar(select(Loan.start_date).where(Loan.id == loan_id))
+            sweep = PaymentService.sweep_delinquencies(db, now=start + timedelta(days=100))
+            print(f"       sweep at +100 days: {sweep}")
+            check("sweep stores the installments it moves", sweep["stored"] > 0 and sweep["late"] > 0)
+            report = PaymentService.reconcile_loan_balances(db)
+            check("running totals reconcile with stored and computed installments", report["mismatched"] == 0, f"{report['checked']} loans")
+            before = client.get(f"{prefix}/analytics/portfolio").json()
+            AnalyticsService.rebuild(db)
+            after = client.get(f"{prefix}/analytics/portfolio").json()
+            # sums run in a different order, so months are compared to the cent
+            cents = lambda months: [(m["month"], round(m["amount_due"], 2), round(m["amount_paid"], 2)) for m in months]
+            check(
+                "rebuilt analytics match the incremental figures",
+                before["totals"] == after["totals"] and cents(before["cash_flow"]) == cents(after["cash_flow"]),
+                f"{len(after['cash_flow'])} months"
+            )
+            stored_rows = db.scalar(select(func.count()).select_from(RepaymentSchedule).where(RepaymentSchedule.loan_id.in_(lazy_ids)))
+            print(f"       lazy loans now store {stored_rows} of {args.loans * args.term} installments")
+        finally:
+            db.close()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+# query budget check - fails when a read endpoint runs more SQL statements than its query_budget
+# run with: python -m app.jobs.check_query_budgets (exit code 1 on an overrun)
+# uses its own scratch SQLite database, so it never touches the configured one
+import os
+import sys
+import tempfile
+
+_scratch_dir = tempfile.mkdtemp(prefix="query_budgets_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_scratch_dir, 'check.db')}"
+os.environ["QUERY_BUDGET_CHECK"] = "true"
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.config import settings  # noqa: E402
+from app.database import SessionLocal  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models.loan import Loan, LoanApplication, LoanStatus, LoanType  # noqa: E402
+from app.models.payment import RepaymentSchedule  # noqa: E402
+from app.schemas.user import UserCreate  # noqa: E402
+from app.services.loan_service import LoanService  # noqa: E402
+from app.services.payment_service import PaymentService  # noqa: E402
+from app.services.user_service import UserService  # noqa: E402
+from app.utils.loan_calculator import virtual_schedule_id  # noqa: E402
+
+# enough rows that a per-row query (N+1) would blow any fixed budget
+APPLICATIONS = 12
+LOANS = 3
+
+
+def seed() -> dict:
+    """A borrower with applications, approved loans and one payment"""
+    db = SessionLocal()
+    try:
+        user = UserService.create_user(db, UserCreate(
+            username="budget_check", email="budget_check@example.com",
+            full_name="Budget Check", password="budget-check-password"
+        ))
+        application_ids = []
+        for i in range(APPLICATIONS):
+            application = LoanApplication(
+                applicant_id=user.id, loan_type=LoanType.PERSONAL, loan_amount=5000 + i * 100,
+                interest_rate=10.0, loan_term_months=12, status=LoanStatus.PENDING
+            )
+            db.add(application)
+            db.commit()
+            application_ids.append(application.id)
+        for application_id in application_ids[:LOANS]:
+            LoanService.approve_loan(db, application_id)
+        loan_ids = [loan_id for (loan_id,) in db.query(Loan.id).order_by(Loan.id)]
+        # the first installment by its virtual id, which also works for stored schedules
+        PaymentService.make_payment(db, virtual_schedule_id(loan_ids[0], 1), 100.0, "card", "budget-check-1")
+        schedule_id = db.query(RepaymentSchedule.id).filter(
+            RepaymentSchedule.loan_id == loan_ids[0], RepaymentSchedule.installment_number == 1
+        ).scalar()
+        return {
+            "user_id": user.id, "application_id": application_ids[0],
+            "loan_id": loan_ids[0], "loan_ids": loan_ids, "schedule_id": schedule_id
+        }
+    finally:
+        db.close()
+
+
+def budgeted_requests(ids: dict) -> dict:
+    """One request per route that declares a query_budget"""
+    prefix = settings.API_V1_PREFIX
+    return {
+        "GET /users/{id}": f"{prefix}/users/{ids['user_id']}",
+        "GET /users": f"{prefix}/users?limit=50",
+        "GET /loans/{id}": f"{prefix}/loans/{ids['application_id']}",
+        "GET /loans": f"{prefix}/loans?limit=50",
+        "GET /loans/user/{id}": f"{prefix}/loans/user/{ids['user_id']}?limit=50",
+        "GET /loans/disbursed/{id}": f"{prefix}/loans/disbursed/{ids['loan_id']}",
+        "GET /payments/loan/{id}/schedule": f"{prefix}/payments/loan/{ids['loan_id']}/schedule?limit=50",
+        "GET /payments/schedule/{id}": f"{prefix}/payments/schedule/{ids['schedule_id']}",
+        "GET /payments/loan/{id}/history": f"{prefix}/payments/loan/{ids['loan_id']}/history",
+        "GET /payments/loan/{id}/balance": f"{prefix}/payments/loan/{ids['loan_id']}/balance",
+        "GET /payments/balances": f"{prefix}/payments/balances?"
+        + "&".join(f"loan_ids={loan_id}" for loan_id in ids["loan_ids"]),
+        "GET /analytics/portfolio": f"{prefix}/analytics/portfolio",
+    }
+
+
+def main() -> int:
+    ids = seed()
+    failures = 0
+    with TestClient(app, raise_server_exceptions=False) as client:
+        for name, url in budgeted_requests(ids).items():
+            response = client.get(url)
+            if response.status_code == 500 and "statements" in response.json():
+                body = response.json()
+                print(f"{'OVER':5}  {name}  {body['detail']}")
+                for statement in body["statements"]:
+                    print(f"       {' '.join(statement.split())[:160]}")
+                failures += 1
+            elif response.status_code != 200:
+                print(f"{'ERROR':5}  {name}  status {response.status_code}: {response.text[:200]}")
+                failures += 1
+            else:
+                print(f"{'ok':5}  {name}  {response.headers['X-Query-Count']} queries")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+# query plan check - fails when a hot query would scan a whole table
+# run with: python -m app.jobs.check_query_plans (exit code 1 on a full scan)
+import sys
+from datetime import datetime
+
+from sqlalchemy import func, select, text
+
+from app.database import Base, engine
+from app.models.loan import Loan, LoanApplication, LoanStatus
+from app.models.payment import Payment, PaymentStatus, RepaymentSchedule
+from app.models.user import User
+from app.utils.pagination import apply_keyset, encode_cursor
+
+
+def hot_queries(dialect_name: str) -> dict:
+    """The query shapes issued by the services on every request path"""
+    now = datetime.utcnow()
+    return {
+        "users keyset page": apply_keyset(
+            select(User), [User.created_at, User.id], encode_cursor(now, 1), 10, dialect_name
+        ),
+        "user by username": select(User).where(User.username == "someone"),
+        "loan applications keyset page": apply_keyset(
+            select(LoanApplication), [LoanApplication.created_at, LoanApplication.id],
+            encode_cursor(now, 1), 10, dialect_name
+        ),
+        "applicant loan applications page": apply_keyset(
+            select(LoanApplication).where(LoanApplication.applicant_id == 1),
+            [LoanApplication.created_at, LoanApplication.id], encode_cursor(now, 1), 10, dialect_name
+        ),
+        "loan applications by status": select(LoanApplication).where(LoanApplication.status == LoanStatus.PENDING),
+        "loans by borrower": select(Loan).where(Loan.borrower_id == 1),
+        "schedule keyset page": apply_keyset(
+            select(RepaymentSchedule).where(RepaymentSchedule.loan_id == 1),
+            [RepaymentSchedule.loan_id, RepaymentSchedule.installment_number],
+            encode_cursor(1, 12), 10, dialect_name
+        ),
+        "loan balance": select(
+            func.sum(RepaymentSchedule.amount_due), func.sum(RepaymentSchedule.amount_paid)
+        ).where(RepaymentSchedule.loan_id == 1),
+        "loan running totals": select(Loan.outstanding_balance, Loan.total_paid).where(Loan.id.in_([1, 2])),
+        "overdue installments": select(RepaymentSchedule.id).where(
+            RepaymentSchedule.status == PaymentStatus.PENDING,
+            RepaymentSchedule.due_date < now
+        ),
+        "payments by loan": select(Payment).where(Payment.loan_id == 1),
+    }
+
+
+def full_scans(connection, stmt) -> list:
+    """Return the plan lines that read an entire table"""
+    dialect_name = connection.dialect.name
+    compiled = stmt.compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True})
+    if dialect_name == "sqlite":
+        plan = [row[-1] for row in connection.execute(text(f"EXPLAIN QUERY PLAN {compiled}"))]
+        return [line for line in plan if line.startswith("SCAN ") and " USING " not in line]
+    if dialect_name == "postgresql":
+        # small test tables make seq scans cheap, so tell the planner to avoid them if it can
+        connection.execute(text("SET LOCAL enable_seqscan = off"))
+        plan = [row[0] for row in connection.execute(text(f"EXPLAIN {compiled}"))]
+        return [line for line in plan if "Seq Scan" in line]
+    raise RuntimeError(f"Query plan check is not implemented for {dialect_name}")
+
+
+def main() -> int:
+    Base.metadata.create_all(bind=engine)
+    failures = 0
+    with engine.begin() as connection:
+        for name, stmt in hot_queries(connection.dialect.name).items():
+            scans = full_scans(connection, stmt)
+            print(f"{'FULL SCAN' if scans else 'ok':9}  {name}")
+            for line in scans:
+                print(f"           {line.strip()}")
+            failures += bool(scans)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+# replica routing check - runs the API against two SQLite files standing in for a primary and a replica
+# run with: python -m app.jobs.check_replica_routing (exit code 1 when a read is routed wrongly)
+# the replica is a snapshot of the primary that never catches up, so every read shows where it went
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+_scratch_dir = tempfile.mkdtemp(prefix="replica_routing_")
+PRIMARY_PATH = os.path.join(_scratch_dir, "primary.db")
+REPLICA_PATH = os.path.join(_scratch_dir, "replica.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{PRIMARY_PATH}"
+os.environ["DATABASE_REPLICA_URLS"] = f'["sqlite:///{REPLICA_PATH}"]'
+os.environ["REPLICA_STICKY_SECONDS"] = "1"
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.config import settings  # noqa: E402
+from app.database import SessionLocal, engine  # noqa: E402
+from app.main import app  # noqa: E402
+from app.schemas.user import UserCreate  # noqa: E402
+from app.services.user_service import UserService  # noqa: E402
+
+PASSWORD = "replica-check-password"
+
+
+def seed() -> int:
+    db = SessionLocal()
+    try:
+        return UserService.create_user(db, UserCreate(
+            username="replica_check", email="replica_check@example.com",
+            full_name="Before Update", password=PASSWORD
+        )).id
+    finally:
+        db.close()
+
+
+def snapshot_replica():
+    # the backup API copies a consistent image, including pages still in the primary's WAL
+    engine.dispose()
+    with sqlite3.connect(PRIMARY_PATH) as primary, sqlite3.connect(REPLICA_PATH) as replica:
+        primary.backup(replica)
+
+
+def main() -> int:
+    user_id = seed()
+    snapshot_replica()
+    prefix = settings.API_V1_PREFIX
+    failures = 0
+    
+    def check(name: str, response, expected_full_name: str):
+        nonlocal failures
+        full_name = response.json().get("full_name")
+        ok = full_name == expected_full_name
+        source = "primary" if full_name == "After Update" else "replica"
+        print(f"{'ok' if ok else 'WRONG':5}  {name}: read {full_name!r} from the {source}")
+        failures += not ok
+    
+    with TestClient(app, raise_server_exceptions=False) as client:
+        token = client.post(
+            f"{prefix}/auth/login", data={"username": "replica_check", "password": PASSWORD}
+        ).json()["access_token"]
+        writer = {"Authorization": f"Bearer {token}"}
+        
+        check("read before any write", client.get(f"{prefix}/users/{user_id}", headers=writer), "Before Update")
+        response = client.put(f"{prefix}/users/{user_id}", json={"full_name": "After Update"}, headers=writer)
+        if response.status_code != 200:
+            print(f"ERROR  update failed with status {response.status_code}: {response.text[:200]}")
+            return 1
+        check("writer reads right after writing", client.get(f"{prefix}/users/{user_id}", headers=writer), "After Update")
+        check("other callers read the replica", client.get(f"{prefix}/users/{user_id}"), "Before Update")
+        time.sleep(settings.REPLICA_STICKY_SECONDS + 0.1)
+        check(
+            f"writer reads the replica after {settings.REPLICA_STICKY_SECONDS:g}s",
+            client.get(f"{prefix}/users/{user_id}", headers=writer), "Before Update"
+        )
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,258 @@
+# sharding check - runs the API against a directory and three shard SQLite files, then rebalances
+# run with: python -m app.jobs.check_sharding (exit code 1 when a check fails)
+# the shard map starts on shard_0 and shard_1 only, as if shard_2 had just been added to SHARD_URLS
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+_scratch_dir = tempfile.mkdtemp(prefix="sharding_")
+SHARD_PATHS = [os.path.join(_scratch_dir, f"shard_{index}.db") for index in range(3)]
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_scratch_dir, 'directory.db')}"
+os.environ["SHARD_URLS"] = "[" + ", ".join(f'"sqlite:///{path}"' for path in SHARD_PATHS) + "]"
+os.environ["SHARD_BUCKETS"] = "16"
+os.environ["SHARD_MAP_REFRESH_SECONDS"] = "0"
+
+import pyarrow as pa  # noqa: E402
+import pyarrow.parquet as pq  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.config import settings  # noqa: E402
+from app.database import Base, SHARD_IDS, SessionLocal, engine, load_shard_map  # noqa: E402
+from app.jobs import export_tables, ingest_payments, rebalance_shards  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models.shard import ShardBucket  # noqa: E402
+from app.models.user import UserRole  # noqa: E402
+from app.schemas.user import UserCreate  # noqa: E402
+from app.services.shard_service import ShardService  # noqa: E402
+from app.services.user_service import UserService  # noqa: E402
+
+BORROWERS = 24
+APPLICATIONS_PER_BORROWER = 3
+PASSWORD = "sharding-check-password"
+
+
+def seed_directory() -> list:
+    """Users on the directory, and a shard map that leaves shard_2 empty"""
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        db.add_all(
+            ShardBucket(bucket=bucket, shard_id=SHARD_IDS[bucket % 2], moving=False)
+            for bucket in range(settings.SHARD_BUCKETS)
+        )
+        db.commit()
+        admin = UserService.create_user(db, UserCreate(
+            username="shard_admin", email="shard_admin@example.com", full_name="Shard Admin",
+            password=PASSWORD, role=UserRole.ADMIN
+        ))
+        # deleting users takes a superuser
+        admin.is_superuser = True
+        db.commit()
+        return [
+            UserService.create_user(db, UserCreate(
+                username=f"borrower_{i}", email=f"borrower_{i}@example.com",
+                full_name=f"Borrower {i}", password=PASSWORD
+            )).id
+            for i in range(BORROWERS)
+        ]
+    finally:
+        db.close()
+
+
+def shard_rows(query: str) -> dict:
+    # the same query on every shard file, straight through sqlite3
+    rows = {}
+    for shard_id, path in zip(SHARD_IDS, SHARD_PATHS):
+        with sqlite3.connect(path) as connection:
+            rows[shard_id] = connection.execute(query).fetchall()
+    return rows
+
+
+def main() -> int:
+    borrower_ids = seed_directory()
+    prefix = settings.API_V1_PREFIX
+    failures = 0
+    
+    def check(name: str, ok: bool, detail: str = ""):
+        nonlocal failures
+        print(f"{'ok' if ok else 'WRONG':5}  {name}{f'  ({detail})' if detail else ''}")
+        failures += not ok
+    
+    def check_tree(client, headers, stage: str):
+        current = load_shard_map()
+        # every row sits on its borrower's shard, and ids are unique across shards
+        misplaced = 0
+        for table, owner in (("loan_applications", "applicant_id"), ("loans", "borrower_id")):
+            for shard_id, rows in shard_rows(f"SELECT {owner} FROM {table}").items():
+                misplaced += sum(1 for (borrower_id,) in rows if current.shard_for(borrower_id) != shard_id)
+        check(f"{stage}: every application and loan is on its borrower's shard", misplaced == 0, f"{misplaced} misplaced")
+        for table in ("loan_applications", "loans", "repayment_schedules", "payments"):
+            ids = [row[0] for rows in shard_rows(f"SELECT id FROM {table}").values() for row in rows]
+            check(f"{stage}: {table} ids unique across shards", len(ids) == len(set(ids)), f"{len(ids)} rows")
+        counts = {shard_id: len(rows) for shard_id, rows in shard_rows("SELECT id FROM loans").items()}
+        print(f"       loans per shard: {counts}")
+        
+        # fan-out reads match the union of the shards
+        expected = [
+            row[1] for row in sorted(
+                row for rows in shard_rows("SELECT created_at, id FROM loan_applications").values() for row in rows
+            )
+        ]
+        started = time.perf_counter()
+        listed = [item["id"] for item in client.get(f"{prefix}/loans?limit=1000").json()]
+        elapsed = (time.perf_counter() - started) * 1000
+        check(f"{stage}: GET /loans merges every shard in order", listed == expected, f"{len(listed)} rows, {elapsed:.1f} ms")
+        paged, cursor = [], ""
+        while cursor is not None:
+            page = client.get(f"{prefix}/loans", params={"cursor": cursor, "limit": 7}).json()
+            paged.extend(item["id"] for item in page["items"])
+            cursor = page["next_cursor"]
+        check(f"{stage}: cursor pages cover every application once", paged == expected, f"{len(paged)} rows")
+        loan_ids = [row[0] for rows in shard_rows("SELECT id FROM loans").values() for row in rows]
+        portfolio = client.get(f"{prefix}/analytics/portfolio").json()
+        check(
+            f"{stage}: portfolio counts loans on every shard",
+            portfolio["totals"]["loan_count"] == len(loan_ids), f"{portfolio['totals']['loan_count']} loans"
+        )
+        balances = client.get(f"{prefix}/payments/balances", params={"loan_ids": loan_ids}).json()
+        check(f"{stage}: balances found for every loan", len(balances) == len(loan_ids), f"{len(balances)} balances")
+        return loan_ids
+    
+    with TestClient(app, raise_server_exceptions=False) as client:
+        token = client.post(
+            f"{prefix}/auth/login", data={"username": "shard_admin", "password": PASSWORD}
+        ).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        
+        application_ids = []
+        for borrower_id in borrower_ids:
+            for i in range(APPLICATIONS_PER_BORROWER):
+                response = client.post(f"{prefix}/loans", headers=headers, json={
+                    "applicant_id": borrower_id, "loan_type": "personal",
+                    "requested_amount": 5000 + i * 1000, "loan_term_months": 12
+                })
+                if response.status_code != 201:
+                    print(f"ERROR  create failed with status {response.status_code}: {response.text[:200]}")
+                    return 1
+                application_ids.append(response.json()["id"])
+        # one approval per borrower on its own, the rest in a batch spanning every shard
+        statuses = [
+            client.post(f"{prefix}/loans/{application_id}/approve", headers=headers).status_code
+            for application_id in application_ids[::APPLICATIONS_PER_BORROWER]
+        ]
+        check("single approvals on each borrower's shard", set(statuses) == {200}, f"statuses {sorted(set(statuses))}")
+        batch = [i for n, i in enumerate(application_ids) if n % APPLICATIONS_PER_BORROWER == 1]
+        response = client.post(f"{prefix}/loans/approve:batch", headers=headers, json={"loan_ids": batch})
+        check("batch approval across shards", response.json().get("approved") == len(batch), response.text[:120])
+        
+        loan_ids = check_tree(client, headers, "before rebalancing")
+        schedule = client.get(f"{prefix}/payments/loan/{loan_ids[0]}/schedule?limit=50").json()
+        response = client.post(
+            f"{prefix}/payments/schedule/{schedule[0]['id']}/pay", headers=headers,
+            params={"amount": 100.0, "payment_method": "card", "transaction_reference": "shard-check-1"}
+        )
+        check("payment on a sharded schedule", response.status_code == 200, response.text[:120])
+        
+        # a settlement file spanning shards: each line is applied on its schedule's shard
+        unpaid = {
+            shard_id: rows[0][0]
+            for shard_id, rows in shard_rows("SELECT id FROM repayment_schedules WHERE amount_paid = 0 ORDER BY id LIMIT 1").items()
+            if rows
+        }
+        settlement = "schedule_id,amount,payment_method,transaction_reference\n" + "".join(
+            f"{schedule_id},10.0,bank,ingest-{shard_id}\n" for shard_id, schedule_id in unpaid.items()
+        ) + f"{unpaid['shard_1']},10.0,bank,shard-check-1\n999999999,10.0,bank,ingest-missing\n"
+        response = client.post(
+            f"{prefix}/payments/ingest", headers=headers, content=settlement.encode(), params={"format": "csv"}
+        )
+        statuses = [json.loads(line)["status"] for line in response.text.splitlines()]
+        check(
+            "settlement ingest across shards",
+            statuses == ["applied"] * len(unpaid) + ["duplicate", "rejected"], f"statuses {statuses}"
+        )
+        ingested = shard_rows("SELECT transaction_reference FROM payments WHERE transaction_reference LIKE 'ingest-%'")
+        check(
+            "ingested payments written to their schedules' shards",
+            {shard_id: [row[0] for row in rows] for shard_id, rows in ingested.items() if rows}
+            == {shard_id: [f"ingest-{shard_id}"] for shard_id in unpaid}, str(ingested)
+        )
+        settlement_path = os.path.join(_scratch_dir, "settlement.jsonl")
+        with open(settlement_path, "w") as settlement_file:
+            settlement_file.write(json.dumps({
+                "schedule_id": unpaid["shard_0"], "amount": 5.0, "payment_method": "bank", "transaction_reference": "ingest-job"
+            }) + "\n")
+        exit_code = ingest_payments.main([settlement_path, "--report", os.path.join(_scratch_dir, "report.jsonl")])
+        job_rows = shard_rows("SELECT id FROM payments WHERE transaction_reference = 'ingest-job'")
+        check("ingest job applies on the schedule's shard", exit_code == 0 and [len(job_rows[s]) for s in SHARD_IDS] == [1, 0, 0])
+        
+        # a bucket flagged as moving turns its borrowers away instead of risking a stale shard
+        moving_borrower = borrower_ids[0]
+        bucket = load_shard_map().bucket_for(moving_borrower)
+        directory = SessionLocal()
+        try:
+            owner = load_shard_map().assignments[bucket]
+            ShardService.set_buckets(directory, {bucket: owner}, moving=True)
+            status_while_moving = client.get(f"{prefix}/loans/user/{moving_borrower}").status_code
+            ShardService.set_buckets(directory, {bucket: owner}, moving=False)
+        finally:
+            directory.close()
+        check("borrower in a moving bucket gets 503", status_while_moving == 503, f"status {status_while_moving}")
+        
+        started = time.perf_counter()
+        rebalance_shards.main(["--apply", "--grace-seconds", "0", "--batch-size", "2"])
+        print(f"       rebalanced in {(time.perf_counter() - started) * 1000:.0f} ms")
+        loan_ids = check_tree(client, headers, "after rebalancing")
+        moved_loans = shard_rows("SELECT id FROM loans")["shard_2"]
+        check("shard_2 received loans", bool(moved_loans), f"{len(moved_loans)} loans")
+        if moved_loans:
+            moved_loan = moved_loans[0][0]
+            response = client.get(f"{prefix}/loans/disbursed/{moved_loan}")
+            check("moved loan readable on its new shard", response.status_code == 200, f"status {response.status_code}")
+            schedule_id = response.json()["repayments"][0]["id"]
+            response = client.post(
+                f"{prefix}/payments/schedule/{schedule_id}/pay", headers=headers,
+                params={"amount": 50.0, "payment_method": "card", "transaction_reference": "shard-check-2"}
+            )
+            check("payment on a moved schedule", response.status_code == 200, response.text[:120])
+            payments = shard_rows(f"SELECT id FROM payments WHERE loan_id = {moved_loan}")
+            check("payment written to the new shard only", [len(payments[s]) for s in SHARD_IDS] == [0, 0, 1])
+        
+        # exports read every shard into one file
+        expected_loans = sorted(row[0] for rows in shard_rows("SELECT id FROM loans").values() for row in rows)
+        response = client.get(f"{prefix}/exports/loans", headers=headers, params={"format": "arrow"})
+        exported = pa.ipc.open_stream(response.content).read_all() if response.status_code == 200 else None
+        check(
+            "loans export covers every shard",
+            exported is not None and sorted(exported.column("id").to_pylist()) == expected_loans,
+            f"{0 if exported is None else exported.num_rows} of {len(expected_loans)} loans"
+        )
+        export_dir = os.path.join(_scratch_dir, "exports")
+        export_tables.main(["repayment_schedules", "--out-dir", export_dir])
+        exported_rows = sum(pq.read_metadata(os.path.join(export_dir, name)).num_rows for name in os.listdir(export_dir))
+        stored_rows = sum(len(rows) for rows in shard_rows("SELECT id FROM repayment_schedules").values())
+        check("export job covers every shard", exported_rows == stored_rows, f"{exported_rows} of {stored_rows} installments")
+        
+        # deleting a borrower removes their loan data from their shard too, and nobody else's
+        owned = (
+            "SELECT 'applications', applicant_id FROM loan_applications UNION ALL SELECT 'loans', borrower_id FROM loans"
+            " UNION ALL SELECT 'installments', l.borrower_id FROM repayment_schedules s JOIN loans l ON l.id = s.loan_id"
+            " UNION ALL SELECT 'payments', l.borrower_id FROM payments p JOIN loans l ON l.id = p.loan_id"
+        )
+        before = [row for rows in shard_rows(owned).values() for row in rows]
+        deleted_borrower = next(borrower_id for kind, borrower_id in before if kind == "payments")
+        response = client.delete(f"{prefix}/users/{deleted_borrower}", headers=headers)
+        after = [row for rows in shard_rows(owned).values() for row in rows]
+        left = [kind for kind, borrower_id in after if borrower_id == deleted_borrower]
+        check("user delete removes their loan data on the shard", response.status_code == 204 and not left, f"{len(left)} rows left")
+        check(
+            "user delete leaves other borrowers' data",
+            sorted(after) == sorted(row for row in before if row[1] != deleted_borrower), f"{len(before) - len(after)} rows deleted"
+        )
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
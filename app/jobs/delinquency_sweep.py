@@ -0,0 +1,33 @@
+# delinquency sweep - moves overdue installments to DUE / LATE / MISSED and defaults loans
+# run nightly with: python -m app.jobs.delinquency_sweep [--now ISO_DATETIME] [--chunk-size N] [--pause SECONDS]
+import argparse
+import sys
+from datetime import datetime
+
+from app.config import settings
+from app.database import data_sessionmakers
+from app.services.payment_service import PaymentService
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Mark overdue installments and default delinquent loans")
+    parser.add_argument("--now", type=datetime.fromisoformat, help="reference time in UTC (default: now)")
+    parser.add_argument("--chunk-size", type=int, default=settings.DELINQUENCY_SWEEP_CHUNK_SIZE, help="rows per transaction")
+    parser.add_argument("--pause", type=float, default=0.0, help="seconds to sleep between transactions")
+    args = parser.parse_args(argv)
+    
+    # every shard is swept in turn when the loan tables are sharded
+    for name, session_factory in data_sessionmakers().items():
+        db = session_factory()
+        try:
+            counts = PaymentService.sweep_delinquencies(
+                db, now=args.now, chunk_size=args.chunk_size, pause_seconds=args.pause
+            )
+        finally:
+            db.close()
+        print(f"{name}: " + ", ".join(f"{count} {transition}" for transition, count in counts.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
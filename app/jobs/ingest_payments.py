@@ -0,0 +1,49 @@
+# settlement ingestion - applies a bank settlement file through PaymentService
+# run with: python -m app.jobs.ingest_payments FILE [--format csv|jsonl] [--chunk-size N] [--report PATH]
+# FILE may be "-" for stdin; the per-line report is written as JSON lines (stdout by default)
+import argparse
+import json
+import sys
+from collections import Counter
+
+from app.config import settings
+from app.database import data_sessionmakers
+from app.services.payment_service import PaymentService
+from app.utils.settlement import SETTLEMENT_FORMATS, parse_settlement_lines
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Apply a bank settlement file of payments")
+    parser.add_argument("file", help="settlement file, or - for stdin")
+    parser.add_argument("--format", choices=SETTLEMENT_FORMATS, help="defaults to the file extension, else csv")
+    parser.add_argument("--chunk-size", type=int, default=settings.SETTLEMENT_CHUNK_SIZE, help="lines per transaction")
+    parser.add_argument("--report", help="write the per-line report here instead of stdout")
+    args = parser.parse_args(argv)
+    
+    file_format = args.format or ("jsonl" if args.file.endswith((".jsonl", ".ndjson")) else "csv")
+    source = sys.stdin if args.file == "-" else open(args.file, encoding="utf-8-sig", newline="")
+    report = open(args.report, "w") if args.report else sys.stdout
+    counts = Counter()
+    
+    # one session per shard when the loan tables are sharded; each record goes to its schedule's shard
+    sessions = {name: session_factory() for name, session_factory in data_sessionmakers().items()}
+    try:
+        for result in PaymentService.ingest_payments_across_shards(
+            sessions, parse_settlement_lines(source, file_format), chunk_size=args.chunk_size
+        ):
+            counts[result["status"]] += 1
+            report.write(json.dumps(result, default=str) + "\n")
+    finally:
+        for db in sessions.values():
+            db.close()
+        if source is not sys.stdin:
+            source.close()
+        if report is not sys.stdout:
+            report.close()
+    
+    print(", ".join(f"{counts[key]} {key}" for key in ("applied", "duplicate", "rejected")), file=sys.stderr)
+    return 1 if counts["rejected"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
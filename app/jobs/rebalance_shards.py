@@ -0,0 +1,74 @@
+# shard rebalancing - evens out borrower buckets across SHARD_URLS, or drains a shard
+# run with: python -m app.jobs.rebalance_shards [--apply] [--drain SHARD_ID] [--batch-size N] [--grace-seconds S]
+# without --apply only the plan is printed
+import argparse
+import sys
+import time
+
+from app.config import settings
+from app.database import Base, SHARD_IDS, SessionLocal, ShardSessionLocal, engine, load_shard_map, shard_engines
+from app.services.analytics_service import AnalyticsService
+from app.services.shard_service import ShardService
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Move borrower buckets between shards")
+    parser.add_argument("--apply", action="store_true", help="move the data (default: print the plan)")
+    parser.add_argument("--drain", action="append", default=[], help="shard to empty, e.g. shard_2 (repeatable)")
+    parser.add_argument("--batch-size", type=int, default=32, help="buckets locked and moved together")
+    parser.add_argument(
+        "--grace-seconds", type=float, default=2 * settings.SHARD_MAP_REFRESH_SECONDS,
+        help="wait after locking a batch, so every process has seen the lock and finished its requests"
+    )
+    args = parser.parse_args(argv)
+    if not SHARD_IDS:
+        print("SHARD_URLS is not set, nothing to rebalance")
+        return 1
+    targets = [shard_id for shard_id in SHARD_IDS if shard_id not in args.drain]
+    if not targets:
+        print("cannot drain every shard")
+        return 1
+    
+    Base.metadata.create_all(bind=engine)
+    for shard_engine in shard_engines.values():
+        Base.metadata.create_all(bind=shard_engine)
+    current = load_shard_map()
+    moves = current.plan_rebalance(targets)
+    before = current.buckets_by_shard()
+    print(", ".join(f"{shard_id}: {len(before.get(shard_id, []))} buckets" for shard_id in SHARD_IDS))
+    print(f"{len(moves)} buckets to move")
+    if not args.apply or not moves:
+        for bucket, source, target in moves:
+            print(f"  bucket {bucket}: {source} -> {target}")
+        return 0
+    
+    directory = SessionLocal()
+    touched = set()
+    try:
+        for batch in ShardService.batches(moves, args.batch_size):
+            ShardService.set_buckets(directory, {bucket: source for bucket, source, _ in batch}, moving=True)
+            time.sleep(args.grace_seconds)
+            for bucket, source, target in batch:
+                with ShardSessionLocal[source]() as source_db, ShardSessionLocal[target]() as target_db:
+                    counts = ShardService.copy_bucket(source_db, target_db, bucket, current.buckets)
+                print(f"bucket {bucket}: {source} -> {target}, " + ", ".join(f"{n} {table}" for table, n in counts.items()))
+            # processes now see the bucket either still locked or on its new shard, never on the old one
+            ShardService.set_buckets(directory, {bucket: target for bucket, _, target in batch}, moving=False)
+            for bucket, source, target in batch:
+                with ShardSessionLocal[source]() as source_db:
+                    ShardService.delete_bucket(source_db, bucket, current.buckets)
+                touched.update((source, target))
+    finally:
+        directory.close()
+    
+    # each shard's summary tables describe its own rows, so recompute them where rows moved
+    for shard_id in sorted(touched):
+        with ShardSessionLocal[shard_id]() as db:
+            AnalyticsService.rebuild(db)
+    after = load_shard_map().buckets_by_shard()
+    print(", ".join(f"{shard_id}: {len(after.get(shard_id, []))} buckets" for shard_id in SHARD_IDS))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,22 @@
+# analytics rebuild - recomputes the portfolio summary tables from loans and schedules
+# run with: python -m app.jobs.rebuild_analytics (after manual data fixes, or to backfill)
+import sys
+
+from app.database import data_sessionmakers
+from app.services.analytics_service import AnalyticsService
+
+
+def main() -> int:
+    # each shard keeps the summary of its own loans
+    for name, session_factory in data_sessionmakers().items():
+        db = session_factory()
+        try:
+            counts = AnalyticsService.rebuild(db)
+        finally:
+            db.close()
+        print(f"{name}: " + ", ".join(f"{count} rows in {table}" for table, count in counts.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
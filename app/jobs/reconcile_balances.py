@@ -0,0 +1,38 @@
+# balance reconciliation - compares each loan's running totals with its repayment schedule
+# run with: python -m app.jobs.reconcile_balances [--fix] [--chunk-size N] (exit code 1 on drift)
+import argparse
+import sys
+
+from app.database import data_sessionmakers
+from app.services.payment_service import PaymentService
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Reconcile loan running balances against repayment schedules")
+    parser.add_argument("--fix", action="store_true", help="rewrite drifted loans from their schedules")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="loans checked per query")
+    args = parser.parse_args(argv)
+    
+    mismatched = 0
+    # every shard is reconciled in turn when the loan tables are sharded
+    for name, session_factory in data_sessionmakers().items():
+        db = session_factory()
+        try:
+            report = PaymentService.reconcile_loan_balances(db, fix=args.fix, chunk_size=args.chunk_size)
+        finally:
+            db.close()
+        
+        for mismatch in report["mismatches"]:
+            print(
+                f"loan {mismatch['loan_id']}: outstanding {mismatch['outstanding_balance']} "
+                f"(expected {mismatch['expected_outstanding_balance']}), "
+                f"paid {mismatch['total_paid']} (expected {mismatch['expected_total_paid']})"
+            )
+        print(f"{name}: checked {report['checked']} loans, {report['mismatched']} mismatched"
+              + (", fixed" if args.fix and report["mismatched"] else ""))
+        mismatched += report["mismatched"]
+    return 1 if mismatched and not args.fix else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
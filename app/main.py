@@ -1,13 +1,17 @@
 # the main module for the Loan Management System
 # this is where the FastAPI app is created and configured
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from app.config import settings
-from app.database import engine, Base
+from app.database import engine, shard_engines, Base
 from fastapi.middleware.cors import CORSMiddleware
-from app.api.v1 import auth, users, loans, payments
+from app.utils.query_counter import QueryCounter
+from app.api.v1 import auth, users, loans, payments, metrics, analytics, exports, quotes
 
 # Create the database tables    
 Base.metadata.create_all(bind=engine)
+for shard_engine in shard_engines.values():
+    Base.metadata.create_all(bind=shard_engine)
 
 # Initialize the FastAPI app
 app = FastAPI(
@@ -27,6 +31,24 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# N+1 guard - count each request's SQL statements and fail it when it exceeds its route's query_budget
+if settings.QUERY_BUDGET_CHECK:
+    @app.middleware("http")
+    async def enforce_query_budget(request: Request, call_next):
+        with QueryCounter() as counter:
+            response = await call_next(request)
+        budget = getattr(request.state, "query_budget", None)
+        if budget is not None and counter.count > budget:
+            return JSONResponse(
+                status_code=500,
+                content={
+                    "detail": f"Query budget exceeded: {counter.count} statements, budget {budget}",
+                    "statements": counter.statements
+                }
+            )
+        response.headers["X-Query-Count"] = str(counter.count)
+        return response
+
 # Root endpoint for health check
 @app.get("/")
 def read_root():
@@ -49,6 +71,10 @@ app.include_router(auth.router, prefix=settings.API_V1_PREFIX)
 app.include_router(users.router, prefix=settings.API_V1_PREFIX)
 app.include_router(loans.router, prefix=settings.API_V1_PREFIX)
 app.include_router(payments.router, prefix=settings.API_V1_PREFIX)
+app.include_router(metrics.router, prefix=settings.API_V1_PREFIX)
+app.include_router(analytics.router, prefix=settings.API_V1_PREFIX)
+app.include_router(exports.router, prefix=settings.API_V1_PREFIX)
+app.include_router(quotes.router, prefix=settings.API_V1_PREFIX)
 
 if __name__ == "__main__":
     import uvicorn
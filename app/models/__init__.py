@@ -3,6 +3,8 @@
 from app.models.loan import Loan, LoanApplication, LoanApplication,LoanStatus, LoanType
 from app.models.payment import Payment, RepaymentSchedule, PaymentStatus    
 from app.models.user import User
+from app.models.analytics import PortfolioCashFlow, PortfolioLoanTypeTotals, PortfolioStatusCount
+from app.models.shard import ShardBucket, ShardIdBlock
 
 __all__ = [
     "User",
@@ -13,4 +15,9 @@ __all__ = [
     "Payment",
     "RepaymentSchedule",
     "PaymentStatus",
+    "PortfolioCashFlow",
+    "PortfolioLoanTypeTotals",
+    "PortfolioStatusCount",
+    "ShardBucket",
+    "ShardIdBlock",
 ]
\ No newline at end of file
@@ -0,0 +1,46 @@
+# portfolio analytics models - summary tables kept up to date on every state change
+# so dashboards read a handful of rows instead of aggregating loans and schedules
+from sqlalchemy import Column, Integer, Float, String, Enum
+from app.database import Base
+from app.models.loan import LoanStatus, LoanType
+
+
+class PortfolioLoanTypeTotals(Base):
+    """Running totals of disbursed loans per loan type"""
+    __tablename__ = "portfolio_loan_type_totals"
+    
+    loan_type = Column(Enum(LoanType), primary_key=True)
+    loan_count = Column(Integer, nullable=False, default=0)
+    # principal disbursed, and principal + interest still to be repaid
+    principal_amount = Column(Float, nullable=False, default=0.0)
+    outstanding_balance = Column(Float, nullable=False, default=0.0)
+    # unpaid part of LATE and MISSED installments
+    overdue_amount = Column(Float, nullable=False, default=0.0)
+    
+    def __repr__(self):
+        return f"<PortfolioLoanTypeTotals loan_type={self.loan_type} loans={self.loan_count} outstanding={self.outstanding_balance}>"
+
+
+class PortfolioStatusCount(Base):
+    """Number of loan applications and loans in each status"""
+    __tablename__ = "portfolio_status_counts"
+    
+    status = Column(Enum(LoanStatus), primary_key=True)
+    application_count = Column(Integer, nullable=False, default=0)
+    loan_count = Column(Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f"<PortfolioStatusCount status={self.status} applications={self.application_count} loans={self.loan_count}>"
+
+
+class PortfolioCashFlow(Base):
+    """Scheduled and collected repayments per due month"""
+    __tablename__ = "portfolio_cash_flow"
+    
+    # "YYYY-MM" of the installments' due date
+    month = Column(String(7), primary_key=True)
+    amount_due = Column(Float, nullable=False, default=0.0)
+    amount_paid = Column(Float, nullable=False, default=0.0)
+    
+    def __repr__(self):
+        return f"<PortfolioCashFlow month={self.month} due={self.amount_due} paid={self.amount_paid}>"
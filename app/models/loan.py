@@ -1,6 +1,6 @@
 import enum
-from sqlalchemy import Column, Integer, Float, String, ForeignKey, DateTime, Enum, Text
-from sqlalchemy.orm import relationship 
+from sqlalchemy import Column, Integer, Float, String, ForeignKey, DateTime, Enum, Text, Index, select
+from sqlalchemy.orm import column_property, relationship 
 from sqlalchemy.sql import func
 from app.database import Base
 
@@ -31,6 +31,13 @@ class LoanStatus(str, enum.Enum):
 class LoanApplication(Base):
     """Customer request for a loan"""
     __tablename__ = "loan_applications"
+    __table_args__ = (
+        # keyset listing of all applications and of one applicant's applications
+        Index("ix_loan_applications_created_at_id", "created_at", "id"),
+        Index("ix_loan_applications_applicant_id_created_at_id", "applicant_id", "created_at", "id"),
+        # review queues (PENDING / UNDER_REVIEW)
+        Index("ix_loan_applications_status", "status"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     
@@ -53,6 +60,9 @@ class LoanApplication(Base):
     review_comments = Column(Text, nullable=True)
     reviewed_at = Column(DateTime(timezone=True), nullable=True)
     
+    # bumped on every ORM update, so approve and reject cannot both win
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    
     # Timestamps
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -62,6 +72,8 @@ class LoanApplication(Base):
     applicant = relationship("User", foreign_keys=[applicant_id], back_populates="loan_applications")
     reviewer = relationship("User", foreign_keys=[reviewed_by_id])
     
+    __mapper_args__ = {"version_id_col": version}
+    
     def __repr__(self):
         return f"<LoanApplication id={self.id} applicant_id={self.applicant_id} loan_type={self.loan_type} amount={self.loan_amount} status={self.status}>"
 
@@ -69,6 +81,10 @@ class LoanApplication(Base):
 class Loan(Base):
     """Actual loan record once approved and disbursed"""
     __tablename__ = "loans"
+    __table_args__ = (
+        Index("ix_loans_borrower_id", "borrower_id"),
+        Index("ix_loans_status", "status"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     
@@ -87,7 +103,9 @@ class Loan(Base):
     
     # Current status
     status = Column(Enum(LoanStatus), default=LoanStatus.DISBURSED)
+    # running totals kept in step with the payments ledger (see PaymentService.make_payment)
     outstanding_balance = Column(Float, nullable=False)
+    total_paid = Column(Float, nullable=False, default=0.0, server_default="0")
     
     disbursement_date = Column(DateTime(timezone=True), server_default=func.now())
     start_date = Column(DateTime(timezone=True), nullable=True)
@@ -100,8 +118,18 @@ class Loan(Base):
     # Relationships
     application = relationship("LoanApplication", back_populates="loan")
     borrower = relationship("User", foreign_keys=[borrower_id], back_populates="loans")
-    repayments = relationship("RepaymentSchedule", back_populates="loan", cascade="all, delete-orphan")
+    repayments = relationship(
+        "RepaymentSchedule", back_populates="loan", cascade="all, delete-orphan",
+        order_by="RepaymentSchedule.installment_number"
+    )
     payments = relationship("Payment", back_populates="loan", cascade="all, delete-orphan")
     
     def __repr__(self):
         return f"<Loan id={self.id} borrower_id={self.borrower_id} principal={self.principal_amount} status={self.status}>"
+
+
+# id of the Loan created when the application was approved (None before), loaded with the
+# application itself: schedules, payments and balances are addressed by this id
+LoanApplication.loan_id = column_property(
+    select(Loan.id).where(Loan.application_id == LoanApplication.id).correlate_except(Loan).scalar_subquery()
+)
@@ -1,6 +1,6 @@
 # payment models to track money flow
 # when payments are due and actual payments made
-from sqlalchemy import Column, Integer, Float, String, ForeignKey, DateTime, Enum
+from sqlalchemy import Column, Integer, Float, String, ForeignKey, DateTime, Enum, Index, JSON, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -19,6 +19,18 @@ class PaymentStatus(str, enum.Enum):
 class RepaymentSchedule(Base):
     """Schedule of repayments for a loan"""
     __tablename__ = "repayment_schedules"
+    __table_args__ = (
+        # schedule reads, balances and history all filter on loan_id and order by installment
+        Index("ix_repayment_schedules_loan_id_installment_number", "loan_id", "installment_number", unique=True),
+        # collections / delinquency scans by status and due date
+        Index("ix_repayment_schedules_status_due_date", "status", "due_date"),
+        # unpaid installments only, on backends with partial indexes
+        Index(
+            "ix_repayment_schedules_unpaid_due_date", "due_date",
+            postgresql_where=text("status <> 'PAID'"),
+            sqlite_where=text("status <> 'PAID'"),
+        ),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     # which loan this repayment is for
@@ -37,6 +49,9 @@ class RepaymentSchedule(Base):
     amount_paid = Column(Float, default=0.0)
     payment_date = Column(DateTime(timezone=True), nullable=True)
     
+    # bumped on every ORM update; a concurrent writer's stale UPDATE matches no row
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    
     # timestamps
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -44,6 +59,8 @@ class RepaymentSchedule(Base):
     # relationships
     loan = relationship("Loan", back_populates="repayments")
     
+    __mapper_args__ = {"version_id_col": version}
+    
     def __repr__(self):
         return f"<RepaymentSchedule id={self.id} loan_id={self.loan_id} installment={self.installment_number} due_date={self.due_date} amount_due={self.amount_due} status={self.status}>"
 
@@ -51,10 +68,15 @@ class RepaymentSchedule(Base):
 class Payment(Base):
     """Actual payment made towards a loan"""
     __tablename__ = "payments"
+    __table_args__ = (
+        Index("ix_payments_loan_id", "loan_id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     # which loan this payment is for
     loan_id = Column(Integer, ForeignKey("loans.id"), nullable=False)
+    # which installment it was applied to
+    schedule_id = Column(Integer, ForeignKey("repayment_schedules.id"), nullable=True)
     
     # payment detail
     amount = Column(Float, nullable=False)
@@ -63,6 +85,8 @@ class Payment(Base):
     
     # transaction tracking
     transaction_reference = Column(String, unique=True, nullable=False)
+    # response returned when the payment was applied, replayed for retries of the same reference
+    idempotency_result = Column(JSON, nullable=True)
     notes = Column(String, nullable=True)
     
     # processing details
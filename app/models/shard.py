@@ -0,0 +1,28 @@
+# shard directory models - kept on the directory database (DATABASE_URL) next to users
+# they say where each borrower's loans live when the loan tables are sharded (SHARD_URLS)
+from sqlalchemy import Boolean, Column, Integer, String, false
+from app.database import Base
+
+
+class ShardBucket(Base):
+    """Shard holding the borrowers of one bucket (borrower_id % SHARD_BUCKETS)"""
+    __tablename__ = "shard_buckets"
+    
+    bucket = Column(Integer, primary_key=True, autoincrement=False)
+    shard_id = Column(String(64), nullable=False)
+    # set by the rebalancer while the bucket's rows are copied; requests for its borrowers get a 503
+    moving = Column(Boolean, nullable=False, default=False, server_default=false())
+    
+    def __repr__(self):
+        return f"<ShardBucket bucket={self.bucket} shard_id={self.shard_id} moving={self.moving}>"
+
+
+class ShardIdBlock(Base):
+    """Next unallocated id of a sharded table, so ids stay unique across shards"""
+    __tablename__ = "shard_id_blocks"
+    
+    table_name = Column(String(64), primary_key=True)
+    next_id = Column(Integer, nullable=False)
+    
+    def __repr__(self):
+        return f"<ShardIdBlock table_name={self.table_name} next_id={self.next_id}>"
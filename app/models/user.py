@@ -1,6 +1,6 @@
 # user model
 from xmlrpc.client import Boolean
-from sqlalchemy import Column, Integer, String, DateTime,  Boolean, Enum
+from sqlalchemy import Column, Integer, String, DateTime,  Boolean, Enum, Index
 from sqlalchemy.orm import relationship 
 from sqlalchemy.sql import func
 from app.database import Base
@@ -17,6 +17,10 @@ class UserRole(str, enum.Enum):
 class User(Base):
     # user model representing system users. sotres information about everyone using the system
     __tablename__ = "users"
+    __table_args__ = (
+        # keyset listing of users
+        Index("ix_users_created_at_id", "created_at", "id"),
+    )
     
 # primary identification fields
     id = Column(Integer, primary_key=True, index=True)
@@ -0,0 +1,53 @@
+# analytics schemas - API contracts for portfolio reporting
+from pydantic import BaseModel
+from typing import List
+from app.models.loan import LoanStatus, LoanType
+
+
+class PortfolioTotals(BaseModel):
+    # portfolio-wide figures; delinquency_rate is overdue_amount / outstanding_balance
+    loan_count: int
+    principal_amount: float
+    outstanding_balance: float
+    overdue_amount: float
+    delinquency_rate: float
+    
+    
+class LoanTypeTotals(BaseModel):
+    # running totals for one loan type
+    loan_type: LoanType
+    loan_count: int
+    principal_amount: float
+    outstanding_balance: float
+    overdue_amount: float
+    
+    class Config:
+        from_attributes = True
+        
+        
+class StatusCount(BaseModel):
+    # applications and loans currently in one status
+    status: LoanStatus
+    application_count: int
+    loan_count: int
+    
+    class Config:
+        from_attributes = True
+        
+        
+class CashFlowMonth(BaseModel):
+    # scheduled and collected repayments for installments due in one month (YYYY-MM)
+    month: str
+    amount_due: float
+    amount_paid: float
+    
+    class Config:
+        from_attributes = True
+        
+        
+class PortfolioSummary(BaseModel):
+    # dashboard view of the whole portfolio
+    totals: PortfolioTotals
+    by_loan_type: List[LoanTypeTotals]
+    by_status: List[StatusCount]
+    cash_flow: List[CashFlowMonth]
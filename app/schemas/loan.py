@@ -1,8 +1,10 @@
 # loan schemas - API contracts for loan operations
-from pydantic import BaseModel, Field
-from typing import Optional
+from pydantic import AliasChoices, BaseModel, Field
+from typing import List, Optional
 from datetime import datetime
 from app.models.loan import LoanType, LoanStatus    
+from app.schemas.payment import RepaymentScheduleResponse
+from app.schemas.user import UserResponse
 
 
 # loan application schemas
@@ -27,6 +29,8 @@ class LoanApplicationUpdate(BaseModel):
     
 class LoanApplicationResponse(LoanApplicationBase):
     # properties to return to client
+    # the model stores the requested amount as loan_amount
+    requested_amount: float = Field(..., validation_alias=AliasChoices("requested_amount", "loan_amount"))
     id: int
     applicant_id: int
     interest_rate: float
@@ -36,11 +40,38 @@ class LoanApplicationResponse(LoanApplicationBase):
     reviewed_at: Optional[datetime] = None
     review_comments: Optional[str] = Field(None, max_length=1000)
     reviewed_by_id: Optional[int] 
+    # the disbursed loan's id once approved, used by /loans/disbursed and /payments/loan
+    loan_id: Optional[int] = None
     
     class Config:
         from_attributes = True
         
         
+class LoanApplicationPage(BaseModel):
+    # one page of a keyset-paginated loan application listing
+    items: List[LoanApplicationResponse]
+    next_cursor: Optional[str] = None
+        
+        
+class LoanBatchApprovalRequest(BaseModel):
+    # IDs of the loan applications to approve in one go
+    loan_ids: List[int] = Field(..., min_length=1, max_length=50000)
+    
+    
+class LoanBatchApprovalResult(BaseModel):
+    # outcome for a single application in a batch approval
+    loan_id: int
+    approved: bool
+    detail: Optional[str] = None
+    
+    
+class LoanBatchApprovalResponse(BaseModel):
+    # summary and per-application results of a batch approval
+    approved: int
+    failed: int
+    results: List[LoanBatchApprovalResult]
+        
+        
 # loan schemas
 class LoanBase(BaseModel):
     # shared properties for loan
@@ -72,6 +103,15 @@ class LoanResponse(LoanBase):
     class Config:
         from_attributes = True
         
+class LoanDetailResponse(LoanResponse):
+    # a disbursed loan with its borrower and full repayment schedule
+    total_paid: float = 0.0
+    borrower: UserResponse
+    repayments: List[RepaymentScheduleResponse]
+    
+    class Config:
+        from_attributes = True
+        
 class LoanSummary(BaseModel):
     # summary information about a loan
     id: int
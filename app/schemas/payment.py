@@ -1,6 +1,6 @@
 # payment schemas - API contracts for payment operations
 from pydantic import BaseModel, Field
-from typing import Optional 
+from typing import List, Optional 
 from datetime import datetime, date
 from app.models.payment import PaymentStatus
 
@@ -28,6 +28,11 @@ class RepaymentScheduleResponse(RepaymentScheduleBase):
         from_attributes = True
         
         
+class RepaymentSchedulePage(BaseModel):
+    # one page of a keyset-paginated repayment schedule
+    items: List[RepaymentScheduleResponse]
+    next_cursor: Optional[str] = None
+        
         
 # payment schemas
 class PaymentBase(BaseModel):
@@ -0,0 +1,51 @@
+# quote schemas - API contracts for the public loan calculator
+from pydantic import BaseModel, Field
+from typing import List
+from datetime import datetime
+
+
+class QuoteScenario(BaseModel):
+    # loan terms to quote
+    principal: float = Field(..., gt=0, description="Loan amount must be positive")
+    annual_interest_rate: float = Field(..., ge=0, le=100, description="Annual rate in percent")
+    term_months: int = Field(..., gt=0, le=600, description="Term in months, at most 50 years")
+
+
+class QuoteResponse(QuoteScenario):
+    # EMI and lifetime cost of one scenario
+    monthly_payment: float
+    total_interest: float
+    total_payment: float
+
+
+class QuoteBatchRequest(BaseModel):
+    # many scenarios quoted in one call (e.g. a whole amount x term grid)
+    scenarios: List[QuoteScenario] = Field(..., min_length=1, max_length=10000)
+
+
+class QuoteBatchResponse(BaseModel):
+    # quotes in the same order as the requested scenarios
+    quotes: List[QuoteResponse]
+
+
+class SchedulePreviewInstallment(BaseModel):
+    # one installment of a previewed schedule; balance is the principal left after it
+    installment_number: int
+    due_date: datetime
+    amount_due: float
+    principal_component: float
+    interest_component: float
+    balance: float
+
+
+class SchedulePreviewResponse(QuoteResponse):
+    # quote plus its full amortization schedule
+    installments: List[SchedulePreviewInstallment]
+
+
+class PrepaymentResponse(BaseModel):
+    # effect of an extra payment on an existing loan
+    new_balance: float
+    months_saved: int
+    interest_saved: float
+    new_monthly_payment: float = 0.0
@@ -1,6 +1,6 @@
 # what fields are required, what's optional, what format.
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 from app.models.user import UserRole
 
@@ -54,6 +54,12 @@ class UserResponse(UserBase):
         from_attributes = True
         
 
+class UserPage(BaseModel):
+    # one page of a keyset-paginated user listing
+    items: List[UserResponse]
+    next_cursor: Optional[str] = None
+    
+
 class Token(BaseModel):
     # Authentication token response model
     access_token: str
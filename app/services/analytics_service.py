@@ -0,0 +1,269 @@
+# analytics service - maintains and reads the portfolio summary tables
+import asyncio
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from datetime import datetime
+import numpy as np
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.models.analytics import PortfolioCashFlow, PortfolioLoanTypeTotals, PortfolioStatusCount
+from app.models.loan import Loan, LoanApplication, LoanStatus
+from app.models.payment import PaymentStatus, RepaymentSchedule
+from app.services.schedule_service import ScheduleService
+from app.utils.loan_calculator import AmortizationTable
+
+# installments whose unpaid part counts as overdue
+OVERDUE_STATUSES = (PaymentStatus.LATE, PaymentStatus.MISSED)
+
+# INSERT ... ON CONFLICT DO UPDATE constructs of the supported backends
+UPSERT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+class AnalyticsService:
+    """Service class for portfolio analytics
+    
+    The record_* methods add deltas to the summary tables inside the caller's
+    transaction (nothing is committed), so the figures move together with the
+    loans, schedules and payments they describe.
+    """
+    
+    @staticmethod
+    def _increment(db: Session, model, key: str, rows: List[dict]):
+        """Add each row's values to the summary row with the same key, creating it when missing"""
+        if not rows:
+            return
+        table = model.__table__
+        stmt = UPSERT_INSERTS[db.get_bind().dialect.name](table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[key],
+            set_={column: table.c[column] + stmt.excluded[column] for column in rows[0] if column != key}
+        )
+        db.execute(stmt, rows)
+    
+    @staticmethod
+    def _loan_types(db: Session, loan_ids: Iterable[int]) -> dict:
+        return dict(db.execute(select(Loan.id, Loan.loan_type).where(Loan.id.in_(set(loan_ids)))).all())
+    
+    @staticmethod
+    def _increment_loan_types(db: Session, deltas: Dict[object, Dict[str, float]]):
+        columns = ("loan_count", "principal_amount", "outstanding_balance", "overdue_amount")
+        AnalyticsService._increment(db, PortfolioLoanTypeTotals, "loan_type", [
+            {"loan_type": loan_type, **{column: values.get(column, 0) for column in columns}}
+            for loan_type, values in deltas.items()
+        ])
+    
+    @staticmethod
+    def record_status_changes(
+        db: Session,
+        application_deltas: Optional[Dict[LoanStatus, int]] = None,
+        loan_deltas: Optional[Dict[LoanStatus, int]] = None
+    ):
+        """Adjust the per-status application and loan counts"""
+        application_deltas = application_deltas or {}
+        loan_deltas = loan_deltas or {}
+        AnalyticsService._increment(db, PortfolioStatusCount, "status", [
+            {"status": status, "application_count": application_deltas.get(status, 0), "loan_count": loan_deltas.get(status, 0)}
+            for status in set(application_deltas) | set(loan_deltas)
+            if application_deltas.get(status) or loan_deltas.get(status)
+        ])
+    
+    @staticmethod
+    def record_loans_disbursed(db: Session, loans: Sequence[Loan], schedule: AmortizationTable):
+        """Add newly created loans and their repayment schedule"""
+        if not loans:
+            return
+        deltas = defaultdict(lambda: defaultdict(float))
+        for loan in loans:
+            totals = deltas[loan.loan_type]
+            totals["loan_count"] += 1
+            totals["principal_amount"] += loan.principal_amount
+            totals["outstanding_balance"] += loan.outstanding_balance
+        AnalyticsService._increment_loan_types(db, deltas)
+        AnalyticsService.record_status_changes(db, loan_deltas=Counter(loan.status for loan in loans))
+        AnalyticsService._increment(db, PortfolioCashFlow, "month", [
+            {"month": month, "amount_due": amount, "amount_paid": 0.0}
+            for month, amount in AnalyticsService._due_by_month(schedule)
+        ])
+    
+    @staticmethod
+    def _due_by_month(schedule: AmortizationTable) -> List[Tuple[str, float]]:
+        # (YYYY-MM, total amount due) of the installments in an AmortizationTable
+        months, positions = np.unique(np.datetime_as_string(schedule.due_date, unit="M"), return_inverse=True)
+        amounts = np.bincount(positions, weights=schedule.amount_due, minlength=len(months))
+        return list(zip(months.tolist(), amounts.tolist()))
+    
+    @staticmethod
+    def record_payments(
+        db: Session,
+        payments: Sequence[Tuple[int, datetime, float, float]],
+        loan_types: Optional[Dict[int, object]] = None
+    ):
+        """Add applied payments given as (loan_id, installment due date, amount, change in overdue amount)
+        
+        Pass loan_types (loan id -> LoanType) when the caller already has them to skip the lookup.
+        """
+        if not payments:
+            return
+        loan_types = loan_types or AnalyticsService._loan_types(db, (loan_id for loan_id, *_ in payments))
+        deltas = defaultdict(lambda: defaultdict(float))
+        paid_by_month = defaultdict(float)
+        for loan_id, due_date, amount, overdue_change in payments:
+            totals = deltas[loan_types[loan_id]]
+            totals["outstanding_balance"] -= amount
+            totals["overdue_amount"] += overdue_change
+            paid_by_month[due_date.strftime("%Y-%m")] += amount
+        AnalyticsService._increment_loan_types(db, deltas)
+        AnalyticsService._increment(db, PortfolioCashFlow, "month", [
+            {"month": month, "amount_due": 0.0, "amount_paid": amount} for month, amount in paid_by_month.items()
+        ])
+    
+    @staticmethod
+    def record_overdue(db: Session, installments: Sequence[Tuple[int, float]]):
+        """Add the unpaid amounts of installments that just became overdue, given as (loan_id, amount)"""
+        if not installments:
+            return
+        loan_types = AnalyticsService._loan_types(db, (loan_id for loan_id, _ in installments))
+        deltas = defaultdict(lambda: defaultdict(float))
+        for loan_id, amount in installments:
+            deltas[loan_types[loan_id]]["overdue_amount"] += amount
+        AnalyticsService._increment_loan_types(db, deltas)
+    
+    @staticmethod
+    async def get_portfolio_summary_async(
+        db: AsyncSession, from_month: Optional[str] = None, to_month: Optional[str] = None
+    ) -> dict:
+        """Read the portfolio figures from the summary tables (async)"""
+        return AnalyticsService._summarize(
+            *await AnalyticsService._read_summary_rows_async(db, from_month, to_month)
+        )
+    
+    @staticmethod
+    async def get_portfolio_summary_across_shards_async(
+        shard_dbs: Sequence[AsyncSession], from_month: Optional[str] = None, to_month: Optional[str] = None
+    ) -> dict:
+        """Portfolio figures of all shards, each shard's summary tables read at once and added up (async)"""
+        shard_rows = await asyncio.gather(
+            *(AnalyticsService._read_summary_rows_async(db, from_month, to_month) for db in shard_dbs)
+        )
+        # add up the rows with the same key (loan type, status, month) across shards
+        combined = []
+        for index, (model, key) in enumerate((
+            (PortfolioLoanTypeTotals, "loan_type"), (PortfolioStatusCount, "status"), (PortfolioCashFlow, "month")
+        )):
+            columns = [column.key for column in model.__table__.columns if column.key != key]
+            totals = defaultdict(lambda: dict.fromkeys(columns, 0))
+            for rows in shard_rows:
+                for row in rows[index]:
+                    for column in columns:
+                        totals[getattr(row, key)][column] += getattr(row, column)
+            combined.append([model(**{key: value}, **totals[value]) for value in sorted(totals)])
+        return AnalyticsService._summarize(*combined)
+    
+    @staticmethod
+    async def _read_summary_rows_async(
+        db: AsyncSession, from_month: Optional[str], to_month: Optional[str]
+    ) -> Tuple[list, list, list]:
+        loan_types = (await db.execute(
+            select(PortfolioLoanTypeTotals).order_by(PortfolioLoanTypeTotals.loan_type)
+        )).scalars().all()
+        statuses = (await db.execute(
+            select(PortfolioStatusCount).order_by(PortfolioStatusCount.status)
+        )).scalars().all()
+        cash_flow = select(PortfolioCashFlow).order_by(PortfolioCashFlow.month)
+        if from_month:
+            cash_flow = cash_flow.where(PortfolioCashFlow.month >= from_month)
+        if to_month:
+            cash_flow = cash_flow.where(PortfolioCashFlow.month <= to_month)
+        months = (await db.execute(cash_flow)).scalars().all()
+        return loan_types, statuses, months
+    
+    @staticmethod
+    def _summarize(loan_types: Sequence, statuses: Sequence, months: Sequence) -> dict:
+        outstanding = sum(row.outstanding_balance for row in loan_types)
+        overdue = sum(row.overdue_amount for row in loan_types)
+        return {
+            "totals": {
+                "loan_count": sum(row.loan_count for row in loan_types),
+                "principal_amount": round(sum(row.principal_amount for row in loan_types), 2),
+                "outstanding_balance": round(outstanding, 2),
+                "overdue_amount": round(overdue, 2),
+                "delinquency_rate": round(overdue / outstanding, 4) if outstanding > 0 else 0.0
+            },
+            # money to the cent like the totals; the summary rows themselves are left untouched
+            "by_loan_type": [
+                {
+                    "loan_type": row.loan_type,
+                    "loan_count": row.loan_count,
+                    "principal_amount": round(row.principal_amount, 2),
+                    "outstanding_balance": round(row.outstanding_balance, 2),
+                    "overdue_amount": round(row.overdue_amount, 2)
+                }
+                for row in loan_types
+            ],
+            "by_status": statuses,
+            "cash_flow": months
+        }
+    
+    @staticmethod
+    def rebuild(db: Session) -> dict:
+        """Recompute every summary table from loans, applications and (stored or computed) schedules
+        
+        For recovery after manual data fixes or a missed delta; runs in one transaction.
+        
+        Returns:
+            Number of rows written per summary table
+        """
+        for model in (PortfolioLoanTypeTotals, PortfolioStatusCount, PortfolioCashFlow):
+            db.execute(delete(model))
+        
+        loan_types = defaultdict(dict)
+        for row in db.execute(
+            select(
+                Loan.loan_type, func.count().label("loan_count"),
+                func.sum(Loan.principal_amount).label("principal_amount"),
+                func.sum(Loan.outstanding_balance).label("outstanding_balance")
+            ).group_by(Loan.loan_type)
+        ):
+            loan_types[row.loan_type].update(row._asdict())
+        for loan_type, overdue in db.execute(
+            select(Loan.loan_type, func.sum(RepaymentSchedule.amount_due - RepaymentSchedule.amount_paid))
+            .join(RepaymentSchedule, RepaymentSchedule.loan_id == Loan.id)
+            .where(RepaymentSchedule.status.in_(OVERDUE_STATUSES))
+            .group_by(Loan.loan_type)
+        ):
+            loan_types[loan_type]["overdue_amount"] = overdue
+        AnalyticsService._increment_loan_types(db, loan_types)
+        
+        applications = dict(db.execute(select(LoanApplication.status, func.count()).group_by(LoanApplication.status)).all())
+        loans = dict(db.execute(select(Loan.status, func.count()).group_by(Loan.status)).all())
+        AnalyticsService.record_status_changes(db, applications, loans)
+        
+        if db.get_bind().dialect.name == "postgresql":
+            month = func.to_char(RepaymentSchedule.due_date, "YYYY-MM")
+        else:
+            month = func.strftime("%Y-%m", RepaymentSchedule.due_date)
+        cash_flow = defaultdict(lambda: {"amount_due": 0.0, "amount_paid": 0.0})
+        for row in db.execute(
+            select(
+                month.label("month"),
+                func.sum(RepaymentSchedule.amount_due).label("amount_due"),
+                func.sum(RepaymentSchedule.amount_paid).label("amount_paid")
+            ).group_by(month)
+        ):
+            cash_flow[row.month].update(amount_due=row.amount_due, amount_paid=row.amount_paid)
+        # installments without a row (lazy schedules) are due and unpaid
+        for schedule, _ in ScheduleService.iter_unstored(db):
+            for month_due, amount in AnalyticsService._due_by_month(schedule):
+                cash_flow[month_due]["amount_due"] += amount
+        AnalyticsService._increment(db, PortfolioCashFlow, "month", [
+            {"month": month_due, **amounts} for month_due, amounts in cash_flow.items()
+        ])
+        db.commit()
+        
+        return {
+            "portfolio_loan_type_totals": len(loan_types),
+            "portfolio_status_counts": len(set(applications) | set(loans)),
+            "portfolio_cash_flow": len(cash_flow)
+        }
@@ -0,0 +1,155 @@
+# export service - streams whole tables to Arrow / Parquet for the data warehouse
+import enum
+import json
+from datetime import datetime
+from typing import BinaryIO, Iterator, Optional, Sequence
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import JSON, Boolean, DateTime, Enum, Float, Integer, Table, func, select
+from sqlalchemy.engine import Connection
+from fastapi import HTTPException, status
+from app.models.loan import Loan, LoanApplication
+from app.models.payment import Payment, RepaymentSchedule
+from app.utils.pagination import bind_value
+
+# tables the warehouse may pull; users are left out on purpose (password hashes)
+EXPORT_TABLES = {
+    "loans": Loan.__table__,
+    "loan_applications": LoanApplication.__table__,
+    "repayment_schedules": RepaymentSchedule.__table__,
+    "payments": Payment.__table__,
+}
+EXPORT_FORMATS = ("parquet", "arrow")
+
+
+class ExportService:
+    """Service class for columnar table exports"""
+    
+    @staticmethod
+    def get_table(table_name: str) -> Table:
+        """Look up an exportable table, 404 for anything else"""
+        table = EXPORT_TABLES.get(table_name)
+        if table is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Unknown export table, expected one of: {', '.join(EXPORT_TABLES)}"
+            )
+        return table
+    
+    @staticmethod
+    def arrow_schema(table: Table) -> pa.Schema:
+        """Arrow schema matching the table's columns (enums as their values, JSON as text)"""
+        fields = []
+        for column in table.columns:
+            if isinstance(column.type, Integer):
+                arrow_type = pa.int64()
+            elif isinstance(column.type, Float):
+                arrow_type = pa.float64()
+            elif isinstance(column.type, Boolean):
+                arrow_type = pa.bool_()
+            elif isinstance(column.type, DateTime):
+                arrow_type = pa.timestamp("us")
+            else:
+                arrow_type = pa.string()
+            fields.append(pa.field(column.name, arrow_type, nullable=column.nullable or not column.primary_key))
+        return pa.schema(fields)
+    
+    @staticmethod
+    def watermark_column(table: Table):
+        # rows that were never updated only carry created_at
+        if "updated_at" in table.c:
+            return func.coalesce(table.c.updated_at, table.c.created_at)
+        return table.c.created_at
+    
+    @staticmethod
+    def iter_record_batches(
+        connection: Connection,
+        table: Table,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        batch_size: int = 50000
+    ) -> Iterator[pa.RecordBatch]:
+        """Stream a table as Arrow record batches of at most batch_size rows
+        
+        Rows come from a server-side cursor (stream_results) one partition at a
+        time, so memory stays at one batch whatever the table size. since / until
+        select rows whose last change (updated_at, else created_at) lies in
+        (since, until] for incremental exports.
+        """
+        schema = ExportService.arrow_schema(table)
+        watermark = ExportService.watermark_column(table)
+        dialect_name = connection.dialect.name
+        stmt = select(table)
+        if since is not None:
+            stmt = stmt.where(watermark > bind_value(since, dialect_name))
+        if until is not None:
+            stmt = stmt.where(watermark <= bind_value(until, dialect_name))
+        
+        converters = [ExportService._converter(column) for column in table.columns]
+        result = connection.execution_options(stream_results=True, yield_per=batch_size).execute(stmt)
+        for rows in result.partitions():
+            columns = zip(*rows)
+            yield pa.record_batch(
+                [
+                    pa.array(values if convert is None else [convert(value) for value in values], type=field.type)
+                    for values, convert, field in zip(columns, converters, schema)
+                ],
+                schema=schema
+            )
+    
+    @staticmethod
+    def _converter(column):
+        if isinstance(column.type, Enum):
+            return lambda value: value.value if isinstance(value, enum.Enum) else value
+        if isinstance(column.type, JSON):
+            return lambda value: None if value is None else json.dumps(value)
+        if isinstance(column.type, DateTime):
+            # Arrow timestamps here are naive UTC
+            return lambda value: value.replace(tzinfo=None) if value is not None and value.tzinfo else value
+        return None
+    
+    @staticmethod
+    def write_export(
+        connections: Sequence[Connection],
+        table: Table,
+        sink: BinaryIO,
+        file_format: str = "parquet",
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        batch_size: int = 50000
+    ) -> int:
+        """Write a table to sink as a Parquet file or an Arrow IPC stream, returning the row count"""
+        rows = 0
+        for batch in ExportService.stream_export(connections, table, sink, file_format, since, until, batch_size):
+            rows += batch
+        return rows
+    
+    @staticmethod
+    def stream_export(
+        connections: Sequence[Connection],
+        table: Table,
+        sink: BinaryIO,
+        file_format: str = "parquet",
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        batch_size: int = 50000
+    ) -> Iterator[int]:
+        """Write the export batch by batch, yielding each batch's row count after it reaches sink
+        
+        Each batch becomes one Parquet row group (or one IPC message), so the sink
+        can be drained between batches. connections are the databases holding the
+        table (every shard when sharded); their rows go into the same file, one
+        database after the other.
+        """
+        schema = ExportService.arrow_schema(table)
+        if file_format == "parquet":
+            writer = pq.ParquetWriter(sink, schema, compression="zstd")
+        elif file_format == "arrow":
+            writer = pa.ipc.new_stream(sink, schema)
+        else:
+            raise ValueError(f"Unsupported export format: {file_format}")
+        with writer:
+            for connection in connections:
+                for batch in ExportService.iter_record_batches(connection, table, since, until, batch_size):
+                    writer.write_batch(batch)
+                    yield batch.num_rows
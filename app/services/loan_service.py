@@ -1,12 +1,37 @@
 # loan service - handles loan business logic
-from sqlalchemy.orm import Session
-from app.models.loan import LoanApplication, LoanStatus
+import asyncio
+from collections import defaultdict
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import insert, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+from app.config import settings
+from app.database import locate_borrower, shard_for_borrower
+from app.models.loan import Loan, LoanApplication, LoanStatus
 from app.models.payment import RepaymentSchedule
-from app.schemas.loan import LoanApplicationCreate, LoanApplicationUpdate
-from app.utils.loan_calculator import calculate_monthly_payment, generate_repayment_schedule
+from app.models.user import User
+from app.schemas.loan import LoanApplicationCreate, LoanApplicationResponse, LoanApplicationUpdate
+from app.services.analytics_service import AnalyticsService
+from app.services.schedule_service import ScheduleService
+from app.utils.concurrency import run_with_retry
+from app.utils.pagination import apply_keyset, page_from_rows
+from app.utils.sharding import merge_sorted
+from app.utils.serializers import RowSerializer
+from app.utils.streaming import iter_json_chunks
+from app.utils.loan_calculator import AmortizationTable, amortize_loans, calculate_monthly_payment, schedule_to_rows, summarize_schedule
 from fastapi import HTTPException, status
 from datetime import datetime
 
+# what the loan detail view walks: many-to-one borrower joined in, the schedule in one extra query
+LOAN_DETAIL_LOADERS = (joinedload(Loan.borrower), selectinload(Loan.repayments))
+
+# LoanApplicationResponse straight from rows; the model keeps requested_amount as loan_amount
+LOAN_APPLICATION_SERIALIZER = RowSerializer(
+    LoanApplicationResponse, LoanApplication, {"requested_amount": LoanApplication.loan_amount}
+)
+
 
 class LoanService:
     """Service class for loan operations"""
@@ -27,14 +52,18 @@ class LoanService:
             status=LoanStatus.PENDING
         )
         db.add(db_loan)
+        AnalyticsService.record_status_changes(db, application_deltas={LoanStatus.PENDING: 1})
         db.commit()
         db.refresh(db_loan)
         return db_loan
     
     @staticmethod
-    def get_loan_application_by_id(db: Session, loan_id: int) -> LoanApplication:
-        """Get loan application by ID"""
-        loan = db.query(LoanApplication).filter(LoanApplication.id == loan_id).first()
+    def get_loan_application_by_id(db: Session, loan_id: int, for_update: bool = False) -> LoanApplication:
+        """Get loan application by ID, row-locked with for_update where the backend supports it"""
+        query = db.query(LoanApplication).filter(LoanApplication.id == loan_id)
+        if for_update:
+            query = query.with_for_update().populate_existing()
+        loan = query.first()
         if not loan:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -42,6 +71,43 @@ class LoanService:
             )
         return loan
     
+    @staticmethod
+    async def get_loan_application_by_id_async(db: AsyncSession, loan_id: int) -> LoanApplication:
+        """Get loan application by ID (async)"""
+        loan = await db.get(LoanApplication, loan_id)
+        if not loan:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Loan application not found"
+            )
+        return loan
+    
+    @staticmethod
+    async def get_loan_detail_async(db: AsyncSession, loan_id: int, directory_db: Optional[AsyncSession] = None) -> Loan:
+        """Get a disbursed loan with its borrower and full repayment schedule (async)
+        
+        Always two queries: the loan joined to its borrower, then the schedule
+        with a selectin load, however many installments the loan has. With
+        directory_db (sharded loans) the borrower is read from there instead,
+        one more query. Installments without a row are computed from the loan terms.
+        """
+        loaders = LOAN_DETAIL_LOADERS if directory_db is None else (selectinload(Loan.repayments),)
+        result = await db.execute(
+            select(Loan).where(Loan.id == loan_id).options(*loaders)
+        )
+        loan = result.scalars().first()
+        if not loan:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Loan not found"
+            )
+        if directory_db is not None:
+            # users live on the directory; attach without making the shard session track the user
+            set_committed_value(loan, "borrower", await directory_db.get(User, loan.borrower_id))
+        if len(loan.repayments) < loan.loan_term_months:
+            set_committed_value(loan, "repayments", ScheduleService.merged_models(loan, loan.repayments))
+        return loan
+    
     @staticmethod
     def get_user_loans(db: Session, user_id: int, skip: int = 0, limit: int = 10):
         """Get all loans for a specific user"""
@@ -54,15 +120,137 @@ class LoanService:
         """Get all loan applications with pagination"""
         return db.query(LoanApplication).offset(skip).limit(limit).all()
     
+    @staticmethod
+    async def get_user_loans_async(db: AsyncSession, user_id: int, skip: int = 0, limit: int = 10):
+        """Get all loans for a specific user (async)"""
+        result = await db.execute(
+            select(LoanApplication).where(
+                LoanApplication.applicant_id == user_id
+            ).offset(skip).limit(limit)
+        )
+        return result.scalars().all()
+    
+    @staticmethod
+    async def get_all_loans_async(db: AsyncSession, skip: int = 0, limit: int = 10):
+        """Get all loan applications with pagination (async)"""
+        result = await db.execute(select(LoanApplication).offset(skip).limit(limit))
+        return result.scalars().all()
+    
+    @staticmethod
+    def _listing_query(user_id: Optional[int]):
+        # the LoanApplicationResponse fields as plain columns, for serialized and streamed listings
+        stmt = select(*LOAN_APPLICATION_SERIALIZER.columns)
+        if user_id is not None:
+            stmt = stmt.where(LoanApplication.applicant_id == user_id)
+        return stmt
+    
+    @staticmethod
+    async def get_loans_json_async(
+        db: AsyncSession, user_id: Optional[int] = None, skip: int = 0, limit: int = 10, cursor: Optional[str] = None
+    ) -> bytes:
+        """Get loan applications (all, or one user's) already encoded as JSON
+        
+        Same output as the response_model path, without building a pydantic model per
+        row. With a cursor the result is a keyset page ordered by (created_at, id).
+        """
+        stmt = LoanService._listing_query(user_id)
+        if cursor is None:
+            rows = (await db.execute(stmt.offset(skip).limit(limit))).all()
+            return LOAN_APPLICATION_SERIALIZER.dumps(rows)
+        stmt = apply_keyset(
+            stmt, [LoanApplication.created_at, LoanApplication.id], cursor, limit, db.get_bind().dialect.name
+        )
+        rows, next_cursor = page_from_rows((await db.execute(stmt)).all(), limit, lambda row: (row.created_at, row.id))
+        return LOAN_APPLICATION_SERIALIZER.dumps_page(rows, next_cursor)
+    
+    @staticmethod
+    def stream_loans_async(
+        db: AsyncSession, stream_format: str, user_id: Optional[int] = None, skip: int = 0, limit: int = 10
+    ) -> AsyncIterator[bytes]:
+        """Stream loan applications (all, or one user's) as NDJSON or a JSON array"""
+        stmt = LoanService._listing_query(user_id).order_by(LoanApplication.id).offset(skip).limit(limit)
+        return iter_json_chunks(db, stmt, stream_format)
+    
+    @staticmethod
+    async def get_user_loans_page_async(
+        db: AsyncSession, user_id: int, cursor: Optional[str] = None, limit: int = 10
+    ) -> Tuple[List[LoanApplication], Optional[str]]:
+        """Get one keyset page of a user's loans, ordered by (created_at, id)"""
+        stmt = apply_keyset(
+            select(LoanApplication).where(LoanApplication.applicant_id == user_id),
+            [LoanApplication.created_at, LoanApplication.id],
+            cursor, limit, db.get_bind().dialect.name
+        )
+        rows = (await db.execute(stmt)).scalars().all()
+        return page_from_rows(rows, limit, lambda loan: (loan.created_at, loan.id))
+    
+    @staticmethod
+    async def get_all_loans_page_async(
+        db: AsyncSession, cursor: Optional[str] = None, limit: int = 10
+    ) -> Tuple[List[LoanApplication], Optional[str]]:
+        """Get one keyset page of all loan applications, ordered by (created_at, id)"""
+        stmt = apply_keyset(
+            select(LoanApplication),
+            [LoanApplication.created_at, LoanApplication.id],
+            cursor, limit, db.get_bind().dialect.name
+        )
+        rows = (await db.execute(stmt)).scalars().all()
+        return page_from_rows(rows, limit, lambda loan: (loan.created_at, loan.id))
+    
+    @staticmethod
+    async def get_all_loans_across_shards_async(
+        shard_dbs: Sequence[AsyncSession], skip: int = 0, limit: int = 10
+    ) -> List[LoanApplication]:
+        """Get loan applications from every shard, ordered by (created_at, id) (async)
+        
+        Each shard returns its first skip + limit applications, all shards are queried
+        at once and the sorted results merged, so the page is the one a single
+        database would return. Deep offsets cost skip + limit rows per shard; prefer
+        the cursor variant for paging far.
+        """
+        stmt = select(LoanApplication).order_by(LoanApplication.created_at, LoanApplication.id).limit(skip + limit)
+        results = await asyncio.gather(*(db.execute(stmt) for db in shard_dbs))
+        loans = merge_sorted(
+            (result.scalars().all() for result in results), lambda loan: (loan.created_at, loan.id), skip + limit
+        )
+        return loans[skip:]
+    
+    @staticmethod
+    async def get_all_loans_page_across_shards_async(
+        shard_dbs: Sequence[AsyncSession], cursor: Optional[str] = None, limit: int = 10
+    ) -> Tuple[List[LoanApplication], Optional[str]]:
+        """Get one keyset page of all loan applications across shards, ordered by (created_at, id)"""
+        async def shard_page(db: AsyncSession) -> List[LoanApplication]:
+            stmt = apply_keyset(
+                select(LoanApplication), [LoanApplication.created_at, LoanApplication.id],
+                cursor, limit, db.get_bind().dialect.name
+            )
+            return (await db.execute(stmt)).scalars().all()
+        
+        pages = await asyncio.gather(*(shard_page(db) for db in shard_dbs))
+        # each shard fetched one look-ahead row, so page_from_rows still sees whether more exist
+        rows = merge_sorted(pages, lambda loan: (loan.created_at, loan.id), limit + 1)
+        return page_from_rows(rows, limit, lambda loan: (loan.created_at, loan.id))
+    
     @staticmethod
     def update_loan_application(db: Session, loan_id: int, loan_update: LoanApplicationUpdate) -> LoanApplication:
         """Update loan application"""
-        db_loan = LoanService.get_loan_application_by_id(db, loan_id)
+        return run_with_retry(db, lambda: LoanService._update_loan_application_once(db, loan_id, loan_update))
+    
+    @staticmethod
+    def _update_loan_application_once(db: Session, loan_id: int, loan_update: LoanApplicationUpdate) -> LoanApplication:
+        db_loan = LoanService.get_loan_application_by_id(db, loan_id, for_update=True)
+        previous_status = db_loan.status
         
         update_data = loan_update.dict(exclude_unset=True)
         for field, value in update_data.items():
             setattr(db_loan, field, value)
         
+        if db_loan.status != previous_status:
+            AnalyticsService.record_status_changes(
+                db, application_deltas={previous_status: -1, db_loan.status: 1}
+            )
+        
         db_loan.updated_at = datetime.utcnow()
         db.add(db_loan)
         db.commit()
@@ -72,7 +260,11 @@ class LoanService:
     @staticmethod
     def approve_loan(db: Session, loan_id: int) -> LoanApplication:
         """Approve a loan application and generate repayment schedule"""
-        db_loan = LoanService.get_loan_application_by_id(db, loan_id)
+        return run_with_retry(db, lambda: LoanService._approve_loan_once(db, loan_id))
+    
+    @staticmethod
+    def _approve_loan_once(db: Session, loan_id: int) -> LoanApplication:
+        db_loan = LoanService.get_loan_application_by_id(db, loan_id, for_update=True)
         
         if db_loan.status != LoanStatus.PENDING:
             raise HTTPException(
@@ -80,29 +272,169 @@ class LoanService:
                 detail="Only pending loans can be approved"
             )
         
-        db_loan.status = LoanStatus.APPROVED
-        db_loan.updated_at = datetime.utcnow()
-        
-        # Generate repayment schedule
-        repayment_schedule = generate_repayment_schedule(
-            loan_amount=db_loan.loan_amount,
-            interest_rate=db_loan.interest_rate,
-            term_months=db_loan.loan_term_months,
-            loan_id=loan_id
-        )
-        
-        for schedule in repayment_schedule:
-            db.add(schedule)
+        LoanService._approve_applications(db, [db_loan])
         
         db.add(db_loan)
         db.commit()
         db.refresh(db_loan)
         return db_loan
     
+    @staticmethod
+    def approve_loans(db: Session, loan_ids: Sequence[int], chunk_size: int = 10000) -> List[dict]:
+        """Approve many loan applications in one transaction
+        
+        Applications are loaded with IN queries (chunked to stay under backend bind
+        parameter limits), amortized together and their schedules bulk inserted.
+        Missing or non-pending applications are reported as failures without
+        affecting the rest. If the combined write fails, each application is
+        retried in its own savepoint so one bad row cannot roll back the others.
+        
+        Returns:
+            One result dict per requested ID, in request order
+        """
+        loan_ids = list(dict.fromkeys(loan_ids))
+        applications = {}
+        for start in range(0, len(loan_ids), chunk_size):
+            chunk = loan_ids[start:start + chunk_size]
+            for application in db.query(LoanApplication).filter(LoanApplication.id.in_(chunk)).with_for_update():
+                applications[application.id] = application
+        
+        errors = {}
+        approvable = []
+        for loan_id in loan_ids:
+            application = applications.get(loan_id)
+            if application is None:
+                errors[loan_id] = "Loan application not found"
+            elif application.status != LoanStatus.PENDING:
+                errors[loan_id] = "Only pending loans can be approved"
+            else:
+                approvable.append(application)
+        
+        try:
+            LoanService._approve_applications(db, approvable)
+            db.commit()
+        except SQLAlchemyError:
+            db.rollback()
+            for application in approvable:
+                # reloaded after the rollback, so a concurrent reject is seen here
+                if application.status != LoanStatus.PENDING:
+                    errors[application.id] = "Only pending loans can be approved"
+                    continue
+                try:
+                    with db.begin_nested():
+                        LoanService._approve_applications(db, [application])
+                except SQLAlchemyError as exc:
+                    errors[application.id] = f"Database error: {exc.__class__.__name__}"
+            db.commit()
+        
+        return [
+            {"loan_id": loan_id, "approved": loan_id not in errors, "detail": errors.get(loan_id)}
+            for loan_id in loan_ids
+        ]
+    
+    @staticmethod
+    def approve_loans_across_shards(shard_sessions: Dict[str, Session], loan_ids: Sequence[int]) -> List[dict]:
+        """approve_loans for applications spread over shards: one transaction per shard
+        
+        Applications found on no shard are passed to the first one, which reports
+        them as not found.
+        
+        Returns:
+            One result dict per requested ID, in request order
+        """
+        loan_ids = list(dict.fromkeys(loan_ids))
+        first_shard = next(iter(shard_sessions))
+        by_shard = defaultdict(list)
+        for loan_id in loan_ids:
+            applicant_id = locate_borrower(LoanApplication, loan_id)
+            shard_id = first_shard if applicant_id is None else shard_for_borrower(applicant_id)
+            by_shard[shard_id].append(loan_id)
+        results = {}
+        for shard_id, shard_loan_ids in by_shard.items():
+            for result in LoanService.approve_loans(shard_sessions[shard_id], shard_loan_ids):
+                results[result["loan_id"]] = result
+        return [results[loan_id] for loan_id in loan_ids]
+    
+    @staticmethod
+    def _approve_applications(db: Session, applications: List[LoanApplication]) -> List[Loan]:
+        """Approve applications, create their loans and bulk insert the schedules (no commit)"""
+        if not applications:
+            return []
+        
+        now = datetime.utcnow()
+        for application in applications:
+            application.status = LoanStatus.APPROVED
+            application.updated_at = now
+        
+        # Generate every repayment schedule in one vectorized pass
+        repayment_schedule = amortize_loans(
+            loan_amounts=[a.loan_amount for a in applications],
+            interest_rates=[a.interest_rate for a in applications],
+            term_months=[a.loan_term_months for a in applications],
+            start_dates=now
+        )
+        
+        # the loan carries the running totals that payments keep up to date
+        loans = [
+            Loan(
+                application_id=application.id,
+                borrower_id=application.applicant_id,
+                loan_type=application.loan_type,
+                principal_amount=application.loan_amount,
+                interest_rate=application.interest_rate,
+                loan_term_months=application.loan_term_months,
+                monthly_payment=totals["monthly_payment"],
+                outstanding_balance=totals["total_due"],
+                total_paid=0.0,
+                start_date=now,
+                end_date=totals["end_date"]
+            )
+            for application, totals in zip(applications, summarize_schedule(repayment_schedule, len(applications)))
+        ]
+        db.add_all(loans)
+        db.flush()
+        
+        stored_schedule = repayment_schedule
+        if settings.LAZY_REPAYMENT_SCHEDULES:
+            # installments are computed when read and stored once they see activity
+            stored_schedule = ScheduleService.eager_part(repayment_schedule)
+        LoanService.insert_repayment_schedules(db, stored_schedule, [loan.id for loan in loans])
+        
+        AnalyticsService.record_status_changes(
+            db, application_deltas={LoanStatus.PENDING: -len(applications), LoanStatus.APPROVED: len(applications)}
+        )
+        AnalyticsService.record_loans_disbursed(db, loans, repayment_schedule)
+        db.flush()
+        return loans
+    
+    @staticmethod
+    def insert_repayment_schedules(db: Session, schedule: AmortizationTable, loan_ids: Sequence[int]) -> List[int]:
+        """Bulk insert repayment schedules without going through the unit of work
+        
+        Rows are sent as a single executemany, which SQLAlchemy batches into
+        multi-row INSERTs. On backends that support RETURNING with executemany
+        (PostgreSQL, SQLite >= 3.35) the new schedule IDs are returned, otherwise
+        an empty list. Nothing is committed here.
+        """
+        rows = schedule_to_rows(schedule, loan_ids)
+        if not rows:
+            return []
+        
+        if db.get_bind().dialect.insert_executemany_returning:
+            result = db.execute(insert(RepaymentSchedule).returning(RepaymentSchedule.id, sort_by_parameter_order=True), rows)
+            return list(result.scalars())
+        
+        db.execute(insert(RepaymentSchedule), rows)
+        return []
+    
     @staticmethod
     def reject_loan(db: Session, loan_id: int, reason: str = None) -> LoanApplication:
         """Reject a loan application"""
-        db_loan = LoanService.get_loan_application_by_id(db, loan_id)
+        return run_with_retry(db, lambda: LoanService._reject_loan_once(db, loan_id, reason))
+    
+    @staticmethod
+    def _reject_loan_once(db: Session, loan_id: int, reason: str = None) -> LoanApplication:
+        db_loan = LoanService.get_loan_application_by_id(db, loan_id, for_update=True)
         
         if db_loan.status != LoanStatus.PENDING:
             raise HTTPException(
@@ -113,6 +445,9 @@ class LoanService:
         db_loan.status = LoanStatus.REJECTED
         db_loan.review_comments = reason
         db_loan.updated_at = datetime.utcnow()
+        AnalyticsService.record_status_changes(
+            db, application_deltas={LoanStatus.PENDING: -1, LoanStatus.REJECTED: 1}
+        )
         
         db.add(db_loan)
         db.commit()
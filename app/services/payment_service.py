@@ -1,32 +1,132 @@
 # payment service - handles payment business logic
+import asyncio
+from collections import defaultdict
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from sqlalchemy import bindparam, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.models.payment import RepaymentSchedule, PaymentStatus
+from sqlalchemy.orm.exc import StaleDataError
+import orjson
+from app.config import settings
+from app.database import locate_borrower, shard_for_borrower
+from app.models.loan import Loan, LoanStatus
+from app.models.payment import Payment, RepaymentSchedule, PaymentStatus
 from app.schemas.payment import PaymentCreate
+from app.services.analytics_service import OVERDUE_STATUSES, AnalyticsService
+from app.services.schedule_service import REPAYMENT_SCHEDULE_SERIALIZER, ScheduleService
+from app.utils.cache import BloomFilter
+from app.utils.concurrency import run_with_retry
+from app.utils.loan_calculator import VIRTUAL_ID_STRIDE, split_virtual_schedule_id
+from app.utils.pagination import decode_cursor, page_from_rows
+from app.utils.settlement import chunked
+from app.utils.serializers import ORJSON_OPTIONS
+from app.utils.streaming import iter_json_chunks
 from fastapi import HTTPException, status
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
+import numpy as np
+
+
+# amounts closer than this are considered equal (rounding of float money columns)
+BALANCE_TOLERANCE = 0.005
+
+# transaction references this process has recently written or seen replayed
+recent_references = BloomFilter(settings.IDEMPOTENCY_BLOOM_CAPACITY, settings.IDEMPOTENCY_BLOOM_ERROR_RATE)
 
 
 class PaymentService:
     """Service class for payment operations"""
     
     @staticmethod
-    def get_loan_repayment_schedule(db: Session, loan_id: int, skip: int = 0, limit: int = 10):
-        """Get repayment schedule for a loan"""
-        schedules = db.query(RepaymentSchedule).filter(
-            RepaymentSchedule.loan_id == loan_id
-        ).offset(skip).limit(limit).all()
-        
-        if not schedules:
+    def _schedule_or_404(installments: Optional[List[dict]]) -> List[dict]:
+        if not installments:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="No repayment schedule found for this loan"
             )
+        return installments
+    
+    @staticmethod
+    def get_loan_repayment_schedule(db: Session, loan_id: int, skip: int = 0, limit: int = 10) -> List[dict]:
+        """Get repayment schedule for a loan
+        
+        Stored installments merged over the ones computed from the loan terms
+        (see ScheduleService), in one query.
+        """
+        first = max(skip, 0) + 1
+        rows = db.execute(ScheduleService.range_query(loan_id, first, first + limit - 1)).all()
+        return PaymentService._schedule_or_404(ScheduleService.merge_range(rows, first, first + limit - 1))
+    
+    @staticmethod
+    async def get_loan_repayment_schedule_async(db: AsyncSession, loan_id: int, skip: int = 0, limit: int = 10) -> List[dict]:
+        """Get repayment schedule for a loan (async)"""
+        first = max(skip, 0) + 1
+        rows = (await db.execute(ScheduleService.range_query(loan_id, first, first + limit - 1))).all()
+        return PaymentService._schedule_or_404(ScheduleService.merge_range(rows, first, first + limit - 1))
+    
+    @staticmethod
+    def _first_after_cursor(cursor: Optional[str]) -> int:
+        # cursors hold (loan_id, installment_number) of the last installment on the previous page
+        if not cursor:
+            return 1
+        _, installment_number = decode_cursor(cursor, 2)
+        if not isinstance(installment_number, int):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid pagination cursor"
+            )
+        return installment_number + 1
+    
+    @staticmethod
+    async def get_loan_repayment_schedule_page_async(
+        db: AsyncSession, loan_id: int, cursor: Optional[str] = None, limit: int = 10
+    ) -> Tuple[List[dict], Optional[str]]:
+        """Get one keyset page of a loan's schedule, ordered by (loan_id, installment_number)"""
+        first = PaymentService._first_after_cursor(cursor)
+        # one installment past the page tells page_from_rows whether another page exists
+        rows = (await db.execute(ScheduleService.range_query(loan_id, first, first + limit))).all()
+        installments = ScheduleService.merge_range(rows, first, first + limit) or []
+        
+        if not installments and not cursor:
+            PaymentService._schedule_or_404(installments)
+        
+        return page_from_rows(installments, limit, lambda s: (s["loan_id"], s["installment_number"]))
+    
+    @staticmethod
+    async def get_loan_repayment_schedule_json_async(
+        db: AsyncSession, loan_id: int, skip: int = 0, limit: int = 10, cursor: Optional[str] = None
+    ) -> bytes:
+        """Get a loan's repayment schedule already encoded as JSON, without a pydantic model per row
         
-        return schedules
+        With a cursor the result is a keyset page ordered by (loan_id, installment_number).
+        """
+        if cursor is None:
+            installments = await PaymentService.get_loan_repayment_schedule_async(db, loan_id, skip=skip, limit=limit)
+            return orjson.dumps(installments, option=ORJSON_OPTIONS)
+        installments, next_cursor = await PaymentService.get_loan_repayment_schedule_page_async(
+            db, loan_id, cursor=cursor, limit=limit
+        )
+        return orjson.dumps({"items": installments, "next_cursor": next_cursor}, option=ORJSON_OPTIONS)
     
     @staticmethod
-    def get_repayment_schedule_by_id(db: Session, schedule_id: int) -> RepaymentSchedule:
-        """Get a specific repayment schedule"""
+    def _installment_or_404(installments: Optional[List[dict]]) -> dict:
+        if not installments:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Repayment schedule not found"
+            )
+        return installments[0]
+    
+    @staticmethod
+    def get_repayment_schedule_by_id(db: Session, schedule_id: int):
+        """Get a specific repayment schedule, stored or (for a virtual id) computed"""
+        installment = split_virtual_schedule_id(schedule_id)
+        if installment is not None:
+            loan_id, number = installment
+            rows = db.execute(ScheduleService.range_query(loan_id, number, number)).all()
+            return PaymentService._installment_or_404(ScheduleService.merge_range(rows, number, number))
+        
         schedule = db.query(RepaymentSchedule).filter(
             RepaymentSchedule.id == schedule_id
         ).first()
@@ -40,10 +140,138 @@ class PaymentService:
         return schedule
     
     @staticmethod
-    def make_payment(db: Session, schedule_id: int, amount: float, payment_method: str, transaction_reference: str):
-        """Record a payment against a repayment schedule"""
-        schedule = PaymentService.get_repayment_schedule_by_id(db, schedule_id)
+    def get_repayment_schedule_for_update(db: Session, schedule_id: int) -> RepaymentSchedule:
+        """Get a repayment schedule about to be modified
+        
+        Row-locked with SELECT ... FOR UPDATE where the backend supports it (SQLite
+        ignores it); the version column catches a concurrent write either way.
+        A virtual schedule id gets its row written first (no commit).
+        """
+        schedule = ScheduleService.load_for_update(db, [schedule_id]).get(schedule_id)
+        
+        if not schedule:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Repayment schedule not found"
+            )
+        
+        return schedule
+    
+    @staticmethod
+    async def get_repayment_schedule_by_id_async(db: AsyncSession, schedule_id: int):
+        """Get a specific repayment schedule, stored or (for a virtual id) computed (async)"""
+        installment = split_virtual_schedule_id(schedule_id)
+        if installment is not None:
+            loan_id, number = installment
+            rows = (await db.execute(ScheduleService.range_query(loan_id, number, number))).all()
+            return PaymentService._installment_or_404(ScheduleService.merge_range(rows, number, number))
+        
+        schedule = await db.get(RepaymentSchedule, schedule_id)
+        
+        if not schedule:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Repayment schedule not found"
+            )
+        
+        return schedule
+    
+    @staticmethod
+    def make_payment(
+        db: Session,
+        schedule_id: int,
+        amount: float,
+        payment_method: str,
+        transaction_reference: str,
+        processed_by_id: Optional[int] = None
+    ):
+        """Record a payment against a repayment schedule
+        
+        The installment, the append-only payments ledger and the loan's running
+        totals are all written in the same transaction. Retrying with the same
+        transaction_reference returns the original result instead of paying twice.
+        """
+        # a bloom filter hit is most likely a retry: answer it before locking the installment;
+        # a miss goes straight to the payment, with the unique reference as the backstop
+        if transaction_reference in recent_references:
+            replay = PaymentService._replayed_result(db, schedule_id, amount, transaction_reference)
+            if replay is not None:
+                return replay
         
+        return run_with_retry(db, lambda: PaymentService._make_payment_once(
+            db, schedule_id, amount, payment_method, transaction_reference, processed_by_id
+        ))
+    
+    @staticmethod
+    def _make_payment_once(
+        db: Session,
+        schedule_id: int,
+        amount: float,
+        payment_method: str,
+        transaction_reference: str,
+        processed_by_id: Optional[int]
+    ) -> dict:
+        """One attempt at a payment; StaleDataError if the installment changed under us"""
+        schedule = PaymentService.get_repayment_schedule_for_update(db, schedule_id)
+        try:
+            result = PaymentService._apply_payment(
+                db, schedule, amount, payment_method, transaction_reference, processed_by_id
+            )
+        except HTTPException:
+            # a payment that no longer fits may be the retry of one that settled the installment
+            # (after a restart, or from another worker), which the bloom filter cannot know about
+            replay = PaymentService._replayed_result(db, schedule_id, amount, transaction_reference)
+            if replay is None:
+                raise
+            db.rollback()
+            return replay
+        
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            replay = PaymentService._replayed_result(db, schedule_id, amount, transaction_reference)
+            if replay is None:
+                raise
+            return replay
+        
+        recent_references.add(transaction_reference)
+        return result
+    
+    @staticmethod
+    def _replayed_result(db: Session, schedule_id: int, amount: float, transaction_reference: str) -> Optional[dict]:
+        """Return the stored result for an already processed reference, None if it is new"""
+        payment = db.execute(
+            select(Payment.schedule_id, Payment.amount, Payment.idempotency_result)
+            .where(Payment.transaction_reference == transaction_reference)
+        ).first()
+        if payment is None:
+            return None
+        
+        recent_references.add(transaction_reference)
+        if (not ScheduleService.same_installment(db, schedule_id, payment.schedule_id)
+                or abs(payment.amount - amount) > BALANCE_TOLERANCE):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Transaction reference was already used for a different payment"
+            )
+        # ledger rows written before results were stored
+        return payment.idempotency_result or {
+            "schedule_id": payment.schedule_id,
+            "amount_paid": payment.amount,
+            "transaction_reference": transaction_reference
+        }
+    
+    @staticmethod
+    def _apply_payment(
+        db: Session,
+        schedule: RepaymentSchedule,
+        amount: float,
+        payment_method: str,
+        transaction_reference: str,
+        processed_by_id: Optional[int] = None
+    ) -> dict:
+        """Apply a payment to a loaded installment, write its ledger entry and loan totals (no commit)"""
         if amount <= 0:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -58,8 +286,41 @@ class PaymentService:
                 detail=f"Payment amount exceeds remaining balance ({remaining_amount})"
             )
         
+        now = datetime.utcnow()
+        overdue_before = PaymentService._overdue_amount(schedule)
+        result = PaymentService._pay_installment(schedule, amount, transaction_reference, now)
+        db.add(schedule)
+        
+        # append-only ledger entry
+        db.add(Payment(**PaymentService._ledger_row(
+            schedule, amount, payment_method, transaction_reference, processed_by_id, now, result
+        )))
+        
+        loans = Loan.__table__
+        loan = db.execute(
+            PaymentService._loan_totals_update().returning(loans.c.loan_type, loans.c.outstanding_balance, loans.c.status),
+            {"b_loan_id": schedule.loan_id, "b_amount": amount, "b_now": now}
+        ).one()
+        if loan.outstanding_balance <= BALANCE_TOLERANCE and loan.status != LoanStatus.PAID_OFF:
+            PaymentService._close_paid_off_loans(db, [schedule.loan_id], now)
+        AnalyticsService.record_payments(db, [(
+            schedule.loan_id, schedule.due_date, amount, PaymentService._overdue_amount(schedule) - overdue_before
+        )], loan_types={schedule.loan_id: loan.loan_type})
+        return result
+    
+    @staticmethod
+    def _overdue_amount(schedule: RepaymentSchedule) -> float:
+        """Unpaid part of an installment if it is LATE or MISSED, else 0"""
+        if schedule.status in OVERDUE_STATUSES:
+            return schedule.amount_due - schedule.amount_paid
+        return 0.0
+    
+    @staticmethod
+    def _pay_installment(schedule: RepaymentSchedule, amount: float, transaction_reference: str, now: datetime) -> dict:
+        """Add a validated amount to an installment and update its status"""
+        remaining_amount = schedule.amount_due - schedule.amount_paid
         schedule.amount_paid += amount
-        schedule.payment_date = datetime.utcnow()
+        schedule.payment_date = now
         
         # Update status based on payment
         if schedule.amount_paid >= schedule.amount_due:
@@ -69,11 +330,7 @@ class PaymentService:
         else:
             schedule.status = PaymentStatus.PAID
         
-        schedule.updated_at = datetime.utcnow()
-        db.add(schedule)
-        db.commit()
-        db.refresh(schedule)
-        
+        schedule.updated_at = now
         return {
             "schedule_id": schedule.id,
             "amount_paid": amount,
@@ -84,40 +341,318 @@ class PaymentService:
         }
     
     @staticmethod
-    def get_payment_history(db: Session, loan_id: int):
-        """Get payment history for a loan"""
-        schedules = db.query(RepaymentSchedule).filter(
-            RepaymentSchedule.loan_id == loan_id
-        ).all()
+    def _ledger_row(
+        schedule: RepaymentSchedule,
+        amount: float,
+        payment_method: str,
+        transaction_reference: str,
+        processed_by_id: Optional[int],
+        now: datetime,
+        result: dict
+    ) -> dict:
+        return {
+            "loan_id": schedule.loan_id,
+            "schedule_id": schedule.id,
+            "amount": amount,
+            "payment_date": now,
+            "payment_method": payment_method,
+            "transaction_reference": transaction_reference,
+            "processed_by_id": processed_by_id,
+            "processed_at": now,
+            "idempotency_result": result
+        }
+    
+    @staticmethod
+    def _loan_totals_update():
+        # running totals are adjusted in SQL so concurrent payments on one loan add up;
+        # a Core statement with bind parameters so a batch of loans goes out as one executemany
+        loans = Loan.__table__
+        return update(loans).where(loans.c.id == bindparam("b_loan_id")).values(
+            outstanding_balance=loans.c.outstanding_balance - bindparam("b_amount"),
+            total_paid=loans.c.total_paid + bindparam("b_amount"),
+            updated_at=bindparam("b_now")
+        )
+    
+    @staticmethod
+    def _close_paid_off_loans(db: Session, loan_ids: Iterable[int], now: datetime):
+        """Mark loans whose outstanding balance reached zero as PAID_OFF (no commit)"""
+        paid_off = (
+            Loan.id.in_(set(loan_ids)),
+            Loan.outstanding_balance <= BALANCE_TOLERANCE,
+            Loan.status != LoanStatus.PAID_OFF
+        )
+        # the totals UPDATE just before already holds these rows' locks
+        closed = dict(db.execute(select(Loan.status, func.count()).where(*paid_off).group_by(Loan.status)).all())
+        if not closed:
+            return
+        db.execute(
+            update(Loan).where(*paid_off).values(status=LoanStatus.PAID_OFF, updated_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        AnalyticsService.record_status_changes(
+            db, loan_deltas={**{status: -count for status, count in closed.items()}, LoanStatus.PAID_OFF: sum(closed.values())}
+        )
+    
+    @staticmethod
+    def ingest_payments(
+        db: Session,
+        records: Iterable[dict],
+        processed_by_id: Optional[int] = None,
+        chunk_size: int = 1000
+    ) -> Iterator[dict]:
+        """Apply a stream of settlement records in batched transactions
+        
+        Records are consumed chunk_size at a time, so a file of any length is never
+        held in memory. Each chunk resolves its schedules and already-used transaction
+        references with one IN query each, applies every valid payment, writes the
+        ledger rows and loan totals as executemany statements and commits once.
+        A reference seen earlier (in the database or in the file) is reported as a
+        duplicate and not applied again.
+        
+        Args:
+            records: Parsed records, see app.utils.settlement.parse_settlement_lines
+            processed_by_id: User recorded on the ledger rows
+            chunk_size: Records per transaction
+        
+        Returns:
+            An iterator with one result dict per record, in input order
+        """
+        for chunk in chunked(records, chunk_size):
+            yield from PaymentService._ingest_chunk(db, chunk, processed_by_id)
+    
+    @staticmethod
+    def ingest_payments_across_shards(
+        shard_sessions: Dict[str, Session],
+        records: Iterable[dict],
+        processed_by_id: Optional[int] = None,
+        chunk_size: int = 1000
+    ) -> Iterator[dict]:
+        """ingest_payments for schedules spread over shards: each chunk is split by the borrower shard of its schedules
+        
+        Every shard applies its part of a chunk in its own transaction. References already
+        used on any shard, or earlier in the chunk, are reported as duplicates. Malformed
+        records and schedules found on no shard go to the first shard, which rejects them;
+        borrowers whose bucket is being moved are rejected with the 503 detail. With a
+        single session this is ingest_payments.
+        
+        Returns:
+            An iterator with one result dict per record, in input order
+        """
+        if len(shard_sessions) == 1:
+            yield from PaymentService.ingest_payments(
+                next(iter(shard_sessions.values())), records, processed_by_id, chunk_size
+            )
+            return
+        
+        first_shard = next(iter(shard_sessions))
+        for chunk in chunked(records, chunk_size):
+            references = [record["transaction_reference"] for record in chunk if "error" not in record]
+            used = set()
+            for db in shard_sessions.values() if references else ():
+                used.update(db.scalars(
+                    select(Payment.transaction_reference).where(Payment.transaction_reference.in_(references))
+                ))
+                # end the read transaction so shards without records in this chunk hold no locks
+                db.rollback()
+            
+            results = {}
+            by_shard = defaultdict(list)
+            for position, record in enumerate(chunk):
+                shard_id = first_shard
+                if "error" not in record:
+                    if record["transaction_reference"] in used:
+                        results[position] = PaymentService._ingest_result(
+                            record, "duplicate", "Transaction reference already processed"
+                        )
+                        continue
+                    used.add(record["transaction_reference"])
+                    borrower_id = locate_borrower(RepaymentSchedule, record["schedule_id"])
+                    if borrower_id is not None:
+                        try:
+                            shard_id = shard_for_borrower(borrower_id)
+                        except HTTPException as exc:
+                            results[position] = PaymentService._ingest_result(record, "rejected", exc.detail)
+                            continue
+                by_shard[shard_id].append((position, record))
+            
+            for shard_id, routed in by_shard.items():
+                shard_results = PaymentService._ingest_chunk(
+                    shard_sessions[shard_id], [record for _, record in routed], processed_by_id
+                )
+                for (position, _), result in zip(routed, shard_results):
+                    results[position] = result
+            yield from (results[position] for position in range(len(chunk)))
+    
+    @staticmethod
+    def _ingest_result(record: dict, outcome: str, detail: Optional[str]) -> dict:
+        return {
+            "line": record["line"],
+            "transaction_reference": record.get("transaction_reference"),
+            "schedule_id": record.get("schedule_id"),
+            "status": outcome,
+            "detail": detail
+        }
+    
+    @staticmethod
+    def _ingest_chunk(db: Session, chunk: List[dict], processed_by_id: Optional[int]) -> List[dict]:
+        valid = [record for record in chunk if "error" not in record]
+        references = [record["transaction_reference"] for record in valid]
+        used = set(db.scalars(
+            select(Payment.transaction_reference).where(Payment.transaction_reference.in_(references))
+        )) if references else set()
+        # keyed by the schedule id in the record, which may be virtual
+        schedules = ScheduleService.load_for_update(db, {record["schedule_id"] for record in valid}) if valid else {}
+        
+        now = datetime.utcnow()
+        results = []
+        ledger_rows = []
+        loan_amounts = {}
+        analytics = []
+        applied = []
+        for record in chunk:
+            result = {
+                "line": record["line"],
+                "transaction_reference": record.get("transaction_reference"),
+                "schedule_id": record.get("schedule_id")
+            }
+            results.append(result)
+            schedule = schedules.get(record.get("schedule_id"))
+            
+            if "error" in record:
+                result.update(status="rejected", detail=record["error"])
+            elif record["transaction_reference"] in used:
+                result.update(status="duplicate", detail="Transaction reference already processed")
+            elif schedule is None:
+                result.update(status="rejected", detail="Repayment schedule not found")
+            elif record["amount"] <= 0:
+                result.update(status="rejected", detail="Payment amount must be positive")
+            elif record["amount"] > schedule.amount_due - schedule.amount_paid:
+                result.update(
+                    status="rejected",
+                    detail=f"Payment amount exceeds remaining balance ({schedule.amount_due - schedule.amount_paid})"
+                )
+            else:
+                used.add(record["transaction_reference"])
+                overdue_before = PaymentService._overdue_amount(schedule)
+                paid = PaymentService._pay_installment(schedule, record["amount"], record["transaction_reference"], now)
+                analytics.append((
+                    schedule.loan_id, schedule.due_date, record["amount"],
+                    PaymentService._overdue_amount(schedule) - overdue_before
+                ))
+                result.update(status="applied", detail=None, remaining=paid["remaining"])
+                ledger_rows.append(PaymentService._ledger_row(
+                    schedule, record["amount"], record["payment_method"], record["transaction_reference"],
+                    processed_by_id, now, paid
+                ))
+                loan_amounts[schedule.loan_id] = loan_amounts.get(schedule.loan_id, 0.0) + record["amount"]
+                applied.append((record, result))
+        
+        if not ledger_rows:
+            db.rollback()
+            return results
         
+        try:
+            db.flush()
+            db.execute(insert(Payment), ledger_rows)
+            db.execute(
+                PaymentService._loan_totals_update(),
+                [{"b_loan_id": loan_id, "b_amount": amount, "b_now": now} for loan_id, amount in loan_amounts.items()]
+            )
+            PaymentService._close_paid_off_loans(db, loan_amounts, now)
+            AnalyticsService.record_payments(db, analytics)
+            db.commit()
+            for record, _ in applied:
+                recent_references.add(record["transaction_reference"])
+        except (IntegrityError, StaleDataError):
+            # a reference or an installment was written concurrently; redo this chunk one payment per savepoint
+            db.rollback()
+            for record, result in applied:
+                try:
+                    with db.begin_nested():
+                        schedule = PaymentService.get_repayment_schedule_for_update(db, record["schedule_id"])
+                        paid = PaymentService._apply_payment(
+                            db, schedule, record["amount"], record["payment_method"],
+                            record["transaction_reference"], processed_by_id
+                        )
+                        db.flush()
+                    result.update(remaining=paid["remaining"])
+                    recent_references.add(record["transaction_reference"])
+                except IntegrityError:
+                    result.update(status="duplicate", detail="Transaction reference already processed")
+                    result.pop("remaining", None)
+                except StaleDataError:
+                    result.update(status="rejected", detail="Repayment schedule was modified concurrently, please retry")
+                    result.pop("remaining", None)
+                except HTTPException as exc:
+                    result.update(status="rejected", detail=exc.detail)
+                    result.pop("remaining", None)
+            db.commit()
+        
+        return results
+    
+    @staticmethod
+    def _history_query(loan_id: int):
+        # column-only select, rows come back as lightweight tuples instead of mapped objects
+        return select(
+            RepaymentSchedule.installment_number.label("installment"),
+            RepaymentSchedule.due_date,
+            RepaymentSchedule.amount_due,
+            RepaymentSchedule.amount_paid,
+            RepaymentSchedule.status,
+            RepaymentSchedule.payment_date
+        ).where(
+            RepaymentSchedule.loan_id == loan_id
+        ).order_by(RepaymentSchedule.installment_number)
+    
+    @staticmethod
+    def _history_rows(installments: Optional[List[dict]]) -> List[dict]:
+        # merged installments in the shape of _history_query rows
         return [
             {
-                "installment": s.installment_number,
-                "due_date": s.due_date,
-                "amount_due": s.amount_due,
-                "amount_paid": s.amount_paid,
-                "status": s.status,
-                "payment_date": s.payment_date
+                "installment": installment["installment_number"],
+                "due_date": installment["due_date"],
+                "amount_due": installment["amount_due"],
+                "amount_paid": installment["amount_paid"],
+                "status": installment["status"],
+                "payment_date": installment["payment_date"]
             }
-            for s in schedules
+            for installment in installments or []
         ]
     
     @staticmethod
-    def get_loan_balance(db: Session, loan_id: int) -> dict:
-        """Get outstanding balance for a loan"""
-        schedules = db.query(RepaymentSchedule).filter(
-            RepaymentSchedule.loan_id == loan_id
-        ).all()
-        
-        if not schedules:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="No repayment schedule found for this loan"
-            )
-        
-        total_due = sum(s.amount_due for s in schedules)
-        total_paid = sum(s.amount_paid for s in schedules)
+    def get_payment_history(db: Session, loan_id: int):
+        """Get payment history for a loan, including installments computed from the loan terms"""
+        rows = db.execute(ScheduleService.range_query(loan_id, 1, VIRTUAL_ID_STRIDE - 1)).all()
+        return PaymentService._history_rows(ScheduleService.merge_range(rows, 1, VIRTUAL_ID_STRIDE - 1))
+    
+    @staticmethod
+    async def get_payment_history_async(db: AsyncSession, loan_id: int):
+        """Get payment history for a loan, including installments computed from the loan terms (async)"""
+        rows = (await db.execute(ScheduleService.range_query(loan_id, 1, VIRTUAL_ID_STRIDE - 1))).all()
+        return PaymentService._history_rows(ScheduleService.merge_range(rows, 1, VIRTUAL_ID_STRIDE - 1))
+    
+    @staticmethod
+    def stream_payment_history_async(db: AsyncSession, loan_id: int, stream_format: str) -> AsyncIterator[bytes]:
+        """Stream payment history for a loan as NDJSON or a JSON array
         
+        Streams the stored installments only; with LAZY_REPAYMENT_SCHEDULES those are
+        the ones with a payment or a delinquency status.
+        """
+        return iter_json_chunks(db, PaymentService._history_query(loan_id), stream_format)
+    
+    @staticmethod
+    def _balance_query(loan_ids: Sequence[int]):
+        # totals per loan computed by the database, one row per loan that has a schedule
+        return select(
+            RepaymentSchedule.loan_id,
+            func.sum(RepaymentSchedule.amount_due).label("total_due"),
+            func.coalesce(func.sum(RepaymentSchedule.amount_paid), 0.0).label("total_paid")
+        ).where(
+            RepaymentSchedule.loan_id.in_(loan_ids)
+        ).group_by(RepaymentSchedule.loan_id)
+    
+    @staticmethod
+    def _balance_dict(loan_id: int, total_due: float, total_paid: float) -> dict:
         return {
             "loan_id": loan_id,
             "total_due": total_due,
@@ -125,3 +660,229 @@ class PaymentService:
             "outstanding_balance": total_due - total_paid,
             "paid_percentage": (total_paid / total_due * 100) if total_due > 0 else 0
         }
+    
+    @staticmethod
+    def _loan_totals_query(loan_ids: Sequence[int]):
+        # running totals from the loans table, a primary key lookup per loan
+        return select(
+            Loan.id.label("loan_id"),
+            (Loan.outstanding_balance + Loan.total_paid).label("total_due"),
+            Loan.total_paid
+        ).where(Loan.id.in_(loan_ids))
+    
+    @staticmethod
+    def _single_balance(row, loan_id: int) -> dict:
+        if row is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="No repayment schedule found for this loan"
+            )
+        return PaymentService._balance_dict(loan_id, row.total_due, row.total_paid)
+    
+    @staticmethod
+    def get_loan_balance(db: Session, loan_id: int) -> dict:
+        """Get outstanding balance for a loan
+        
+        Read from the loan's running totals; schedules without a loan record fall
+        back to summing the installments.
+        """
+        row = db.execute(PaymentService._loan_totals_query([loan_id])).first()
+        if row is None:
+            row = db.execute(PaymentService._balance_query([loan_id])).first()
+        return PaymentService._single_balance(row, loan_id)
+    
+    @staticmethod
+    async def get_loan_balance_async(db: AsyncSession, loan_id: int) -> dict:
+        """Get outstanding balance for a loan (async)"""
+        row = (await db.execute(PaymentService._loan_totals_query([loan_id]))).first()
+        if row is None:
+            row = (await db.execute(PaymentService._balance_query([loan_id]))).first()
+        return PaymentService._single_balance(row, loan_id)
+    
+    @staticmethod
+    def get_portfolio_balances(db: Session, loan_ids: Sequence[int]) -> List[dict]:
+        """Get outstanding balances for many loans in one round of queries
+        
+        Loans without a repayment schedule are left out of the result.
+        """
+        rows = db.execute(PaymentService._loan_totals_query(loan_ids)).all()
+        missing = set(loan_ids) - {row.loan_id for row in rows}
+        if missing:
+            rows += db.execute(PaymentService._balance_query(list(missing))).all()
+        return [PaymentService._balance_dict(row.loan_id, row.total_due, row.total_paid) for row in rows]
+    
+    @staticmethod
+    async def get_portfolio_balances_async(db: AsyncSession, loan_ids: Sequence[int]) -> List[dict]:
+        """Get outstanding balances for many loans in one round of queries (async)"""
+        rows = (await db.execute(PaymentService._loan_totals_query(loan_ids))).all()
+        missing = set(loan_ids) - {row.loan_id for row in rows}
+        if missing:
+            rows += (await db.execute(PaymentService._balance_query(list(missing)))).all()
+        return [PaymentService._balance_dict(row.loan_id, row.total_due, row.total_paid) for row in rows]
+    
+    @staticmethod
+    async def get_portfolio_balances_across_shards_async(
+        shard_dbs: Sequence[AsyncSession], loan_ids: Sequence[int]
+    ) -> List[dict]:
+        """get_portfolio_balances_async asked of every shard at once, in request order (async)
+        
+        Each shard answers for the loans it holds, so no loan has to be located first.
+        """
+        results = await asyncio.gather(
+            *(PaymentService.get_portfolio_balances_async(db, loan_ids) for db in shard_dbs)
+        )
+        balances = {balance["loan_id"]: balance for shard_balances in results for balance in shard_balances}
+        return [balances[loan_id] for loan_id in dict.fromkeys(loan_ids) if loan_id in balances]
+    
+    @staticmethod
+    def sweep_delinquencies(
+        db: Session,
+        now: Optional[datetime] = None,
+        chunk_size: int = settings.DELINQUENCY_SWEEP_CHUNK_SIZE,
+        pause_seconds: float = 0.0
+    ) -> dict:
+        """Move overdue installments through DUE / LATE / MISSED and default loans
+        
+        Everything is set-based UPDATEs, run over primary key ranges of chunk_size
+        rows with a commit after each range, so row locks are held only briefly and
+        live payments can interleave. Versions are bumped so an in-flight payment on a
+        swept installment retries against the new status. Running it twice is a no-op.
+        
+        Args:
+            now: Reference time (defaults to the current UTC time)
+            chunk_size: Rows per id range / transaction
+            pause_seconds: Sleep between ranges to leave room for live traffic
+        
+        Returns:
+            Number of installments given a row ("stored", lazy schedules only) and of
+            installments and loans moved per transition
+        """
+        now = now or datetime.utcnow()
+        # lazily stored schedules: installments the transitions below can reach need a row first
+        counts = {"stored": ScheduleService.materialize_due(
+            db, now + timedelta(days=settings.DELINQUENCY_DUE_WINDOW_DAYS)
+        )}
+        due_date = RepaymentSchedule.due_date
+        transitions = [
+            # (name, current statuses, due date condition, new status)
+            ("due", [PaymentStatus.PENDING],
+             due_date.between(now, now + timedelta(days=settings.DELINQUENCY_DUE_WINDOW_DAYS)), PaymentStatus.DUE),
+            ("late", [PaymentStatus.PENDING, PaymentStatus.DUE], due_date < now, PaymentStatus.LATE),
+            ("missed", [PaymentStatus.LATE],
+             due_date < now - timedelta(days=settings.DELINQUENCY_MISSED_AFTER_DAYS), PaymentStatus.MISSED),
+        ]
+        counts.update({name: 0 for name, *_ in transitions})
+        
+        for low, high in PaymentService._id_ranges(db, RepaymentSchedule.id, chunk_size):
+            for name, from_statuses, due_condition, to_status in transitions:
+                moved = db.execute(
+                    update(RepaymentSchedule).where(
+                        RepaymentSchedule.id >= low, RepaymentSchedule.id < high,
+                        RepaymentSchedule.status.in_(from_statuses),
+                        due_condition,
+                        RepaymentSchedule.amount_paid < RepaymentSchedule.amount_due
+                    ).values(status=to_status, version=RepaymentSchedule.version + 1, updated_at=now)
+                    .returning(RepaymentSchedule.loan_id, RepaymentSchedule.amount_due - RepaymentSchedule.amount_paid)
+                    .execution_options(synchronize_session=False)
+                ).all()
+                counts[name] += len(moved)
+                # LATE -> MISSED stays overdue, only newly late installments add to it
+                if to_status in OVERDUE_STATUSES and not set(from_statuses) & set(OVERDUE_STATUSES):
+                    AnalyticsService.record_overdue(db, moved)
+            db.commit()
+            if pause_seconds:
+                time.sleep(pause_seconds)
+        
+        # loans with enough missed installments default
+        missed = select(func.count()).where(
+            RepaymentSchedule.loan_id == Loan.id,
+            RepaymentSchedule.status == PaymentStatus.MISSED
+        ).scalar_subquery()
+        counts["defaulted"] = 0
+        for low, high in PaymentService._id_ranges(db, Loan.id, chunk_size):
+            # one statement per current status so the status counts can be moved exactly
+            for from_status in (LoanStatus.DISBURSED, LoanStatus.ACTIVE):
+                defaulted = db.execute(
+                    update(Loan).where(
+                        Loan.id >= low, Loan.id < high,
+                        Loan.status == from_status,
+                        missed >= settings.DELINQUENCY_DEFAULT_MISSED_INSTALLMENTS
+                    ).values(status=LoanStatus.DEFAULTED, updated_at=now)
+                    .execution_options(synchronize_session=False)
+                ).rowcount
+                if defaulted:
+                    AnalyticsService.record_status_changes(
+                        db, loan_deltas={from_status: -defaulted, LoanStatus.DEFAULTED: defaulted}
+                    )
+                counts["defaulted"] += defaulted
+            db.commit()
+            if pause_seconds:
+                time.sleep(pause_seconds)
+        
+        return counts
+    
+    @staticmethod
+    def _id_ranges(db: Session, id_column, chunk_size: int) -> Iterator[Tuple[int, int]]:
+        """Half-open [low, high) primary key ranges covering the table"""
+        low, high = db.execute(select(func.min(id_column), func.max(id_column))).one()
+        if low is None:
+            return
+        for start in range(low, high + 1, chunk_size):
+            yield start, start + chunk_size
+    
+    @staticmethod
+    def reconcile_loan_balances(db: Session, fix: bool = False, chunk_size: int = 1000) -> dict:
+        """Check every loan's running totals against its repayment schedule
+        
+        Loans are walked in primary key order, chunk_size at a time, and each chunk
+        is compared with one grouped query over the schedules. With fix=True the
+        drifted loans are rewritten from the schedule in a bulk UPDATE per chunk.
+        
+        Returns:
+            Counts of checked and mismatched loans plus the mismatches found
+        """
+        checked = 0
+        mismatches = []
+        last_id = 0
+        while True:
+            loans = db.execute(
+                select(Loan.id, Loan.outstanding_balance, Loan.total_paid)
+                .where(Loan.id > last_id).order_by(Loan.id).limit(chunk_size)
+            ).all()
+            if not loans:
+                break
+            last_id = loans[-1].id
+            checked += len(loans)
+            
+            expected = {
+                row.loan_id: (row.total_due, row.total_paid)
+                for row in db.execute(PaymentService._balance_query([loan.id for loan in loans]))
+            }
+            # installments without a row (lazy schedules) are due in full and unpaid
+            for table, loan_ids in ScheduleService.iter_unstored(db, loan_ids=[loan.id for loan in loans]):
+                unstored_due = np.bincount(table.loan_index, weights=table.amount_due, minlength=len(loan_ids))
+                for loan_id, amount_due in zip(loan_ids, unstored_due.tolist()):
+                    total_due, total_paid = expected.get(loan_id, (0.0, 0.0))
+                    expected[loan_id] = (total_due + amount_due, total_paid)
+            fixes = []
+            for loan in loans:
+                if loan.id not in expected:
+                    continue
+                total_due, total_paid = expected[loan.id]
+                outstanding = total_due - total_paid
+                if (abs(loan.total_paid - total_paid) > BALANCE_TOLERANCE
+                        or abs(loan.outstanding_balance - outstanding) > BALANCE_TOLERANCE):
+                    mismatches.append({
+                        "loan_id": loan.id,
+                        "outstanding_balance": loan.outstanding_balance,
+                        "expected_outstanding_balance": round(outstanding, 2),
+                        "total_paid": loan.total_paid,
+                        "expected_total_paid": round(total_paid, 2)
+                    })
+                    fixes.append({"id": loan.id, "outstanding_balance": outstanding, "total_paid": total_paid})
+            
+            if fix and fixes:
+                db.execute(update(Loan), fixes)
+                db.commit()
+        
+        return {"checked": checked, "mismatched": len(mismatches), "fixed": fix, "mismatches": mismatches}
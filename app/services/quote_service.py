@@ -0,0 +1,158 @@
+# quote service - loan quotes and simulations for the public calculator
+# everything here is a pure calculation: no database access, results are memoized
+from datetime import date, datetime
+from typing import List, Optional, Sequence, Tuple
+import numpy as np
+import orjson
+from app.config import settings
+from app.utils.cache import TTLCache
+from app.utils.loan_calculator import amortize_loans, calculate_emi, calculate_prepayment_details
+from app.utils.serializers import ORJSON_OPTIONS
+
+# below this many uncached scenarios the scalar formula beats setting up numpy arrays
+VECTORIZE_MIN_SCENARIOS = 32
+
+# quotes and prepayment results keyed on normalized inputs
+quote_cache = TTLCache(max_size=settings.QUOTE_CACHE_MAX_SIZE, ttl_seconds=settings.QUOTE_CACHE_TTL_SECONDS)
+# encoded schedule previews, kept apart because each entry is much larger
+schedule_preview_cache = TTLCache(
+    max_size=settings.QUOTE_SCHEDULE_CACHE_MAX_SIZE, ttl_seconds=settings.QUOTE_CACHE_TTL_SECONDS
+)
+
+
+def normalize_scenario(principal: float, annual_interest_rate: float, term_months: int) -> Tuple[float, float, int]:
+    """Round inputs to the precision quotes are given in (cents, basis points / 100)
+    
+    Equal scenarios typed slightly differently (5000 vs 5000.001) share one cache
+    entry and get exactly the same answer.
+    """
+    return round(float(principal), 2), round(float(annual_interest_rate), 4), int(term_months)
+
+
+class QuoteService:
+    """Service class for loan quotes"""
+    
+    @staticmethod
+    def _compute_quotes(scenarios: Sequence[Tuple[float, float, int]]) -> List[dict]:
+        """EMI, total interest and total payment for normalized scenarios
+        
+        Larger sets go through one numpy pass with the same formula and operation
+        order as calculate_emi / calculate_total_interest, so each result equals the
+        scalar functions' result bit for bit; below VECTORIZE_MIN_SCENARIOS the
+        array setup costs more than it saves and the scalar function is used.
+        """
+        if len(scenarios) < VECTORIZE_MIN_SCENARIOS:
+            return [
+                QuoteService._quote_dict(p, rate, term, emi, emi * term)
+                for (p, rate, term), emi in zip(scenarios, (calculate_emi(*scenario) for scenario in scenarios))
+            ]
+        principal = np.array([scenario[0] for scenario in scenarios], dtype=np.float64)
+        rates = np.array([scenario[1] for scenario in scenarios], dtype=np.float64)
+        terms = np.array([scenario[2] for scenario in scenarios], dtype=np.int64)
+        monthly_rate = rates / 12 / 100
+        zero_rate = monthly_rate == 0
+        growth = (1 + monthly_rate) ** terms
+        emi = np.where(
+            zero_rate,
+            principal / terms,
+            principal * monthly_rate * growth / np.where(zero_rate, 1.0, growth - 1)
+        )
+        total_payment = emi * terms
+        return [
+            QuoteService._quote_dict(p, rate, term, monthly, total)
+            for (p, rate, term), monthly, total in zip(scenarios, emi.tolist(), total_payment.tolist())
+        ]
+    
+    @staticmethod
+    def _quote_dict(principal: float, annual_interest_rate: float, term_months: int, emi: float, total: float) -> dict:
+        return {
+            "principal": principal,
+            "annual_interest_rate": annual_interest_rate,
+            "term_months": term_months,
+            "monthly_payment": round(emi, 2),
+            "total_interest": round(total - principal, 2),
+            "total_payment": round(total, 2)
+        }
+    
+    @staticmethod
+    def get_quotes(scenarios: Sequence[Tuple[float, float, int]]) -> List[dict]:
+        """Quote many (principal, annual_interest_rate, term_months) scenarios
+        
+        Cached scenarios are answered from the cache; the rest are computed together
+        in one vectorized pass and cached.
+        
+        Returns:
+            One quote dict per scenario, in the same order
+        """
+        keys = [normalize_scenario(*scenario) for scenario in scenarios]
+        quotes = [quote_cache.get(("quote", key)) for key in keys]
+        missing = list(dict.fromkeys(key for key, quote in zip(keys, quotes) if quote is None))
+        if missing:
+            computed = dict(zip(missing, QuoteService._compute_quotes(missing)))
+            for key, quote in computed.items():
+                quote_cache.set(("quote", key), quote)
+            quotes = [quote if quote is not None else computed[key] for key, quote in zip(keys, quotes)]
+        return quotes
+    
+    @staticmethod
+    def get_quote(principal: float, annual_interest_rate: float, term_months: int) -> dict:
+        """Quote a single scenario (EMI, total interest, total payment)"""
+        return QuoteService.get_quotes([(principal, annual_interest_rate, term_months)])[0]
+    
+    @staticmethod
+    def get_schedule_preview(
+        principal: float, annual_interest_rate: float, term_months: int, start_date: Optional[date] = None
+    ) -> bytes:
+        """Quote plus the full amortization schedule, encoded as JSON
+        
+        The encoded body is what gets cached, so a repeated preview costs a cache
+        lookup and no serialization.
+        """
+        key = (*normalize_scenario(principal, annual_interest_rate, term_months), start_date or datetime.utcnow().date())
+        body = schedule_preview_cache.get(key)
+        if body is not None:
+            return body
+        
+        principal, annual_interest_rate, term_months, start = key
+        table = amortize_loans(principal, annual_interest_rate, term_months, datetime(start.year, start.month, start.day))
+        preview = dict(QuoteService.get_quote(principal, annual_interest_rate, term_months))
+        preview["installments"] = [
+            {
+                "installment_number": number,
+                "due_date": due_date,
+                "amount_due": amount_due,
+                "principal_component": principal_component,
+                "interest_component": interest_component,
+                "balance": balance
+            }
+            for number, due_date, amount_due, principal_component, interest_component, balance in zip(
+                table.installment_number.tolist(),
+                table.due_date.tolist(),
+                table.amount_due.tolist(),
+                table.principal_component.tolist(),
+                table.interest_component.tolist(),
+                table.balance.tolist()
+            )
+        ]
+        body = orjson.dumps(preview, option=ORJSON_OPTIONS)
+        schedule_preview_cache.set(key, body)
+        return body
+    
+    @staticmethod
+    def get_prepayment_impact(
+        remaining_balance: float,
+        prepayment_amount: float,
+        monthly_emi: float,
+        remaining_months: int,
+        annual_interest_rate: float
+    ) -> dict:
+        """Months and interest saved by an extra payment (see calculate_prepayment_details)"""
+        key = (
+            "prepayment", round(remaining_balance, 2), round(prepayment_amount, 2), round(monthly_emi, 2),
+            int(remaining_months), round(annual_interest_rate, 4)
+        )
+        result = quote_cache.get(key)
+        if result is None:
+            result = calculate_prepayment_details(*key[1:])
+            quote_cache.set(key, result)
+        return result
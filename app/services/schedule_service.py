@@ -0,0 +1,267 @@
+# schedule service - repayment installments computed from the loan terms and merged with stored rows
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+from datetime import datetime
+import numpy as np
+from sqlalchemy import and_, func, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from app.models.loan import Loan
+from app.models.payment import RepaymentSchedule
+from app.schemas.payment import RepaymentScheduleResponse
+from app.utils.loan_calculator import (
+    VIRTUAL_ID_STRIDE, AmortizationTable, CompactSchedule, amortize_loans, schedule_to_rows, split_virtual_schedule_id
+)
+from app.utils.serializers import RowSerializer
+
+# RepaymentScheduleResponse straight from rows, for the schedule reads and the fast list path
+REPAYMENT_SCHEDULE_SERIALIZER = RowSerializer(RepaymentScheduleResponse, RepaymentSchedule)
+
+# loans amortized per pass when scanning for installments without a row
+UNSTORED_CHUNK_LOANS = 500
+
+# INSERT ... ON CONFLICT DO NOTHING constructs, so two writers materializing one installment both succeed
+UPSERT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+class LoanTerms(NamedTuple):
+    """What a loan's amortized schedule is derived from"""
+    id: int
+    principal_amount: float
+    interest_rate: float
+    loan_term_months: int
+    start_date: datetime
+    created_at: datetime
+    
+    @classmethod
+    def of(cls, loan: Loan) -> "LoanTerms":
+        return cls(
+            loan.id, loan.principal_amount, loan.interest_rate, loan.loan_term_months,
+            loan.start_date or loan.disbursement_date, loan.created_at
+        )
+
+
+# LoanTerms selected in SQL, in field order
+LOAN_TERMS_COLUMNS = (
+    Loan.id.label("terms_id"),
+    Loan.principal_amount.label("terms_principal_amount"),
+    Loan.interest_rate.label("terms_interest_rate"),
+    Loan.loan_term_months.label("terms_loan_term_months"),
+    func.coalesce(Loan.start_date, Loan.disbursement_date).label("terms_start_date"),
+    Loan.created_at.label("terms_created_at"),
+)
+
+
+class ScheduleService:
+    """Service class for lazily stored repayment schedules
+    
+    With LAZY_REPAYMENT_SCHEDULES an approval stores no installments. Every
+    installment can be recomputed from the loan's principal, rate, term and start
+    date with amortize_loans, exactly as the approval would have stored it, so a
+    row is only written once an installment has activity: a payment, or a
+    delinquency status from the sweep. Reads merge the stored rows over the
+    computed schedule. Installments without a row get a virtual (negative)
+    schedule id that stays valid after the row is written.
+    
+    Loans approved before the setting was turned on simply have every row
+    stored, so both kinds of loan go through the same code.
+    """
+    
+    @staticmethod
+    def amortize(terms: Sequence[LoanTerms]) -> AmortizationTable:
+        return amortize_loans(
+            loan_amounts=[t.principal_amount for t in terms],
+            interest_rates=[t.interest_rate for t in terms],
+            term_months=[t.loan_term_months for t in terms],
+            start_dates=[t.start_date for t in terms]
+        )
+    
+    @staticmethod
+    def select_rows(table: AmortizationTable, mask: np.ndarray) -> AmortizationTable:
+        return AmortizationTable(*(column[mask] for column in table))
+    
+    @staticmethod
+    def eager_part(table: AmortizationTable) -> AmortizationTable:
+        """Installments that must be stored in lazy mode: those of terms too long for a virtual id"""
+        terms = np.bincount(table.loan_index)
+        return ScheduleService.select_rows(table, terms[table.loan_index] >= VIRTUAL_ID_STRIDE)
+    
+    @staticmethod
+    def computed(terms: LoanTerms) -> CompactSchedule:
+        """A loan's whole schedule computed from its terms, as if nothing were stored"""
+        return CompactSchedule.from_table(ScheduleService.amortize([terms]), terms.id, terms.created_at)
+    
+    @staticmethod
+    def range_query(loan_id: int, first: int, last: int):
+        # one statement: the loan terms, outer joined to its stored installments first..last
+        stored = and_(
+            RepaymentSchedule.loan_id == Loan.id,
+            RepaymentSchedule.installment_number.between(first, last)
+        )
+        return (
+            select(*LOAN_TERMS_COLUMNS, *REPAYMENT_SCHEDULE_SERIALIZER.columns)
+            .select_from(Loan)
+            .outerjoin(RepaymentSchedule, stored)
+            .where(Loan.id == loan_id)
+            .order_by(RepaymentSchedule.installment_number)
+        )
+    
+    @staticmethod
+    def merge_range(rows: Sequence, first: int, last: int) -> Optional[List[dict]]:
+        """Installments first..last from the rows of range_query, stored rows winning
+        
+        Returns:
+            Response rows ordered by installment number, or None when the loan does not exist
+        """
+        if not rows:
+            return None
+        terms = LoanTerms(*rows[0][:len(LOAN_TERMS_COLUMNS)])
+        first, last = max(first, 1), min(last, terms.loan_term_months)
+        keys = REPAYMENT_SCHEDULE_SERIALIZER.keys
+        stored = [dict(zip(keys, row[len(LOAN_TERMS_COLUMNS):])) for row in rows if row.installment_number is not None]
+        # fully stored ranges (every eagerly approved loan) need no computing
+        if len(stored) >= last - first + 1:
+            return stored
+        return ScheduleService.computed(terms).window(first, last).overlay(stored).to_rows()
+    
+    @staticmethod
+    def merged_models(loan: Loan, stored: Sequence[RepaymentSchedule]) -> List[RepaymentSchedule]:
+        """A loan's whole schedule as models: the stored rows plus transient ones for the rest"""
+        if len(stored) >= loan.loan_term_months:
+            return list(stored)
+        computed = ScheduleService.computed(LoanTerms.of(loan))
+        missing = computed.take(~np.isin(computed.installment_number, [s.installment_number for s in stored]))
+        return sorted([*stored, *missing.to_models()], key=lambda schedule: schedule.installment_number)
+    
+    @staticmethod
+    def insert_missing(db: Session, table: AmortizationTable, loan_ids: Sequence[int]):
+        """Store installments of an AmortizationTable, skipping those that already have a row (no commit)"""
+        rows = schedule_to_rows(table, loan_ids)
+        if not rows:
+            return
+        stmt = UPSERT_INSERTS[db.get_bind().dialect.name](RepaymentSchedule.__table__)
+        db.execute(stmt.on_conflict_do_nothing(index_elements=["loan_id", "installment_number"]), rows)
+    
+    @staticmethod
+    def materialize(db: Session, installments: Iterable[Tuple[int, int]]):
+        """Give (loan_id, installment_number) pairs a stored row if they have none (no commit)
+        
+        Pairs outside their loan's term, or of unknown loans, are ignored.
+        """
+        wanted = defaultdict(set)
+        for loan_id, number in installments:
+            wanted[loan_id].add(number)
+        if not wanted:
+            return
+        terms = [LoanTerms(*row) for row in db.execute(select(*LOAN_TERMS_COLUMNS).where(Loan.id.in_(wanted)))]
+        if not terms:
+            return
+        table = ScheduleService.amortize(terms)
+        loan_ids = [t.id for t in terms]
+        mask = np.array([
+            number in wanted[loan_ids[index]]
+            for index, number in zip(table.loan_index.tolist(), table.installment_number.tolist())
+        ], dtype=bool)
+        ScheduleService.insert_missing(db, ScheduleService.select_rows(table, mask), loan_ids)
+    
+    @staticmethod
+    def load_for_update(db: Session, schedule_ids: Iterable[int]) -> Dict[int, RepaymentSchedule]:
+        """Installments about to be paid, by the (stored or virtual) id they were asked for
+        
+        Virtual ids get their row written first, in the caller's transaction, so a
+        payment that is rolled back leaves nothing behind. Rows are locked with
+        SELECT ... FOR UPDATE where the backend supports it.
+        """
+        stored_ids = set()
+        virtual = {}
+        for schedule_id in schedule_ids:
+            installment = split_virtual_schedule_id(schedule_id)
+            if installment is None:
+                stored_ids.add(schedule_id)
+            else:
+                virtual[installment] = schedule_id
+        
+        found = {}
+        if stored_ids:
+            found.update((schedule.id, schedule) for schedule in db.scalars(
+                select(RepaymentSchedule).where(RepaymentSchedule.id.in_(stored_ids))
+                .with_for_update().execution_options(populate_existing=True)
+            ))
+        if virtual:
+            ScheduleService.materialize(db, virtual)
+            for schedule in db.scalars(
+                select(RepaymentSchedule)
+                .where(tuple_(RepaymentSchedule.loan_id, RepaymentSchedule.installment_number).in_(list(virtual)))
+                .with_for_update().execution_options(populate_existing=True)
+            ):
+                found[virtual[(schedule.loan_id, schedule.installment_number)]] = schedule
+        return found
+    
+    @staticmethod
+    def same_installment(db: Session, requested_id: int, stored_id: int) -> bool:
+        """Whether a requested (possibly virtual) schedule id names the stored row stored_id"""
+        if requested_id == stored_id:
+            return True
+        installment = split_virtual_schedule_id(requested_id)
+        if installment is None:
+            return False
+        row = db.execute(
+            select(RepaymentSchedule.loan_id, RepaymentSchedule.installment_number)
+            .where(RepaymentSchedule.id == stored_id)
+        ).first()
+        return row is not None and tuple(row) == installment
+    
+    @staticmethod
+    def iter_unstored(
+        db: Session, loan_ids: Optional[Sequence[int]] = None, chunk_size: int = UNSTORED_CHUNK_LOANS
+    ) -> Iterator[Tuple[AmortizationTable, List[int]]]:
+        """Installments without a row, for loans whose schedule is not fully stored
+        
+        Loans are walked in primary key order, chunk_size at a time; loans with
+        every installment stored are skipped in SQL.
+        
+        Yields:
+            (installments, loan ids indexed by loan_index) per chunk
+        """
+        stored_count = select(func.count()).where(RepaymentSchedule.loan_id == Loan.id).scalar_subquery()
+        last_id = 0
+        while True:
+            stmt = select(*LOAN_TERMS_COLUMNS).where(
+                Loan.id > last_id, stored_count < Loan.loan_term_months
+            ).order_by(Loan.id).limit(chunk_size)
+            if loan_ids is not None:
+                stmt = stmt.where(Loan.id.in_(loan_ids))
+            terms = [LoanTerms(*row) for row in db.execute(stmt)]
+            if not terms:
+                return
+            last_id = terms[-1].id
+            ids = [t.id for t in terms]
+            stored = set(db.execute(
+                select(RepaymentSchedule.loan_id, RepaymentSchedule.installment_number)
+                .where(RepaymentSchedule.loan_id.in_(ids))
+            ).tuples())
+            table = ScheduleService.amortize(terms)
+            mask = np.array([
+                (ids[index], number) not in stored
+                for index, number in zip(table.loan_index.tolist(), table.installment_number.tolist())
+            ], dtype=bool)
+            yield ScheduleService.select_rows(table, mask), ids
+    
+    @staticmethod
+    def materialize_due(db: Session, until: datetime) -> int:
+        """Store the installments without a row that are due by until, committing per chunk
+        
+        Run by the delinquency sweep first, so its status updates see every
+        installment that can become DUE, LATE or MISSED.
+        
+        Returns:
+            Number of installments stored
+        """
+        cutoff = np.datetime64(until.replace(tzinfo=None), "us")
+        stored = 0
+        for table, loan_ids in ScheduleService.iter_unstored(db):
+            due = ScheduleService.select_rows(table, table.due_date <= cutoff)
+            ScheduleService.insert_missing(db, due, loan_ids)
+            db.commit()
+            stored += len(due)
+        return stored
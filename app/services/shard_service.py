@@ -0,0 +1,86 @@
+# shard service - moves borrowers' loans between shards and keeps the shard map in the directory
+from typing import Dict, Iterable, List, Tuple
+from sqlalchemy import DateTime, String, bindparam, delete, insert, select, type_coerce, update
+from sqlalchemy.orm import Session
+from app.models.loan import Loan, LoanApplication
+from app.models.payment import Payment, RepaymentSchedule
+from app.models.shard import ShardBucket
+
+# rows copied per INSERT while moving a bucket
+COPY_BATCH_SIZE = 1000
+
+
+class ShardService:
+    """Service class for shard rebalancing
+    
+    A bucket moves in four steps: flag it as moving in the directory (requests for its
+    borrowers get a 503), copy its rows to the target shard, point the directory at
+    the target, then delete the rows from the source. Ids are global, so copied rows
+    keep their ids and every reference stays valid.
+    """
+    
+    @staticmethod
+    def bucket_tables(bucket: int, buckets: int) -> List[Tuple[object, object]]:
+        """(table, filter) pairs selecting a bucket's rows, parents before children"""
+        loans_in_bucket = select(Loan.id).where(Loan.borrower_id % buckets == bucket)
+        return [
+            (LoanApplication.__table__, LoanApplication.applicant_id % buckets == bucket),
+            (Loan.__table__, Loan.borrower_id % buckets == bucket),
+            (RepaymentSchedule.__table__, RepaymentSchedule.loan_id.in_(loans_in_bucket)),
+            (Payment.__table__, Payment.loan_id.in_(loans_in_bucket)),
+        ]
+    
+    @staticmethod
+    def _copy_statements(table, dialect_name: str):
+        # SQLite datetimes are copied as their stored text: a round trip through DateTime
+        # would add ".000000" to server-default timestamps and break keyset comparisons
+        if dialect_name != "sqlite":
+            return select(table), insert(table)
+        raw = [column.key for column in table.columns if isinstance(column.type, DateTime)]
+        columns = [type_coerce(column, String).label(column.key) if column.key in raw else column for column in table.columns]
+        return select(*columns), insert(table).values({key: bindparam(key, type_=String) for key in raw})
+    
+    @staticmethod
+    def copy_bucket(source: Session, target: Session, bucket: int, buckets: int) -> Dict[str, int]:
+        """Copy a bucket's applications, loans, schedules and payments to the target shard
+        
+        The target is committed once everything is copied; the source is only read.
+        Leftovers of an interrupted earlier copy are removed from the target first, so
+        a failed move can simply be run again.
+        
+        Returns:
+            Number of rows copied per table
+        """
+        for table, condition in reversed(ShardService.bucket_tables(bucket, buckets)):
+            target.execute(delete(table).where(condition))
+        counts = {}
+        for table, condition in ShardService.bucket_tables(bucket, buckets):
+            select_rows, insert_rows = ShardService._copy_statements(table, source.get_bind().dialect.name)
+            result = source.execute(select_rows.where(condition).execution_options(yield_per=COPY_BATCH_SIZE))
+            counts[table.name] = 0
+            for partition in result.mappings().partitions():
+                target.execute(insert_rows, [dict(row) for row in partition])
+                counts[table.name] += len(partition)
+        target.commit()
+        return counts
+    
+    @staticmethod
+    def delete_bucket(source: Session, bucket: int, buckets: int):
+        """Delete a bucket's rows from the shard it was moved away from, children first"""
+        for table, condition in reversed(ShardService.bucket_tables(bucket, buckets)):
+            source.execute(delete(table).where(condition))
+        source.commit()
+    
+    @staticmethod
+    def set_buckets(directory: Session, assignments: Dict[int, str], moving: bool):
+        """Point buckets at shards in the directory and set or clear their moving flag"""
+        for bucket, shard_id in assignments.items():
+            directory.execute(
+                update(ShardBucket).where(ShardBucket.bucket == bucket).values(shard_id=shard_id, moving=moving)
+            )
+        directory.commit()
+    
+    @staticmethod
+    def batches(moves: List[Tuple[int, str, str]], size: int) -> Iterable[List[Tuple[int, str, str]]]:
+        for start in range(0, len(moves), size):
+            yield moves[start:start + size]
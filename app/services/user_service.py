@@ -1,10 +1,34 @@
 # user service - handles user business logic
-from sqlalchemy.orm import Session
+from typing import AsyncIterator, List, Optional, Sequence, Tuple
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
+from app.models.loan import Loan, LoanApplication
+from app.models.payment import Payment, RepaymentSchedule
 from app.models.user import User
-from app.schemas.user import UserCreate, UserUpdate
-from app.utils.auth import get_password_hash
+from app.schemas.user import UserCreate, UserResponse, UserUpdate
+from app.utils.pagination import apply_keyset, page_from_rows
+from app.utils.serializers import RowSerializer
+from app.utils.streaming import iter_json_chunks
+from app.utils.auth import (
+    get_password_hash,
+    get_password_hash_async,
+    invalidate_cached_user,
+    verify_password_async
+)
 from fastapi import HTTPException, status
 
+# UserResponse straight from rows; only the response fields are selected, never hashed_password
+USER_SERIALIZER = RowSerializer(UserResponse, User)
+
+# everything db.delete(user) cascades through, loaded with one query per relationship
+# instead of one lazy load per loan and per application
+USER_CASCADE_LOADERS = (
+    selectinload(User.loans).selectinload(Loan.repayments),
+    selectinload(User.loans).selectinload(Loan.payments),
+    selectinload(User.loan_applications).selectinload(LoanApplication.loan),
+)
+
 
 class UserService:
     """Service class for user operations"""
@@ -39,9 +63,51 @@ class UserService:
         return db_user
     
     @staticmethod
-    def get_user_by_id(db: Session, user_id: int) -> User:
-        """Get user by ID"""
-        user = db.query(User).filter(User.id == user_id).first()
+    async def create_user_async(db: AsyncSession, user: UserCreate) -> User:
+        """Create a new user (async, hashing runs on the password hashing pool)"""
+        # Check if user already exists
+        result = await db.execute(
+            select(User).where((User.username == user.username) | (User.email == user.email))
+        )
+        
+        if result.scalars().first():
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Username or email already exists"
+            )
+        # release the connection while argon2 runs
+        await db.rollback()
+        
+        # Hash password and create user
+        hashed_password = await get_password_hash_async(user.password)
+        db_user = User(
+            username=user.username,
+            email=user.email,
+            full_name=user.full_name,
+            phone_number=user.phone_number,
+            hashed_password=hashed_password,
+            role=user.role
+        )
+        db.add(db_user)
+        await db.commit()
+        await db.refresh(db_user)
+        return db_user
+    
+    @staticmethod
+    def get_user_by_id(db: Session, user_id: int, options: Sequence = ()) -> User:
+        """Get user by ID, with optional loader options for the relationships the caller walks"""
+        user = db.query(User).options(*options).filter(User.id == user_id).first()
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User not found"
+            )
+        return user
+    
+    @staticmethod
+    async def get_user_by_id_async(db: AsyncSession, user_id: int) -> User:
+        """Get user by ID (async)"""
+        user = await db.get(User, user_id)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -54,6 +120,12 @@ class UserService:
         """Get user by username"""
         return db.query(User).filter(User.username == username).first()
     
+    @staticmethod
+    async def get_user_by_username_async(db: AsyncSession, username: str) -> User:
+        """Get user by username (async)"""
+        result = await db.execute(select(User).where(User.username == username))
+        return result.scalars().first()
+    
     @staticmethod
     def get_user_by_email(db: Session, email: str) -> User:
         """Get user by email"""
@@ -64,6 +136,45 @@ class UserService:
         """Get all users with pagination"""
         return db.query(User).offset(skip).limit(limit).all()
     
+    @staticmethod
+    async def get_all_users_async(db: AsyncSession, skip: int = 0, limit: int = 10):
+        """Get all users with pagination (async)"""
+        result = await db.execute(select(User).offset(skip).limit(limit))
+        return result.scalars().all()
+    
+    @staticmethod
+    async def get_all_users_json_async(
+        db: AsyncSession, skip: int = 0, limit: int = 10, cursor: Optional[str] = None
+    ) -> bytes:
+        """Get users already encoded as JSON, without a pydantic model per row
+        
+        With a cursor the result is a keyset page ordered by (created_at, id).
+        """
+        stmt = select(*USER_SERIALIZER.columns)
+        if cursor is None:
+            rows = (await db.execute(stmt.offset(skip).limit(limit))).all()
+            return USER_SERIALIZER.dumps(rows)
+        stmt = apply_keyset(stmt, [User.created_at, User.id], cursor, limit, db.get_bind().dialect.name)
+        rows, next_cursor = page_from_rows((await db.execute(stmt)).all(), limit, lambda row: (row.created_at, row.id))
+        return USER_SERIALIZER.dumps_page(rows, next_cursor)
+    
+    @staticmethod
+    def stream_users_async(db: AsyncSession, stream_format: str, skip: int = 0, limit: int = 10) -> AsyncIterator[bytes]:
+        """Stream users as NDJSON or a JSON array (the UserResponse fields, never the password hash)"""
+        stmt = select(*USER_SERIALIZER.columns).order_by(User.id).offset(skip).limit(limit)
+        return iter_json_chunks(db, stmt, stream_format)
+    
+    @staticmethod
+    async def get_all_users_page_async(
+        db: AsyncSession, cursor: Optional[str] = None, limit: int = 10
+    ) -> Tuple[List[User], Optional[str]]:
+        """Get one keyset page of users, ordered by (created_at, id)"""
+        stmt = apply_keyset(
+            select(User), [User.created_at, User.id], cursor, limit, db.get_bind().dialect.name
+        )
+        rows = (await db.execute(stmt)).scalars().all()
+        return page_from_rows(rows, limit, lambda user: (user.created_at, user.id))
+    
     @staticmethod
     def update_user(db: Session, user_id: int, user_update: UserUpdate) -> User:
         """Update user information"""
@@ -76,12 +187,51 @@ class UserService:
         db.add(db_user)
         db.commit()
         db.refresh(db_user)
+        invalidate_cached_user(db_user.username)
         return db_user
     
     @staticmethod
-    def delete_user(db: Session, user_id: int):
-        """Delete user"""
-        db_user = UserService.get_user_by_id(db, user_id)
+    def delete_user(db: Session, user_id: int, borrower_db: Optional[Session] = None):
+        """Delete user
+        
+        When sharded, the user's loan applications, loans, schedules and payments live on
+        their shard (borrower_db) and are deleted there first, so a failure leaves the
+        user in place and the delete can be retried.
+        """
+        db_user = UserService.get_user_by_id(db, user_id, USER_CASCADE_LOADERS)
+        if borrower_db is not None and "shard_id" in borrower_db.info:
+            UserService._delete_loan_data(borrower_db, user_id)
+            borrower_db.commit()
         db.delete(db_user)
         db.commit()
+        invalidate_cached_user(db_user.username)
         return {"message": "User deleted successfully"}
+    
+    @staticmethod
+    def _delete_loan_data(db: Session, user_id: int):
+        """Delete a borrower's applications, loans, schedules and payments with bulk DELETEs (no commit)"""
+        loan_ids = select(Loan.id).where(Loan.borrower_id == user_id).scalar_subquery()
+        db.execute(delete(Payment).where(Payment.loan_id.in_(loan_ids)))
+        db.execute(delete(RepaymentSchedule).where(RepaymentSchedule.loan_id.in_(loan_ids)))
+        db.execute(delete(Loan).where(Loan.borrower_id == user_id))
+        db.execute(delete(LoanApplication).where(LoanApplication.applicant_id == user_id))
+    
+    @staticmethod
+    async def change_password_async(db: AsyncSession, user_id: int, old_password: str, new_password: str):
+        """Change a user's password after checking the old one (async)"""
+        db_user = await UserService.get_user_by_id_async(db, user_id)
+        username, hashed_password = db_user.username, db_user.hashed_password
+        # release the connection while argon2 runs
+        await db.rollback()
+        
+        if not await verify_password_async(old_password, hashed_password):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Incorrect old password"
+            )
+        
+        new_hash = await get_password_hash_async(new_password)
+        await db.execute(update(User).where(User.id == user_id).values(hashed_password=new_hash))
+        await db.commit()
+        invalidate_cached_user(username)
+        return {"message": "Password changed successfully"}
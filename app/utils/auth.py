@@ -1,23 +1,116 @@
 # authentication and authorization utilities e.g password hashing, token generation
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi.security import OAuth2PasswordBearer
 from fastapi import Depends, HTTPException, status 
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import get_db
+from app.database import get_async_db
 from app.config import settings
 from app.models.user import User
 from app.schemas.user import TokenData
+from app.utils.cache import TTLCache
 
 # password hashing context - using argon2 instead of bcrypt for better compatibility
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+pwd_context = CryptContext(
+    schemes=["argon2"],
+    deprecated="auto",
+    argon2__time_cost=settings.ARGON2_TIME_COST,
+    argon2__memory_cost=settings.ARGON2_MEMORY_COST,
+    argon2__parallelism=settings.ARGON2_PARALLELISM,
+)
+
+
+class PasswordHasherPool:
+    """Size-limited worker pool for argon2 work
+    
+    argon2-cffi releases the GIL while hashing, so a small thread pool gives real
+    parallelism while capping how many cores and how much memory hashing can take.
+    Once ``max_queue`` jobs are already waiting for a worker, new jobs are refused
+    with 503 instead of piling up behind a login storm.
+    """
+    
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.rejected = 0
+    
+    def submit(self, fn, *args) -> Future:
+        with self._lock:
+            if self._pending >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Authentication service is busy, please retry",
+                    headers={"Retry-After": "1"},
+                )
+            self._pending += 1
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(self._done)
+        return future
+    
+    def _done(self, future: Future):
+        with self._lock:
+            self._pending -= 1
+    
+    async def run(self, fn, *args):
+        return await asyncio.wrap_future(self.submit(fn, *args))
+    
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "pending": self._pending,
+                "queued": max(self._pending - self.workers, 0),
+                "rejected": self.rejected,
+            }
+
+
+password_hasher_pool = PasswordHasherPool(
+    workers=settings.PASSWORD_HASH_WORKERS,
+    max_queue=settings.PASSWORD_HASH_MAX_QUEUE,
+)
 
 # OAuth2 scheme for token extraction from requests
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_PREFIX}/auth/login")
 
+# authenticated users keyed by username; entries are dropped when UserService changes the user
+user_cache = TTLCache(max_size=settings.USER_CACHE_MAX_SIZE, ttl_seconds=settings.USER_CACHE_TTL_SECONDS)
+
+
+class CurrentUser:
+    """Lightweight, session-free snapshot of the authenticated user
+    
+    Holds only the columns routes read from ``current_user``, so it can be cached
+    across requests without keeping ORM state alive.
+    """
+    __slots__ = (
+        "id", "username", "email", "full_name", "phone_number", "role",
+        "is_active", "is_superuser", "created_at", "updated_at"
+    )
+    
+    def __init__(self, user: User):
+        for field in self.__slots__:
+            setattr(self, field, getattr(user, field))
+    
+    def __repr__(self):
+        return f"<CurrentUser id={self.id} username={self.username} role={self.role}>"
+
+
+def invalidate_cached_user(username: str):
+    """Drop a user from the current-user cache after it was changed or deleted"""
+    user_cache.invalidate(username)
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a plain password against its hashed version"""
@@ -29,6 +122,16 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password on the password hashing pool without blocking the event loop"""
+    return await password_hasher_pool.run(pwd_context.verify, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """Hash a password on the password hashing pool without blocking the event loop"""
+    return await password_hasher_pool.run(pwd_context.hash, password)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create a JWT access token"""
     to_encode = data.copy()
@@ -56,8 +159,11 @@ def decode_access_token(token: str) -> Optional[TokenData]:
         return None
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
-    """Retrieve the current user based on the provided JWT token"""
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)) -> CurrentUser:
+    """Retrieve the current user based on the provided JWT token
+    
+    Served from the user cache when possible; on a hit the database is not touched.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -68,10 +174,15 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     if token_data is None:
         raise credentials_exception
     
-    # Get the user from the database
-    user = db.query(User).filter(User.username == token_data.username).first()
+    user = user_cache.get(token_data.username)
     if user is None:
-        raise credentials_exception
+        # Get the user from the database
+        result = await db.execute(select(User).where(User.username == token_data.username))
+        db_user = result.scalars().first()
+        if db_user is None:
+            raise credentials_exception
+        user = CurrentUser(db_user)
+        user_cache.set(user.username, user)
     
     if not user.is_active:
         raise HTTPException(
@@ -82,7 +193,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     return user
 
 
-async def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
+async def get_current_active_user(current_user: CurrentUser = Depends(get_current_user)) -> CurrentUser:
     """Ensure the current user is active"""
     if not current_user.is_active:
         raise HTTPException(
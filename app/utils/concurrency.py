@@ -0,0 +1,49 @@
+# optimistic concurrency helpers - retry work that lost a version-column check
+import random
+import time
+from typing import Callable, Optional, TypeVar
+
+from fastapi import HTTPException, status
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
+
+from app.config import settings
+
+T = TypeVar("T")
+
+
+def run_with_retry(
+    db: Session,
+    operation: Callable[[], T],
+    attempts: Optional[int] = None,
+    backoff_seconds: Optional[float] = None
+) -> T:
+    """Run a read-modify-commit operation, retrying when a concurrent writer got there first
+
+    The operation must re-read whatever it checks, since the session is rolled back
+    (and its objects expired) before every retry. Waits grow exponentially with full
+    jitter so colliding writers spread out.
+
+    Args:
+        db: Session the operation uses
+        operation: Callable doing the reads, checks, writes and commit
+        attempts: Tries before giving up (CONCURRENCY_RETRY_ATTEMPTS by default)
+        backoff_seconds: Base wait (CONCURRENCY_RETRY_BACKOFF_SECONDS by default)
+
+    Returns:
+        Whatever operation returns
+    """
+    attempts = attempts or settings.CONCURRENCY_RETRY_ATTEMPTS
+    backoff_seconds = settings.CONCURRENCY_RETRY_BACKOFF_SECONDS if backoff_seconds is None else backoff_seconds
+    for attempt in range(attempts):
+        try:
+            return operation()
+        except StaleDataError:
+            db.rollback()
+            if attempt == attempts - 1:
+                break
+            time.sleep(random.uniform(0, backoff_seconds * 2 ** attempt))
+    raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="The record was modified concurrently, please retry"
+    )
@@ -1,8 +1,8 @@
 # Loan calculation utilities - EMI, interest, repayment schedule
-from typing import List
-from datetime import date, datetime, timedelta  
-from dateutil.relativedelta import relativedelta
-from app.models.payment import RepaymentSchedule
+from typing import List, NamedTuple, Optional, Sequence, Tuple, Union
+from datetime import date, datetime, timezone
+import numpy as np
+from app.models.payment import RepaymentSchedule, PaymentStatus
 
 
 def calculate_emi(principal: float, annual_interest_rate: float, loan_term_months: int) -> float:
@@ -33,13 +33,377 @@ def calculate_monthly_payment(principal: float, annual_interest_rate: float, loa
     return calculate_emi(principal, annual_interest_rate, loan_term_months)
 
 
+class AmortizationTable(NamedTuple):
+    """Columnar amortization result for one or many loans
+    
+    Every column is a flat numpy array with one entry per installment, ordered by
+    loan and then by installment number. ``loan_index`` points back at the position
+    of the loan in the inputs given to ``amortize_loans``.
+    """
+    loan_index: np.ndarray
+    installment_number: np.ndarray
+    due_date: np.ndarray  # datetime64[us], naive
+    amount_due: np.ndarray
+    principal_component: np.ndarray
+    interest_component: np.ndarray
+    balance: np.ndarray  # outstanding principal after the installment
+
+    def __len__(self) -> int:
+        return len(self.installment_number)
+
+
+def _as_array(value, dtype) -> np.ndarray:
+    return np.atleast_1d(np.asarray(value, dtype=dtype))
+
+
+def _add_months(start: np.ndarray, months: np.ndarray) -> np.ndarray:
+    """Vectorized ``start + relativedelta(months=k)`` for an (N,) start array and (M,) offsets
+    
+    The day of month is clamped to the length of the target month, exactly like
+    relativedelta, and the time of day of each start date is preserved.
+    """
+    start_day = start.astype("datetime64[D]")
+    time_of_day = start - start_day
+    start_month = start.astype("datetime64[M]")
+    day_offset = start_day - start_month.astype("datetime64[D]")
+    
+    target_month = start_month[:, None] + months[None, :]
+    month_length = (target_month + 1).astype("datetime64[D]") - target_month.astype("datetime64[D]")
+    day = np.minimum(day_offset[:, None], month_length - np.timedelta64(1, "D"))
+    
+    due = target_month.astype("datetime64[D]") + day
+    return due.astype("datetime64[us]") + time_of_day[:, None]
+
+
+def amortize_loans(
+    loan_amounts: Union[float, Sequence[float]],
+    interest_rates: Union[float, Sequence[float]],
+    term_months: Union[int, Sequence[int]],
+    start_dates: Union[None, date, Sequence[date]] = None
+) -> AmortizationTable:
+    """Amortize one or many loans in a single vectorized pass
+    
+    The schedules of N loans are laid out on an N x M grid (M = longest term) and
+    the opening balance of every installment comes from the closed form
+    
+        B(k) = P * (1 + r)^k - EMI * ((1 + r)^k - 1) / r
+    
+    so no per-installment Python loop is needed. Interest is charged on the opening
+    balance, the rest of the EMI goes to principal and the final installment absorbs
+    any residual balance, matching the original iterative schedule.
+    
+    Args:
+        loan_amounts: Principal amount(s)
+        interest_rates: Annual interest rate(s) (in percentage)
+        term_months: Loan duration(s) in months
+        start_dates: Start date(s) of the loans (default is now, UTC)
+    
+    Returns:
+        AmortizationTable with one row per installment of every loan
+    """
+    principal = _as_array(loan_amounts, np.float64)
+    rates = _as_array(interest_rates, np.float64)
+    terms = _as_array(term_months, np.int64)
+    principal, rates, terms = np.broadcast_arrays(principal, rates, terms)
+    
+    if start_dates is None or isinstance(start_dates, (date, datetime)):
+        start_dates = [start_dates or datetime.utcnow()] * len(principal)
+    starts = np.array(
+        # aware starts are converted to UTC first, naive ones are taken as UTC already
+        [s.astimezone(timezone.utc).replace(tzinfo=None) if isinstance(s, datetime) and s.tzinfo else s for s in start_dates],
+        dtype="datetime64[us]"
+    )
+    
+    monthly_rate = rates / 12 / 100
+    zero_rate = monthly_rate == 0
+    safe_rate = np.where(zero_rate, 1.0, monthly_rate)
+    
+    # EMI for every loan at once (same formula as calculate_emi)
+    growth_n = (1 + monthly_rate) ** terms
+    emi = np.where(
+        zero_rate,
+        principal / terms,
+        principal * monthly_rate * growth_n / np.where(zero_rate, 1.0, growth_n - 1)
+    )
+    
+    months = np.arange(1, int(terms.max()) + 1)
+    growth = (1 + monthly_rate[:, None]) ** (months - 1)[None, :]
+    opening_balance = np.where(
+        zero_rate[:, None],
+        principal[:, None] - emi[:, None] * (months - 1)[None, :],
+        principal[:, None] * growth - emi[:, None] * (growth - 1) / safe_rate[:, None]
+    )
+    interest_component = opening_balance * monthly_rate[:, None]
+    principal_component = emi[:, None] - interest_component
+    closing_balance = opening_balance - principal_component
+    
+    # Handle final payment rounding issues
+    rows = np.arange(len(terms))
+    last = terms - 1
+    principal_component[rows, last] += closing_balance[rows, last]
+    closing_balance[rows, last] = 0.0
+    
+    mask = months[None, :] <= terms[:, None]
+    due_dates = _add_months(starts, months)
+    
+    return AmortizationTable(
+        loan_index=np.broadcast_to(rows[:, None], mask.shape)[mask],
+        installment_number=np.broadcast_to(months[None, :], mask.shape)[mask],
+        due_date=due_dates[mask],
+        amount_due=np.round(np.broadcast_to(emi[:, None], mask.shape)[mask], 2),
+        principal_component=np.round(principal_component[mask], 2),
+        interest_component=np.round(interest_component[mask], 2),
+        balance=np.round(closing_balance[mask], 2)
+    )
+
+
+def summarize_schedule(table: AmortizationTable, loan_count: int) -> List[dict]:
+    """Per-loan totals of an AmortizationTable
+    
+    Args:
+        table: Result of amortize_loans
+        loan_count: Number of loans that were amortized
+    
+    Returns:
+        One dict per loan with monthly_payment, total_due and end_date (last due date)
+    """
+    counts = np.bincount(table.loan_index, minlength=loan_count)
+    last_rows = np.cumsum(counts) - 1
+    first_rows = last_rows - counts + 1
+    total_due = np.round(np.bincount(table.loan_index, weights=table.amount_due, minlength=loan_count), 2)
+    return [
+        {"monthly_payment": emi, "total_due": due, "end_date": end_date}
+        for emi, due, end_date in zip(
+            table.amount_due[first_rows].tolist(),
+            total_due.tolist(),
+            table.due_date[last_rows].tolist()
+        )
+    ]
+
+
+def schedule_to_models(table: AmortizationTable, loan_ids: Sequence[int]) -> List[RepaymentSchedule]:
+    """Turn an AmortizationTable into RepaymentSchedule objects
+    
+    Args:
+        table: Result of amortize_loans
+        loan_ids: Loan ID for each loan in the table, indexed by ``loan_index``
+    
+    Returns:
+        List of RepaymentSchedule objects
+    """
+    return [
+        RepaymentSchedule(
+            loan_id=loan_ids[index],
+            installment_number=number,
+            due_date=due_date,
+            amount_due=amount_due,
+            principal_component=principal_component,
+            interest_component=interest_component,
+            status=PaymentStatus.PENDING
+        )
+        for index, number, due_date, amount_due, principal_component, interest_component in zip(
+            table.loan_index.tolist(),
+            table.installment_number.tolist(),
+            table.due_date.tolist(),
+            table.amount_due.tolist(),
+            table.principal_component.tolist(),
+            table.interest_component.tolist()
+        )
+    ]
+
+
+def schedule_to_rows(table: AmortizationTable, loan_ids: Sequence[int]) -> List[dict]:
+    """Turn an AmortizationTable into plain dicts for a bulk INSERT into repayment_schedules
+    
+    Args:
+        table: Result of amortize_loans
+        loan_ids: Loan ID for each loan in the table, indexed by ``loan_index``
+    
+    Returns:
+        List of column -> value dicts, one per installment
+    """
+    return [
+        {
+            "loan_id": loan_ids[index],
+            "installment_number": number,
+            "due_date": due_date,
+            "amount_due": amount_due,
+            "principal_component": principal_component,
+            "interest_component": interest_component,
+            "status": PaymentStatus.PENDING,
+            "amount_paid": 0.0
+        }
+        for index, number, due_date, amount_due, principal_component, interest_component in zip(
+            table.loan_index.tolist(),
+            table.installment_number.tolist(),
+            table.due_date.tolist(),
+            table.amount_due.tolist(),
+            table.principal_component.tolist(),
+            table.interest_component.tolist()
+        )
+    ]
+
+
+# installments computed from the loan terms instead of stored (LAZY_REPAYMENT_SCHEDULES) are
+# addressed as -(loan_id * VIRTUAL_ID_STRIDE + installment_number); stored rows have positive ids
+VIRTUAL_ID_STRIDE = 10000
+
+
+def virtual_schedule_id(loan_id: int, installment_number: int) -> int:
+    """Schedule id of an installment that has no row"""
+    return -(loan_id * VIRTUAL_ID_STRIDE + installment_number)
+
+
+def split_virtual_schedule_id(schedule_id: int) -> Optional[Tuple[int, int]]:
+    """(loan_id, installment_number) of a virtual schedule id, None for the id of a stored row"""
+    if schedule_id >= 0:
+        return None
+    return divmod(-schedule_id, VIRTUAL_ID_STRIDE)
+
+
+# PaymentStatus of each installment of a CompactSchedule, stored as its position here
+STATUS_CODES = tuple(PaymentStatus)
+_STATUS_CODE = {payment_status: code for code, payment_status in enumerate(STATUS_CODES)}
+
+# fields of a schedule row, in RepaymentScheduleResponse order
+SCHEDULE_ROW_KEYS = (
+    "installment_number", "due_date", "amount_due", "principal_component", "interest_component",
+    "id", "loan_id", "status", "amount_paid", "payment_date", "created_at"
+)
+
+
+def _datetime64(values: Sequence[Optional[datetime]]) -> np.ndarray:
+    # naive datetime64[us] column; aware values are converted to UTC, None becomes NaT
+    return np.array(
+        [v.astimezone(timezone.utc).replace(tzinfo=None) if v is not None and v.tzinfo else v for v in values],
+        dtype="datetime64[us]"
+    )
+
+
+class CompactSchedule:
+    """One loan's installments as parallel arrays instead of a RepaymentSchedule per installment
+    
+    A RepaymentSchedule carries SQLAlchemy instance state and a __dict__ of boxed
+    values, a few KB per installment; here an installment is one entry in each of
+    a few typed numpy arrays. Services build schedules in this form and only turn
+    them into response dicts (to_rows) or ORM objects (to_models) at the edge.
+    
+    Dates are naive UTC datetime64[us] (NaT for no payment date); when the stored
+    rows were timezone aware they come back out as UTC, whatever their offset was.
+    """
+    __slots__ = (
+        "loan_id", "tzinfo", "schedule_id", "installment_number", "due_date", "amount_due",
+        "principal_component", "interest_component", "amount_paid", "status", "payment_date", "created_at"
+    )
+    ARRAYS = __slots__[2:]
+    
+    def __init__(self, loan_id: int, tzinfo=None, **arrays: np.ndarray):
+        self.loan_id = loan_id
+        self.tzinfo = tzinfo
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+    
+    def __len__(self) -> int:
+        return len(self.installment_number)
+    
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the arrays"""
+        return sum(getattr(self, name).nbytes for name in self.ARRAYS)
+    
+    @classmethod
+    def from_table(cls, table: AmortizationTable, loan_id: int, created_at: Optional[datetime] = None) -> "CompactSchedule":
+        """A single loan's amortize_loans result: virtual ids, PENDING and unpaid"""
+        count = len(table)
+        return cls(
+            loan_id,
+            schedule_id=-(loan_id * VIRTUAL_ID_STRIDE + table.installment_number.astype(np.int64)),
+            installment_number=table.installment_number.astype(np.int32),
+            due_date=table.due_date,
+            amount_due=table.amount_due,
+            principal_component=table.principal_component,
+            interest_component=table.interest_component,
+            amount_paid=np.zeros(count),
+            status=np.full(count, _STATUS_CODE[PaymentStatus.PENDING], dtype=np.uint8),
+            payment_date=np.full(count, np.datetime64("NaT", "us")),
+            created_at=np.repeat(_datetime64([created_at]), count)
+        )
+    
+    @classmethod
+    def from_rows(cls, loan_id: int, rows: Sequence[dict]) -> "CompactSchedule":
+        """Stored installments, as dicts with the SCHEDULE_ROW_KEYS, ordered by installment number"""
+        # _datetime64 converted aware values to UTC, so UTC is what goes back on
+        tzinfo = timezone.utc if rows and rows[0]["due_date"].tzinfo is not None else None
+        return cls(
+            loan_id, tzinfo,
+            schedule_id=np.array([row["id"] for row in rows], dtype=np.int64),
+            installment_number=np.array([row["installment_number"] for row in rows], dtype=np.int32),
+            due_date=_datetime64([row["due_date"] for row in rows]),
+            amount_due=np.array([row["amount_due"] for row in rows], dtype=np.float64),
+            principal_component=np.array([row["principal_component"] for row in rows], dtype=np.float64),
+            interest_component=np.array([row["interest_component"] for row in rows], dtype=np.float64),
+            amount_paid=np.array([row["amount_paid"] or 0.0 for row in rows], dtype=np.float64),
+            status=np.array([_STATUS_CODE[row["status"] or PaymentStatus.PENDING] for row in rows], dtype=np.uint8),
+            payment_date=_datetime64([row["payment_date"] for row in rows]),
+            created_at=_datetime64([row["created_at"] for row in rows])
+        )
+    
+    def take(self, mask: np.ndarray) -> "CompactSchedule":
+        """The installments selected by a boolean mask or index array"""
+        return CompactSchedule(self.loan_id, self.tzinfo, **{name: getattr(self, name)[mask] for name in self.ARRAYS})
+    
+    def window(self, first: int, last: int) -> "CompactSchedule":
+        """Installments first..last"""
+        return self.take((self.installment_number >= first) & (self.installment_number <= last))
+    
+    def overlay(self, rows: Sequence[dict]) -> "CompactSchedule":
+        """This schedule with the installments of rows (stored rows, see from_rows) replaced
+        
+        Rows for installments outside this schedule are ignored.
+        """
+        if not rows:
+            return self
+        stored = CompactSchedule.from_rows(self.loan_id, rows)
+        positions = np.searchsorted(self.installment_number, stored.installment_number)
+        found = positions < len(self)
+        found[found] = self.installment_number[positions[found]] == stored.installment_number[found]
+        merged = CompactSchedule(self.loan_id, stored.tzinfo, **{name: getattr(self, name).copy() for name in self.ARRAYS})
+        for name in self.ARRAYS:
+            getattr(merged, name)[positions[found]] = getattr(stored, name)[found]
+        return merged
+    
+    def column(self, key: str) -> list:
+        """One field of every installment as Python values (key from SCHEDULE_ROW_KEYS)"""
+        if key == "id":
+            return self.schedule_id.tolist()
+        if key == "loan_id":
+            return [self.loan_id] * len(self)
+        if key == "status":
+            return [STATUS_CODES[code] for code in self.status.tolist()]
+        values = getattr(self, key).tolist()
+        if self.tzinfo is not None and key in ("due_date", "payment_date", "created_at"):
+            values = [value.replace(tzinfo=self.tzinfo) if value is not None else None for value in values]
+        return values
+    
+    def to_rows(self, keys: Sequence[str] = SCHEDULE_ROW_KEYS) -> List[dict]:
+        """Response dicts, one per installment, with the given fields"""
+        return [dict(zip(keys, values)) for values in zip(*(self.column(key) for key in keys))]
+    
+    def to_models(self) -> List[RepaymentSchedule]:
+        """Transient RepaymentSchedule objects, one per installment"""
+        return [RepaymentSchedule(**row) for row in self.to_rows()]
+
+
 def generate_repayment_schedule(loan_amount: float, interest_rate: float, term_months: int, loan_id: int, start_date: date = None) -> List[RepaymentSchedule]:
     """Generate the repayment schedule for a loan
     
     Creates a list of RepaymentSchedule objects showing:
     - When each payment is due
     - How much is principal vs interest
-    - Outstanding balance after each payment
+    
+    Callers that do not need ORM objects should skip the per-row conversion: use
+    amortize_loans for quotes and bulk inserts, generate_compact_schedule to
+    work with one loan's installments in Python.
     
     Args:
         loan_amount: The principal loan amount
@@ -51,45 +415,32 @@ def generate_repayment_schedule(loan_amount: float, interest_rate: float, term_m
     Returns:
         List of RepaymentSchedule objects
     """
-    if start_date is None:
-        start_date = datetime.utcnow()
+    table = amortize_loans(loan_amount, interest_rate, term_months, start_date)
+    return schedule_to_models(table, [loan_id])
+
+
+def generate_compact_schedule(
+    loan_amount: float, interest_rate: float, term_months: int, loan_id: int,
+    start_date: date = None, created_at: Optional[datetime] = None
+) -> CompactSchedule:
+    """Generate the repayment schedule for a loan as a CompactSchedule
     
-    monthly_rate = interest_rate / 12 / 100  # Convert annual rate to monthly decimal
-    emi = calculate_emi(loan_amount, interest_rate, term_months)
-    schedule = []
-    remaining_balance = loan_amount
+    Same installments as generate_repayment_schedule, at a fraction of the memory;
+    they carry virtual schedule ids until stored.
     
-    for month in range(1, term_months + 1):
-        # Calculate interest for the month on the remaining balance
-        interest_component = remaining_balance * monthly_rate
-        
-        # Rest goes to reducing the principal
-        principal_component = emi - interest_component
-        
-        # Update remaining balance
-        remaining_balance -= principal_component
-        
-        # Handle final payment rounding issues
-        if month == term_months:
-            principal_component += remaining_balance
-            remaining_balance = 0.0
-        
-        # Calculate due date for this installment
-        due_date = start_date + relativedelta(months=month)
-        
-        # Create RepaymentSchedule object
-        repayment = RepaymentSchedule(
-            loan_id=loan_id,
-            installment_number=month,
-            due_date=due_date,
-            amount_due=round(emi, 2),
-            principal_component=round(principal_component, 2),
-            interest_component=round(interest_component, 2),
-            status="PENDING"
-        )
-        schedule.append(repayment)
+    Args:
+        loan_amount: The principal loan amount
+        interest_rate: The annual interest rate (in percentage)
+        term_months: Loan duration in months
+        loan_id: The ID of the loan
+        start_date: The start date of the loan (default is today)
+        created_at: Creation time reported for the installments
     
-    return schedule
+    Returns:
+        CompactSchedule with one entry per installment
+    """
+    table = amortize_loans(loan_amount, interest_rate, term_months, start_date)
+    return CompactSchedule.from_table(table, loan_id, created_at)
 
 
 def calculate_total_interest(principal: float, annual_interest_rate: float, loan_term_months: int) -> float:
@@ -0,0 +1,70 @@
+# keyset (cursor) pagination helpers
+# cursors are opaque url-safe tokens holding the sort key of the last row on a page
+import base64
+import json
+from datetime import datetime
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import String, Select, and_, literal, or_
+
+
+def encode_cursor(*values: Any) -> str:
+    """Encode the sort key of the last row into an opaque cursor"""
+    payload = [{"dt": v.isoformat()} if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> Tuple[Any, ...]:
+    """Decode a cursor produced by encode_cursor, raising 400 if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        if not isinstance(payload, list) or len(payload) != size:
+            raise ValueError("wrong cursor size")
+        return tuple(
+            datetime.fromisoformat(v["dt"]) if isinstance(v, dict) else v
+            for v in payload
+        )
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid pagination cursor"
+        )
+
+
+def bind_value(value: Any, dialect_name: str):
+    # SQLite keeps server-default timestamps as "YYYY-MM-DD HH:MM:SS" text while
+    # Python datetimes are bound with microseconds, so compare in the stored text form
+    if dialect_name == "sqlite" and isinstance(value, datetime):
+        fmt = "%Y-%m-%d %H:%M:%S.%f" if value.microsecond else "%Y-%m-%d %H:%M:%S"
+        return literal(value.replace(tzinfo=None).strftime(fmt), String)
+    return value
+
+
+def apply_keyset(stmt: Select, columns: Sequence, cursor: Optional[str], limit: int, dialect_name: str) -> Select:
+    """Order a select by the key columns and start it after the cursor position
+    
+    One extra row is fetched so page_from_rows can tell whether another page exists.
+    The seek predicate is written as nested OR/AND (not a row-value comparison) so
+    every backend can use a composite index on the key columns.
+    """
+    if cursor:
+        values = [bind_value(v, dialect_name) for v in decode_cursor(cursor, len(columns))]
+        clauses = []
+        for i, column in enumerate(columns):
+            equal_prefix = [columns[j] == values[j] for j in range(i)]
+            clauses.append(and_(*equal_prefix, column > values[i]))
+        stmt = stmt.where(or_(*clauses))
+    return stmt.order_by(*columns).limit(limit + 1)
+
+
+def page_from_rows(rows: List[Any], limit: int, key: Callable[[Any], Tuple[Any, ...]]) -> Tuple[List[Any], Optional[str]]:
+    """Trim the look-ahead row and build the cursor for the next page"""
+    if limit <= 0:
+        return [], None
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(*key(rows[-1]))
@@ -0,0 +1,60 @@
+# SQL statement counting - catches N+1 query patterns per request or per block of code
+from contextvars import ContextVar
+from typing import Optional
+
+from fastapi import Depends, Request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# counter of the request / block currently running; None outside any counted scope
+_current_counter: ContextVar[Optional["QueryCounter"]] = ContextVar("query_counter", default=None)
+
+
+class QueryCounter:
+    """Counts the SQL statements executed inside a ``with`` block
+    
+    Works across sync sessions, async sessions and threadpool routes, since it
+    follows the context (contextvars) the statements run in rather than a
+    particular connection. Nested counters each see the statements of their block.
+    """
+    
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+        self._parent = None
+        self._token = None
+    
+    def __enter__(self) -> "QueryCounter":
+        self._parent = _current_counter.get()
+        self._token = _current_counter.set(self)
+        return self
+    
+    def __exit__(self, *exc_info):
+        _current_counter.reset(self._token)
+    
+    def record(self, statement: str):
+        counter = self
+        while counter is not None:
+            counter.count += 1
+            counter.statements.append(statement)
+            counter = counter._parent
+
+
+def instrument_query_counting(engine: Engine):
+    """Feed every statement the engine executes to the active QueryCounter, if any"""
+    
+    @event.listens_for(engine, "before_cursor_execute")
+    def on_execute(connection, cursor, statement, parameters, context, executemany):
+        counter = _current_counter.get()
+        if counter is not None:
+            counter.record(statement)
+
+
+def query_budget(max_queries: int):
+    """Route dependency declaring how many SQL statements one request may issue
+    
+    Checked by the query budget middleware (settings.QUERY_BUDGET_CHECK).
+    """
+    def declare_budget(request: Request):
+        request.state.query_budget = max_queries
+    return Depends(declare_budget)
@@ -0,0 +1,44 @@
+# row serializers - encode Core result rows straight to JSON bytes for a response schema
+# skips building and validating a pydantic model per row on hot list endpoints
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple, Type
+
+import orjson
+from pydantic import BaseModel
+
+# same text pydantic produces: enums as values, ISO datetimes, UTC as "Z"
+ORJSON_OPTIONS = orjson.OPT_UTC_Z
+
+
+class RowSerializer:
+    """JSON encoder for rows selected with the columns of one response schema
+    
+    Built once per schema: the field order and the column behind each field are
+    resolved up front, so select(*serializer.columns) returns tuples whose
+    positions line up with serializer.keys and encoding is a zip plus one
+    orjson call. Rows come from the database and are trusted, so no field is
+    validated; the output is the same JSON the schema would produce.
+    """
+    
+    def __init__(self, schema: Type[BaseModel], model, column_overrides: Optional[Dict[str, Any]] = None):
+        column_overrides = column_overrides or {}
+        self.schema = schema
+        self.keys: Tuple[str, ...] = tuple(schema.model_fields)
+        # each column labelled with its field name, so rows also work by attribute (row.created_at)
+        self.columns = []
+        for name in self.keys:
+            column = column_overrides.get(name, getattr(model, name, None))
+            if column is None:
+                raise ValueError(f"{schema.__name__}.{name} has no column on {model.__name__}")
+            self.columns.append(column.label(name))
+    
+    def to_dicts(self, rows: Iterable[Sequence]) -> list:
+        keys = self.keys
+        return [dict(zip(keys, row)) for row in rows]
+    
+    def dumps(self, rows: Iterable[Sequence]) -> bytes:
+        """Encode rows as a JSON array"""
+        return orjson.dumps(self.to_dicts(rows), option=ORJSON_OPTIONS)
+    
+    def dumps_page(self, rows: Iterable[Sequence], next_cursor: Optional[str]) -> bytes:
+        """Encode rows as a keyset page: {"items": [...], "next_cursor": ...}"""
+        return orjson.dumps({"items": self.to_dicts(rows), "next_cursor": next_cursor}, option=ORJSON_OPTIONS)
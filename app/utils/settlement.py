@@ -0,0 +1,76 @@
+# settlement file parsing - turns bank settlement lines (CSV or JSON lines) into payment records
+import csv
+import itertools
+import json
+from typing import Iterable, Iterator, List
+
+SETTLEMENT_FORMATS = ("csv", "jsonl")
+SETTLEMENT_FIELDS = ("schedule_id", "amount", "payment_method", "transaction_reference")
+# matches PaymentCreate.transaction_reference
+MAX_REFERENCE_LENGTH = 100
+
+
+def parse_settlement_lines(lines: Iterable[str], file_format: str) -> Iterator[dict]:
+    """Parse settlement lines one at a time
+
+    CSV input needs a header row naming the SETTLEMENT_FIELDS; JSON lines input has
+    one object per line. Blank lines are skipped.
+
+    Args:
+        lines: Any iterable of text lines (an open file, a list, a stream)
+        file_format: "csv" or "jsonl"
+
+    Returns:
+        An iterator of records with the line number and the parsed fields, or the
+        line number and an "error" message when the line is malformed
+    """
+    if file_format == "csv":
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield _to_record(reader.line_num, row)
+    elif file_format == "jsonl":
+        for line_number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield {"line": line_number, "error": "Line is not valid JSON"}
+                continue
+            if not isinstance(row, dict):
+                yield {"line": line_number, "error": "Line is not a JSON object"}
+                continue
+            yield _to_record(line_number, row)
+    else:
+        raise ValueError(f"Unsupported settlement format: {file_format}")
+
+
+def chunked(records: Iterable[dict], size: int) -> Iterator[List[dict]]:
+    """Group an iterator into lists of at most size items without reading ahead further"""
+    iterator = iter(records)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def _to_record(line_number: int, row: dict) -> dict:
+    missing = [field for field in SETTLEMENT_FIELDS if row.get(field) in (None, "")]
+    if missing:
+        return {"line": line_number, "error": f"Missing fields: {', '.join(missing)}"}
+
+    try:
+        schedule_id = int(row["schedule_id"])
+        amount = float(row["amount"])
+    except (TypeError, ValueError):
+        return {"line": line_number, "error": "schedule_id must be an integer and amount a number"}
+
+    reference = str(row["transaction_reference"]).strip()
+    if len(reference) > MAX_REFERENCE_LENGTH:
+        return {"line": line_number, "error": f"transaction_reference is longer than {MAX_REFERENCE_LENGTH} characters"}
+
+    return {
+        "line": line_number,
+        "schedule_id": schedule_id,
+        "amount": amount,
+        "payment_method": str(row["payment_method"]),
+        "transaction_reference": reference
+    }
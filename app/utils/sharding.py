@@ -0,0 +1,104 @@
+# sharding helpers - the borrower -> bucket -> shard map and merging of per-shard results
+# pure logic; engines, sessions and the directory tables are wired up in app.database
+import heapq
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+class ShardMap:
+    """Bucketed map from borrower id to shard
+    
+    A borrower's bucket is borrower_id % buckets and never changes, so everything a
+    borrower owns (applications, loans, schedules, payments) sits on one shard and
+    rebalancing moves whole buckets. Buckets flagged as moving are being copied
+    between shards and must not be read or written until the move finishes.
+    """
+    
+    def __init__(self, buckets: int, assignments: Dict[int, str], moving: Iterable[int] = ()):
+        self.buckets = buckets
+        self.assignments = dict(assignments)
+        self.moving = set(moving)
+    
+    @classmethod
+    def initial(cls, shard_ids: Sequence[str], buckets: int) -> "ShardMap":
+        """Spread the buckets round-robin over the shards"""
+        return cls(buckets, {bucket: shard_ids[bucket % len(shard_ids)] for bucket in range(buckets)})
+    
+    def bucket_for(self, borrower_id: int) -> int:
+        return int(borrower_id) % self.buckets
+    
+    def shard_for(self, borrower_id: int) -> str:
+        return self.assignments[self.bucket_for(borrower_id)]
+    
+    def is_moving(self, borrower_id: int) -> bool:
+        return self.bucket_for(borrower_id) in self.moving
+    
+    def buckets_by_shard(self) -> Dict[str, List[int]]:
+        by_shard = defaultdict(list)
+        for bucket, shard_id in sorted(self.assignments.items()):
+            by_shard[shard_id].append(bucket)
+        return dict(by_shard)
+    
+    def plan_rebalance(self, shard_ids: Sequence[str]) -> List[Tuple[int, str, str]]:
+        """Bucket moves that leave every shard in shard_ids with an even share
+        
+        Shards missing from shard_ids are drained completely. Only as many buckets
+        as necessary move, taken from the end of the fullest shards.
+        
+        Returns:
+            (bucket, from_shard, to_shard) tuples
+        """
+        base, extra = divmod(self.buckets, len(shard_ids))
+        targets = {shard_id: base + (index < extra) for index, shard_id in enumerate(shard_ids)}
+        by_shard = self.buckets_by_shard()
+        # buckets to give away: everything on drained shards, the surplus of overfull ones
+        surplus = []
+        for shard_id, buckets in by_shard.items():
+            keep = targets.get(shard_id, 0)
+            surplus.extend((bucket, shard_id) for bucket in buckets[keep:])
+        moves = []
+        for shard_id in shard_ids:
+            missing = targets[shard_id] - len(by_shard.get(shard_id, []))
+            while missing > 0 and surplus:
+                bucket, source = surplus.pop()
+                moves.append((bucket, source, shard_id))
+                missing -= 1
+        return sorted(moves)
+
+
+def merge_sorted(results: Iterable[Sequence[Any]], key: Callable[[Any], Any], limit: Optional[int] = None) -> List[Any]:
+    """Merge per-shard results that are each sorted by key into one sorted list"""
+    merged = heapq.merge(*results, key=key)
+    if limit is None:
+        return list(merged)
+    return [row for _, row in zip(range(limit), merged)]
+
+
+class IdBlockAllocator:
+    """Hands out ids of sharded tables from blocks reserved in the directory
+    
+    reserve(table_name, size) must atomically advance the table's counter and return
+    the first id of the reserved block; the allocator then serves ids from memory
+    until the block runs out, so the directory sees one round trip per block.
+    """
+    
+    def __init__(self, reserve: Callable[[str, int], int], block_size: int):
+        self._reserve = reserve
+        self.block_size = block_size
+        self._blocks = {}  # table name -> [next id, end of block)
+        self._lock = threading.Lock()
+    
+    def next_ids(self, table_name: str, count: int) -> List[int]:
+        ids = []
+        with self._lock:
+            while len(ids) < count:
+                next_id, end = self._blocks.get(table_name, (0, 0))
+                if next_id >= end:
+                    size = max(self.block_size, count - len(ids))
+                    next_id = self._reserve(table_name, size)
+                    end = next_id + size
+                take = min(end - next_id, count - len(ids))
+                ids.extend(range(next_id, next_id + take))
+                self._blocks[table_name] = (next_id + take, end)
+        return ids
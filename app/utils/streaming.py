@@ -0,0 +1,46 @@
+# streamed JSON responses - rows go from a database cursor to the client in chunks
+# so time-to-first-byte and memory do not depend on how many rows a listing returns
+from typing import AsyncIterator, Optional
+
+import orjson
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.utils.serializers import ORJSON_OPTIONS
+
+STREAM_FORMATS = ("ndjson", "json")
+STREAM_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "json": "application/json"}
+
+
+async def iter_json_chunks(
+    db: AsyncSession, stmt: Select, stream_format: str, batch_size: Optional[int] = None
+) -> AsyncIterator[bytes]:
+    """Run a column select on a server-side cursor and serialize it batch by batch
+    
+    Each row becomes one object keyed by the selected column labels, encoded with
+    orjson without building response models. "ndjson" emits one object per line,
+    "json" a single array whose elements are sent as they are read.
+    """
+    if stream_format not in STREAM_FORMATS:
+        raise ValueError(f"Unsupported stream format: {stream_format}")
+    result = await db.stream(stmt, execution_options={"yield_per": batch_size or settings.STREAM_BATCH_SIZE})
+    keys = tuple(result.keys())
+    first = True
+    if stream_format == "json":
+        yield b"["
+    async for rows in result.partitions():
+        encoded = [orjson.dumps(dict(zip(keys, row)), option=ORJSON_OPTIONS) for row in rows]
+        if stream_format == "ndjson":
+            yield b"\n".join(encoded) + b"\n"
+        else:
+            yield (b"" if first else b",") + b",".join(encoded)
+        first = False
+    if stream_format == "json":
+        yield b"]"
+
+
+def streaming_json_response(chunks: AsyncIterator[bytes], stream_format: str) -> StreamingResponse:
+    """Wrap iter_json_chunks output in a response with the matching media type"""
+    return StreamingResponse(chunks, media_type=STREAM_MEDIA_TYPES[stream_format])